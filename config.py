@@ -1,6 +1,7 @@
 # config.py
 import os
 from dotenv import load_dotenv
+from logger import logger
 
 # Load environment variables from .env file at the start
 load_dotenv()
@@ -20,6 +21,108 @@ ELEVENLABS_OUTPUT_FORMAT = os.getenv("ELEVENLABS_OUTPUT_FORMAT")
 
 # Convert string 'true'/'false' to boolean; default to False if not set.
 DEBUG = os.getenv("DEBUG", "false").lower() in ("true", "1", "t")
+
+# Embedding model and output size for new indexes. Existing Chroma indexes
+# record their own model in index_versions.json (see utils/index_versions.py).
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "1536"))
+
+# HNSW index of new Chroma collections (see utils/chroma_tune.py to pick values).
+# Space (l2, cosine or ip), M and construction_ef are fixed when a collection is
+# created; search_ef is applied whenever a collection is opened. The defaults are
+# what Chroma picks for collections with an OpenAI embedding function.
+CHROMA_HNSW_SPACE = os.getenv("CHROMA_HNSW_SPACE", "cosine")
+CHROMA_HNSW_M = int(os.getenv("CHROMA_HNSW_M", "16"))
+CHROMA_HNSW_CONSTRUCTION_EF = int(os.getenv("CHROMA_HNSW_CONSTRUCTION_EF", "100"))
+CHROMA_HNSW_SEARCH_EF = int(os.getenv("CHROMA_HNSW_SEARCH_EF", "100"))
+
+# Persistent embedding cache shared by every embedder (see utils/embedding_cache.py)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("true", "1", "t")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "2048"))
+
+# OpenAI quotas shared by every process on this host (see utils/rate_limiter.py)
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "rate_limits.sqlite3")
+OPENAI_EMBEDDING_RPM = int(os.getenv("OPENAI_EMBEDDING_RPM", "3000"))
+OPENAI_EMBEDDING_TPM = int(os.getenv("OPENAI_EMBEDDING_TPM", "1000000"))
+OPENAI_CHAT_RPM = int(os.getenv("OPENAI_CHAT_RPM", "500"))
+OPENAI_CHAT_TPM = int(os.getenv("OPENAI_CHAT_TPM", "30000"))
+# OpenAI limits each model separately, so each model gets its own bucket. These
+# override the defaults above per model: "gpt-4o-mini=500:200000,gpt-4o=500:30000"
+# (model=rpm:tpm).
+def parse_model_limits(value):
+    """
+    Parse OPENAI_MODEL_LIMITS into {model: (rpm, tpm)}. A malformed entry is
+    logged and skipped, so that model keeps the defaults.
+    """
+    limits = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        try:
+            model, rpm_tpm = item.split("=")
+            rpm, tpm = (int(number) for number in rpm_tpm.split(":"))
+        except ValueError:
+            logger.error(f"Ignoring malformed OPENAI_MODEL_LIMITS entry '{item.strip()}'; expected model=rpm:tpm.")
+            continue
+        limits[model.strip()] = (rpm, tpm)
+    return limits
+
+
+OPENAI_MODEL_LIMITS = parse_model_limits(os.getenv("OPENAI_MODEL_LIMITS", ""))
+
+# TestRail API access for pulling test cases directly (see utils/testrail_api.py)
+TESTRAIL_URL = os.getenv("TESTRAIL_URL")
+TESTRAIL_USERNAME = os.getenv("TESTRAIL_USERNAME")
+TESTRAIL_API_KEY = os.getenv("TESTRAIL_API_KEY")
+TESTRAIL_STATE_PATH = os.getenv("TESTRAIL_STATE_PATH", "testrail_pull_state.json")
+
+# FAISS index layout for new indexes: flat, ivf_flat, ivf_pq or hnsw (see utils/vector_db_faiss.py).
+# An existing index file keeps the layout it was built with.
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "1024"))
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "64"))
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+# Search-time accuracy/speed knobs; both can also be changed at runtime
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+# Similarity for new FAISS indexes: l2, or ip (cosine on normalized vectors, as OpenAI returns)
+FAISS_METRIC = os.getenv("FAISS_METRIC", "l2")
+# Vector storage for new flat/IVF/HNSW indexes: float32, fp16 or int8 (scalar quantization)
+FAISS_STORAGE = os.getenv("FAISS_STORAGE", "float32")
+# Re-rank this many times top_k candidates against full float32 vectors kept on disk (0 = off).
+# Only applies to lossy indexes (fp16/int8 storage or IVF-PQ).
+FAISS_RERANK = int(os.getenv("FAISS_RERANK", "0"))
+# zlib-compress long records in the FAISS metadata store (see utils/blob_store.py)
+FAISS_METADATA_COMPRESS = os.getenv("FAISS_METADATA_COMPRESS", "true").lower() in ("true", "1", "t")
+# Named FAISS indexes kept in memory at once by utils/vector_store.py, by count and approximate size
+FAISS_STORE_MAX_RESIDENT = int(os.getenv("FAISS_STORE_MAX_RESIDENT", "8"))
+FAISS_STORE_MEMORY_MB = int(os.getenv("FAISS_STORE_MEMORY_MB", "4096"))
+# Compact a FAISS index once this fraction of its rows are deleted or replaced;
+# the background compactor checks every FAISS_COMPACT_INTERVAL seconds
+FAISS_COMPACT_RATIO = float(os.getenv("FAISS_COMPACT_RATIO", "0.2"))
+FAISS_COMPACT_INTERVAL = int(os.getenv("FAISS_COMPACT_INTERVAL", "300"))
+# Directory of the FAISS index snapshots and their write-ahead log; a checkpoint
+# fsyncs the log, and the log is merged into a new snapshot once it passes FAISS_WAL_MAX_MB
+FAISS_DATA_DIR = os.getenv("FAISS_DATA_DIR", "faiss_data")
+FAISS_WAL_MAX_MB = int(os.getenv("FAISS_WAL_MAX_MB", "256"))
+# Integer metadata fields kept per FAISS row so searches can be filtered on them
+FAISS_FILTER_FIELDS = [field.strip() for field in os.getenv("FAISS_FILTER_FIELDS", "priority_id,section_id").split(",")
+                       if field.strip()]
+# Filters selecting at most this many rows scan them exhaustively instead of
+# walking the HNSW graph or a few IVF lists, which might hold too few of them
+FAISS_FILTER_EXACT_ROWS = int(os.getenv("FAISS_FILTER_EXACT_ROWS", "20000"))
+# Two-stage retrieval: a new FAISS index keeps only the first FAISS_COARSE_DIMENSION
+# dimensions of each embedding in memory (text-embedding-3 vectors stay meaningful when
+# shortened), and the top FAISS_COARSE_CANDIDATES coarse hits are re-ranked against the
+# full vectors on disk. 0 = index full vectors.
+FAISS_COARSE_DIMENSION = int(os.getenv("FAISS_COARSE_DIMENSION", "0"))
+FAISS_COARSE_CANDIDATES = int(os.getenv("FAISS_COARSE_CANDIDATES", "200"))
+# Shards of a sharded FAISS index (utils/sharded_index.py) and the worker processes
+# building them / threads searching them
+FAISS_SHARDS = int(os.getenv("FAISS_SHARDS", "4"))
+FAISS_SHARD_WORKERS = int(os.getenv("FAISS_SHARD_WORKERS", str(os.cpu_count() or 4)))
+
 class Config:
     # General configuration variables
     DEBUG_MODE = os.getenv('DEBUG_MODE', 'false').lower() == 'true'
@@ -6,16 +6,16 @@ from modules.user_story_processor import process_user_story
 from modules.rag_engine_faiss import generate_test_cases
 from modules.test_case_formatter import format_test_cases
 from modules.ado_integration import get_user_story_from_ado
-from utils.vector_db import initialize_faiss_index
+from utils.vector_db_faiss import initialize_faiss_index
+from config import EMBEDDING_DIMENSION
 from modules.test_case_exporter import parse_test_cases, save_test_cases_to_csv
 
 # Load environment variables
 load_dotenv()
 
 def main():
-    # Initialize FAISS index with the appropriate embedding dimension
-    # (e.g., 1536 if using a model that outputs 1536-dim embeddings)
-    initialize_faiss_index(dimension=1536)
+    # Map the FAISS index read-only; this process only searches it
+    initialize_faiss_index(dimension=EMBEDDING_DIMENSION, read_only=True)
 
     # Prompt user for the work item ID
     story_id = input("User story ID: ").strip()
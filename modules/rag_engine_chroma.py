@@ -2,37 +2,37 @@ import re
 import os
 import numpy as np
 
-import chromadb
-import chromadb.utils.embedding_functions as embedding_functions
 from dotenv import load_dotenv
 from config import DEBUG  # Import the global DEBUG flag from your config
+from utils.chroma_store import get_active_collection, warm_up_in_background
+from utils.chunking import PARENT_OVERFETCH, aggregate_by_parent
+from utils.embeddings import estimate_tokens
+from utils.rate_limiter import get_rate_limiter, call_with_rate_limit, CHAT_RESPONSE_TOKEN_ESTIMATE
 
 # Load environment variables (e.g., OPENAI_API_KEY)
 load_dotenv()
 
-if DEBUG:
-    print("[rag_engine_chroma] Initializing PersistentClient for ChromaDB...")
-
 # IMPORTANT: Use the absolute path to your 143MB Chroma DB
 CHROMA_PATH = "path/chroma_db" #put in the local of your chromadb once created
 
-# Create a Persistent Client that points to your existing DB
-client = chromadb.PersistentClient(path=CHROMA_PATH)
+openai_api_key = os.getenv("OPENAI_API_KEY")
 
-if DEBUG:
-    print("[rag_engine_chroma] Setting up OpenAIEmbeddingFunction and retrieving collection...")
 
-openai_api_key = os.getenv("OPENAI_API_KEY")
-embedding_func = embedding_functions.OpenAIEmbeddingFunction(
-    api_key=openai_api_key,
-    model_name="text-embedding-3-small"
-)
+def active_collection():
+    """
+    The process-wide reader of the active index version. The Chroma client
+    is opened on first use, not at import, so importing this module is cheap.
+    It follows the active index version, so a model migration swaps in
+    without a restart, and embeds through utils.embeddings, so repeated
+    stories hit the shared embedding cache.
+    """
+    return get_active_collection(CHROMA_PATH, openai_api_key)
+
+
+def warm_up():
+    """Open the Chroma store on a background thread, so the first query does not wait for it."""
+    return warm_up_in_background(CHROMA_PATH, openai_api_key)
 
-collection = client.get_or_create_collection(
-    name="testrail_test_cases",
-    embedding_function=embedding_func,
-    metadata={"description": "TestRail test cases stored with Chroma"}
-)
 
 # Optional set of stop words to remove from user story
 STOP_WORDS = {
@@ -47,32 +47,67 @@ def remove_stop_words(text: str) -> str:
     return " ".join(filtered_tokens)
 
 
-def search_similar_chroma(story_embedding, top_k=5):
+def search_similar_chroma_batch(story_embeddings, top_k=5, collection=None):
     """
-    Queries the Chroma collection with the provided embedding, returning
-    the top_k most similar documents.
+    Queries the Chroma collection (the active index version unless one is
+    given) with several embeddings in a single call, e.g. every story of a
+    sprint or every chunk of a long story. Chroma searches the whole query
+    matrix at once instead of one round trip per embedding.
+
+    Returns:
+        list: One list per query of up to top_k test cases, nearest first.
+              Each is a dict with "id" (the parent test case id),
+              "document" (its matched chunks), "distance" and "chunk_ids".
     """
+    if len(story_embeddings) == 0:
+        return []
+
     if DEBUG:
-        print(f"[rag_engine_chroma] Querying Chroma for top {top_k} similar documents...")
+        print(f"[rag_engine_chroma] Querying Chroma with {len(story_embeddings)} embeddings for top {top_k} similar test cases each...")
+
+    if collection is None:
+        collection = active_collection().get()[0]
 
     results = collection.query(
-        query_embeddings=[story_embedding],
-        n_results=top_k,
-        include=["documents"]
+        query_embeddings=list(story_embeddings),
+        n_results=top_k * PARENT_OVERFETCH,
+        include=["documents", "metadatas", "distances"]
     )
+    if not results or not results.get("documents"):
+        return [[] for _ in story_embeddings]
+
+    # Each field holds one list of chunk hits per query embedding
+    batches = []
+    for ids, documents, metadatas, distances in zip(results["ids"], results["documents"],
+                                                    results["metadatas"], results["distances"]):
+        parents = aggregate_by_parent(ids, documents, metadatas, distances, top_k)
+        batches.append([
+            {"id": parent["parent_id"], "document": parent["document"],
+             "distance": parent["distance"], "chunk_ids": parent["chunk_ids"]}
+            for parent in parents
+        ])
+    return batches
+
+
+def search_similar_chroma(story_embedding, top_k=5, collection=None):
+    """
+    Queries the Chroma collection (the active index version unless one is
+    given) with the provided embedding, returning
+    the top_k most similar test cases. Test cases are indexed as several
+    chunks, so more chunks than needed are fetched and collapsed to distinct
+    parent test cases; each returned document holds the matched chunks of
+    one test case.
+    """
+    hits = search_similar_chroma_batch([story_embedding], top_k, collection)[0]
+    similar_docs = [hit["document"] for hit in hits]
 
-    # Check if any documents returned
-    if not results or "documents" not in results or len(results["documents"]) == 0:
-        if DEBUG:
+    if DEBUG:
+        if not similar_docs:
             print("[rag_engine_chroma] No similar documents found.")
-        return []
-
-    # For a single query embedding, results["documents"][0] is the list of top_k docs
-    similar_docs = results["documents"][0]
-
-    if DEBUG and similar_docs:
-        sample_preview = similar_docs[0][:200]
-        print(f"[rag_engine_chroma] Found similar documents. First doc preview:\n{sample_preview}...")
+        else:
+            print(f"[rag_engine_chroma] Collapsed chunk hits into {len(similar_docs)} test cases.")
+            sample_preview = similar_docs[0][:200]
+            print(f"[rag_engine_chroma] Found similar documents. First doc preview:\n{sample_preview}...")
 
     return similar_docs
 
@@ -87,6 +122,11 @@ def generate_test_cases_chroma(processed_story: str):
         if DEBUG:
             print("[rag_engine_chroma] Starting test case generation with Chroma RAG...")
 
+        # Embed and search with the same version, even if a swap lands mid-request
+        collection, embedding_func, version = active_collection().get()
+        if DEBUG:
+            print(f"[rag_engine_chroma] Using index version {version['name']}.")
+
         cleaned_story = remove_stop_words(processed_story)
         if DEBUG:
             print(f"[rag_engine_chroma] Cleaned user story (preview): {cleaned_story[:100]}...")
@@ -116,7 +156,7 @@ def generate_test_cases_chroma(processed_story: str):
             story_embedding = embedding_result
 
         # 2) Query Chroma for similar test cases
-        similar_contexts = search_similar_chroma(story_embedding, top_k=5)
+        similar_contexts = search_similar_chroma(story_embedding, top_k=5, collection=collection)
         if not similar_contexts:
             if DEBUG:
                 print("[rag_engine_chroma] No similar contexts returned from Chroma.")
@@ -172,12 +212,17 @@ Generate Test Cases:
         # 4) Call OpenAI
         try:
             from openai import OpenAI
-            client_openai = OpenAI(api_key=openai_api_key)
+            client_openai = OpenAI(api_key=openai_api_key, max_retries=0)
             GPT_MODEL = 'gpt-4o'  # or whichever model you prefer
 
-            response = client_openai.chat.completions.create(
-                model=GPT_MODEL,
-                messages=[{"role": "user", "content": structured_prompt}]
+            # Paced by the rate limiter shared with every other OpenAI caller
+            response = call_with_rate_limit(
+                get_rate_limiter("chat", GPT_MODEL),
+                lambda: client_openai.chat.completions.create(
+                    model=GPT_MODEL,
+                    messages=[{"role": "user", "content": structured_prompt}]
+                ),
+                estimate_tokens(structured_prompt) + CHAT_RESPONSE_TOKEN_ESTIMATE
             )
             generated_content = response.choices[0].message.content
 
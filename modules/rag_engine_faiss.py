@@ -1,21 +1,28 @@
 # modules/rag_engine_faiss.py
 import os
 from logger import logger
-from utils.vector_db_faiss import search_similar
-from utils.embeddings import generate_embedding
+from utils.vector_db_faiss import search_similar_batch, document_text
+from utils.chunking import PARENT_OVERFETCH, aggregate_by_parent
+from utils.embeddings import generate_embedding, estimate_tokens
+from utils.rate_limiter import get_rate_limiter, call_with_rate_limit, CHAT_RESPONSE_TOKEN_ESTIMATE
 from openai import OpenAI
 from helper import get_openai_api_key
 
-def generate_test_cases(processed_story):
+def generate_test_cases(processed_story, filters=None):
     """
     Generate synthetic test cases for the given processed story using a
     Retrieval-Augmented Generation approach, incorporating similar past
     test cases retrieved from the FAISS index.
+
+    Args:
+        processed_story (str): The user story to generate test cases for.
+        filters (dict): Optional filter fields to restrict retrieval to, e.g.
+                        {"section_id": 12} for one product area.
     """
     try:
         # Retrieve API key and initialize OpenAI client
         openai_api_key = get_openai_api_key()
-        client = OpenAI(api_key=openai_api_key)
+        client = OpenAI(api_key=openai_api_key, max_retries=0)
 
         # Define the model to be used (adjust if necessary)
         GPT_MODEL = 'gpt-4o'  # Change this if needed
@@ -23,8 +30,17 @@ def generate_test_cases(processed_story):
         # Generate an embedding for the processed user story
         story_embedding = generate_embedding(processed_story)
 
-        # Retrieve similar test cases from FAISS
-        similar_contexts = search_similar(story_embedding, top_k=5)
+        # Retrieve similar test cases from FAISS. Rows migrated from Chroma are chunks
+        # of test cases, so fetch extra and collapse them to distinct parents.
+        hits = search_similar_batch([story_embedding], top_k=5 * PARENT_OVERFETCH, filters=filters)[0]
+        parents = aggregate_by_parent(
+            [hit["id"] for hit in hits],
+            [document_text(hit["document"]) for hit in hits],
+            [hit["document"] if isinstance(hit["document"], dict) else None for hit in hits],
+            [hit["distance"] for hit in hits],
+            top_k=5,
+        )
+        similar_contexts = [parent["document"] for parent in parents]
 
         # Combine retrieved contexts into a single string for the prompt
         context_text = "\n".join(similar_contexts) if similar_contexts else ""
@@ -51,13 +67,17 @@ User Story:
 Generate Test Cases:
 """
 
-        # Create the API request using the constructed prompt
-        response = client.chat.completions.create(
-            model=GPT_MODEL,
-            messages=[{
-                "role": "user",
-                "content": structured_prompt
-            }]
+        # Create the API request using the constructed prompt, paced by the shared rate limiter
+        response = call_with_rate_limit(
+            get_rate_limiter("chat", GPT_MODEL),
+            lambda: client.chat.completions.create(
+                model=GPT_MODEL,
+                messages=[{
+                    "role": "user",
+                    "content": structured_prompt
+                }]
+            ),
+            estimate_tokens(structured_prompt) + CHAT_RESPONSE_TOKEN_ESTIMATE
         )
 
         # Log the length of choices for debugging
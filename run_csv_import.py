@@ -1,15 +1,36 @@
-# run_csv_import.py
+import argparse
 from dotenv import load_dotenv
 from logger import logger
-from utils.vector_db import initialize_faiss_index, save_faiss_index, save_metadata
-from utils.csv_to_vector import import_csv_to_faiss
+from utils.vector_db_faiss import initialize_faiss_index, save_faiss_index, save_metadata
+from utils.csv_to_vector import import_csv_to_faiss, CHECKPOINT_EVERY, EMBED_WORKERS
+from utils.ingest_journal import IngestJournal
+from utils.dedup import DEDUP_THRESHOLD
+from config import EMBEDDING_DIMENSION
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize the FAISS index with the appropriate embedding dimension
-# Ensure this dimension matches your embedding model (e.g., 1536 for OpenAI's ada model)
-initialize_faiss_index(dimension=1536)
+parser = argparse.ArgumentParser(description="Import TestRail test cases from a CSV file into FAISS.")
+parser.add_argument("--resume", action="store_true",
+                    help="Continue an interrupted import, skipping rows already flushed to the index.")
+parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY,
+                    help="Rows between index flushes to disk.")
+parser.add_argument("--workers", type=int, default=EMBED_WORKERS,
+                    help="CSV chunks embedded concurrently.")
+parser.add_argument("--dedup-threshold", type=float, default=DEDUP_THRESHOLD,
+                    help="Similarity at which near-identical rows of the same priority and section "
+                         "are indexed once (0 to disable).")
+parser.add_argument("--id-column", default=None,
+                    help="CSV column with the TestRail case id (e.g. ID); rows are then upserted by id.")
+parser.add_argument("--field-column", action="append", default=[], metavar="FIELD=COLUMN",
+                    help="CSV column holding a filter field, e.g. section_id='Section ID' "
+                         "(default: the column named like the field).")
+args = parser.parse_args()
+field_columns = dict(mapping.split("=", 1) for mapping in args.field_column)
+
+# Initialize the FAISS index with the configured embedding dimension
+# (EMBEDDING_MODEL / EMBEDDING_DIMENSION in config.py)
+initialize_faiss_index(dimension=EMBEDDING_DIMENSION)
 
 # Update the CSV file path to your specific file located in the main directory
 csv_file_path = "put your filepath here.csv"
@@ -24,9 +45,19 @@ columns_to_concatenate = [
     'Steps (Step)'
 ]
 
+# Track committed rows so a crashed or throttled import can pick up where it stopped
+journal = IngestJournal(f"{csv_file_path}.journal")
+if args.resume:
+    journal.load()
+else:
+    journal.reset()
+
 # Import test cases from CSV into FAISS using the specified columns
-import_csv_to_faiss(csv_file_path, text_columns=columns_to_concatenate)
+import_csv_to_faiss(csv_file_path, text_columns=columns_to_concatenate,
+                    journal=journal, checkpoint_every=args.checkpoint_every,
+                    workers=args.workers, dedup_threshold=args.dedup_threshold,
+                    id_column=args.id_column, field_columns=field_columns)
 
 # Save FAISS index and metadata to keep them in sync across runs
-save_faiss_index()
-save_metadata()
\ No newline at end of file
+save_faiss_index(final=True)
+save_metadata()
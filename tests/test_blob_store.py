@@ -0,0 +1,64 @@
+# test_blob_store.py
+import json
+import os
+
+import faiss
+import numpy as np
+
+import utils.vector_db_faiss as vdb
+from utils.blob_store import BlobStore, offsets_path
+
+
+def test_round_trip_with_compression_and_lazy_reads(tmp_path):
+    path = str(tmp_path / "meta.blob")
+    items = ["short", {"title": "Refund", "steps": ["open the order"] * 50}, "x" * 5000]
+    store = BlobStore(path)
+    store.extend(items)
+    assert len(store) == 3 and store[2] == items[2]  # pending items are readable before flush
+    store.flush()
+    store.append("later")
+    store.flush()
+
+    reader = BlobStore(path, read_only=True)
+    assert list(reader) == items + ["later"]
+    assert reader[-1] == "later" and reader[1:3] == items[1:3]
+    # Long records are compressed on disk
+    assert os.path.getsize(path) < len(items[2])
+
+
+def test_torn_flush_is_ignored_by_readers_and_trimmed_by_writers(tmp_path):
+    path = str(tmp_path / "meta.blob")
+    BlobStore.write_all(path, ["a", "b"])
+    size = os.path.getsize(path)
+    # A flush that died after writing part of the data and part of an offset
+    with open(path, "ab") as f:
+        f.write(b"\x00\"c")
+    with open(offsets_path(path), "ab") as f:
+        f.write(b"\x07\x00")
+
+    assert list(BlobStore(path, read_only=True)) == ["a", "b"]
+    writer = BlobStore(path)
+    assert os.path.getsize(path) == size
+    writer.append("c")
+    writer.flush()
+    assert list(BlobStore(path, read_only=True)) == ["a", "b", "c"]
+
+
+def test_read_only_open_of_a_legacy_layout_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    vectors = np.random.RandomState(0).rand(20, 8).astype("float32")
+    index = faiss.IndexFlatL2(8)
+    index.add(vectors)
+    faiss.write_index(index, vdb.INDEX_FILE)
+    with open(vdb.LEGACY_METADATA_FILE, "w", encoding="utf-8") as f:
+        json.dump([f"case {i}" for i in range(20)], f)
+    before = sorted(os.listdir(tmp_path))
+
+    vdb.initialize_faiss_index(8, read_only=True)
+    assert vdb.search_similar(vectors[3], top_k=1) == ["case 3"]
+    assert sorted(os.listdir(tmp_path)) == before
+
+    # A writable open converts the metadata and moves everything into a snapshot
+    vdb.initialize_faiss_index(8)
+    assert os.path.exists(os.path.join(vdb.SNAPSHOTS.current(), vdb.METADATA_FILE))
+    assert vdb.search_similar(vectors[3], top_k=1) == ["case 3"]
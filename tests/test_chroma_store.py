@@ -0,0 +1,34 @@
+# test_chroma_store.py
+import os
+import subprocess
+import sys
+
+from utils import chroma_store
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_chroma_modules_does_not_open_chroma(tmp_path):
+    # A fresh interpreter, so modules imported by other tests do not count
+    code = ("import sys, modules.rag_engine_chroma, utils.json_to_vector; "
+            "from utils import chroma_store; "
+            "assert not chroma_store._CLIENTS and 'chromadb' not in sys.modules")
+    env = dict(os.environ, PYTHONPATH=ROOT, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "x"))
+    result = subprocess.run([sys.executable, "-c", code], cwd=str(tmp_path), env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert os.listdir(tmp_path) == []
+
+
+def test_warm_up_opens_each_singleton_once(tmp_path):
+    path = str(tmp_path / "chroma")
+    chroma_store.warm_up_in_background(path, api_key="x").join()
+    timings = chroma_store.open_timings(path)
+    assert {"open_client", "embedding_function", "get_collection", "total"} <= set(timings)
+
+    client = chroma_store.get_client(path)
+    active = chroma_store.get_active_collection(path, api_key="x")
+    collection, embedding_function, version = active.get()
+    assert chroma_store.get_client(path) is client
+    assert chroma_store.get_active_collection(path, api_key="x") is active
+    # The collection opened for a pinned version shares the embedding function
+    assert chroma_store.get_version_collection(path, version, api_key="x")[1] is embedding_function
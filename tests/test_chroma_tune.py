@@ -0,0 +1,59 @@
+# test_chroma_tune.py
+import numpy as np
+from chromadb.api.models.Collection import Collection
+
+from config import CHROMA_HNSW_SEARCH_EF
+from utils import chroma_store, chroma_tune
+from utils.chroma_store import get_client
+from utils.index_versions import apply_search_ef, get_active_version, hnsw_configuration, open_version_collection
+
+
+def test_sweep_reports_each_hnsw_setting(tmp_path):
+    path = str(tmp_path / "chroma")
+    collection = get_client(path).create_collection(
+        name=get_active_version(path)["collection"], embedding_function=None,
+        configuration=hnsw_configuration("cosine", 16, 100, 100)
+    )
+    rng = np.random.RandomState(0)
+    embeddings = (rng.randn(1000, 8) @ rng.randn(8, 32)).astype("float32")
+    collection.add(ids=[f"C{row}" for row in range(len(embeddings))], embeddings=embeddings)
+    assert not apply_search_ef(collection, 100)
+    assert apply_search_ef(collection, 40)
+    assert get_client(path).get_collection(name=collection.name).configuration["hnsw"]["ef_search"] == 40
+
+    results = chroma_tune.sweep(path, spaces=("cosine", "l2"), ms=(16,), construction_efs=(100,),
+                                search_efs=(10, 200), k=5, query_sample=40)
+    assert [(row["space"], row["search_ef"]) for row in results] == [("cosine", 10), ("cosine", 200), ("l2", 10),
+                                                                     ("l2", 200)]
+    assert all(row["p50_ms"] <= row["p99_ms"] for row in results)
+    assert all(row["recall"] >= 0.95 for row in results if row["search_ef"] == 200)
+
+
+def test_exact_neighbours_follow_the_space():
+    corpus = np.array([[1.0, 0.0], [10.0, 1.0], [0.0, 1.0]], dtype="float32")
+    queries = np.array([[2.0, 0.05]], dtype="float32")
+    assert chroma_tune.exact_neighbours(corpus, queries, 2, "l2") == [[0, 2]]
+    assert chroma_tune.exact_neighbours(corpus, queries, 2, "cosine") == [[0, 1]]
+    assert chroma_tune.exact_neighbours(corpus, queries, 2, "ip") == [[1, 0]]
+
+
+def test_opening_a_version_never_writes_and_a_stored_search_ef_applies_after_a_reset(tmp_path, monkeypatch):
+    path = str(tmp_path / "chroma")
+    version = get_active_version(path)
+    open_version_collection(get_client(path), version, api_key="x")
+    assert chroma_tune.store_search_ef(path, search_ef=30)
+    assert not chroma_tune.store_search_ef(path, search_ef=30)
+
+    # reset() closes the client through Chroma's public API; the next one reloads the stored value
+    client = get_client(path)
+    chroma_store.reset(path)
+    assert get_client(path) is not client
+
+    def modify(self, *args, **kwargs):
+        raise AssertionError("opening a collection wrote to it")
+
+    # A reader configured with another search_ef leaves the stored one alone
+    monkeypatch.setattr(Collection, "modify", modify)
+    collection, _ = open_version_collection(get_client(path), version, api_key="x")
+    assert 30 != CHROMA_HNSW_SEARCH_EF
+    assert collection.configuration["hnsw"]["ef_search"] == 30
@@ -0,0 +1,67 @@
+# test_chunking.py
+from utils.chunking import aggregate_by_parent, chunk_test_case
+from utils.embeddings import estimate_tokens
+
+
+def test_short_case_is_a_single_chunk():
+    header = "Title: Login\nDescription: \nPreconditions: \n"
+    steps = ["Step 1 Content: open app\n", "Step 2 Content: log in\n"]
+    assert chunk_test_case(header, steps, max_tokens=512) == [header + "".join(steps)]
+
+
+def test_long_case_splits_between_steps_within_budget():
+    header = "Title: Checkout\nDescription: \nPreconditions: \n"
+    steps = [f"Step {i} Content: " + "click " * 40 + "\n" for i in range(1, 11)]
+    chunks = chunk_test_case(header, steps, max_tokens=200)
+
+    assert len(chunks) > 1
+    assert chunks[0].startswith(header)
+    for chunk in chunks:
+        assert estimate_tokens(chunk) <= 200
+    for chunk in chunks[1:]:
+        assert chunk.startswith("Title: Checkout (continued)\n")
+    # Every step survives intact in exactly one chunk
+    for step in steps:
+        assert sum(step in chunk for chunk in chunks) == 1
+
+
+def test_oversized_step_is_split():
+    chunks = chunk_test_case("Title: Huge\n", ["word " * 2000], max_tokens=100)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+
+
+def test_long_title_does_not_drop_step_text():
+    title = "Title: " + " ".join(f"title{i}" for i in range(60))
+    steps = [f"Step {i} Content: " + " ".join(f"s{i}w{j}" for j in range(30)) + "\n" for i in range(1, 6)]
+    chunks = chunk_test_case(title + "\nDescription: \n", steps, max_tokens=100)
+
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+    for chunk in chunks[1:]:
+        continued = chunk.split("\n", 1)[0]
+        assert continued.endswith("... (continued)")
+        assert estimate_tokens(continued) <= 25
+    # Every word of the title and of each step is still in some chunk
+    text = " ".join(chunks)
+    for word in title.split() + " ".join(steps).split():
+        assert word in text
+
+
+def test_aggregate_by_parent_keeps_distinct_parents():
+    ids = ["7:2", "7:0", "3:0", "legacy", "9:1"]
+    documents = ["seven b", "seven a", "three", "old doc", "nine"]
+    metadatas = [
+        {"parent_id": "7", "chunk_index": 2},
+        {"parent_id": "7", "chunk_index": 0},
+        {"parent_id": "3", "chunk_index": 0},
+        None,
+        {"parent_id": "9", "chunk_index": 1},
+    ]
+    distances = [0.1, 0.2, 0.3, 0.4, 0.5]
+
+    parents = aggregate_by_parent(ids, documents, metadatas, distances, top_k=3)
+
+    assert [p["parent_id"] for p in parents] == ["7", "3", "legacy"]
+    assert parents[0]["document"] == "seven a\nseven b"
+    assert parents[0]["chunk_ids"] == ["7:0", "7:2"]
+    assert parents[0]["distance"] == 0.1
@@ -0,0 +1,118 @@
+# test_csv_to_vector.py
+import zlib
+
+import numpy as np
+import pandas as pd
+
+import utils.csv_to_vector as csv_to_vector
+import utils.vector_db_faiss as vdb
+from utils.ingest_journal import IngestJournal
+
+
+def _fake_embeddings(texts):
+    return [np.random.RandomState(zlib.crc32(text.encode())).rand(16) for text in texts]
+
+
+def _write_csv(path, rows=53):
+    pd.DataFrame({
+        "ID": [f"C{i}" for i in range(rows)],
+        "Title": [f"Case {i}" if i % 10 else "" for i in range(rows)],
+        "Steps": [f"open page {i} and check total {i * 7}" if i % 10 else "" for i in range(rows)],
+        "priority_id": [i % 4 + 1 for i in range(rows)],
+        "Section ID": [100 + i % 3 for i in range(rows)],
+    }).to_csv(path, index=False)
+
+
+def _import(tmp_path, monkeypatch, name, **kwargs):
+    workdir = tmp_path / name
+    workdir.mkdir(exist_ok=True)
+    monkeypatch.chdir(workdir)
+    vdb.initialize_faiss_index(16, index_type="flat")
+    kwargs.setdefault("dedup_threshold", 0)
+    csv_to_vector.import_csv_to_faiss(str(tmp_path / "cases.csv"), text_columns=["Title", "Steps"], **kwargs)
+    rows, vectors, metadata, keys = vdb.live_snapshot(vdb.INDEX, vdb.ROW_KEYS, vdb.METADATA, vdb.FULL_VECTORS)
+    return vectors, metadata, keys
+
+
+def test_chunked_concurrent_import_matches_a_single_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(csv_to_vector, "generate_embeddings", _fake_embeddings)
+    _write_csv(tmp_path / "cases.csv")
+
+    whole = _import(tmp_path, monkeypatch, "whole", batch_size=1000, workers=1)
+    journal = IngestJournal(str(tmp_path / "cases.journal"))
+    journal.reset()
+    chunked = _import(tmp_path, monkeypatch, "chunked", batch_size=4, workers=3, journal=journal, checkpoint_every=10)
+
+    # Blank rows are skipped; the rest are indexed once each, in file order
+    assert len(whole[1]) == 47
+    assert whole[1][:2] == ["Case 1 open page 1 and check total 7", "Case 2 open page 2 and check total 14"]
+    assert chunked[1] == whole[1] and chunked[2] == whole[2]
+    np.testing.assert_array_equal(chunked[0], whole[0])
+    # Checkpoints journal every row, blank ones included
+    assert len(journal) == 53
+
+    keyed = _import(tmp_path, monkeypatch, "keyed", batch_size=4, workers=3, id_column="ID")
+    assert keyed[1] == whole[1]
+    assert keyed[2] == [f"C{i}" for i in range(53) if i % 10]
+
+
+def test_rows_are_indexed_with_their_filter_fields(tmp_path, monkeypatch):
+    monkeypatch.setattr(csv_to_vector, "generate_embeddings", _fake_embeddings)
+    _write_csv(tmp_path / "cases.csv")
+    _import(tmp_path, monkeypatch, "fields", batch_size=4, workers=2, field_columns={"section_id": "Section ID"})
+
+    query = _fake_embeddings(["Case 7 open page 7 and check total 49"])
+    assert vdb.search_similar(query[0], top_k=1) == ["Case 7 open page 7 and check total 49"]
+    # Case 7 has priority 4 and section 101 ("Section ID" column)
+    hits = vdb.search_similar_batch(query, top_k=50, filters={"priority_id": [4], "section_id": [101]})[0]
+    assert [hit["document"] for hit in hits][0] == "Case 7 open page 7 and check total 49"
+    assert len(hits) == len([i for i in range(53) if i % 10 and i % 4 == 3 and i % 3 == 1])
+    hits = vdb.search_similar_batch(query, top_k=50, filters={"priority_id": [1, 2, 3]})[0]
+    assert "Case 7 open page 7 and check total 49" not in [hit["document"] for hit in hits]
+    assert len(hits) == len([i for i in range(53) if i % 10 and i % 4 != 3])
+
+
+def test_near_duplicates_fold_within_a_section_and_are_recorded_on_the_representative(tmp_path, monkeypatch):
+    monkeypatch.setattr(csv_to_vector, "generate_embeddings", _fake_embeddings)
+    steps = " ".join(f"step {i} open the settings page {i} and verify toggle {i} is saved" for i in range(10))
+    pd.DataFrame({
+        "ID": ["C1", "C2", "C3", "C4", "C5"],
+        "Steps": [steps, steps + " again", steps, "refund an order", steps],
+        "priority_id": [2, 2, 2, 2, 3],
+        "section_id": [17, 17, 18, 17, 17],
+    }).to_csv(tmp_path / "cases.csv", index=False)
+
+    vectors, metadata, keys = _import(tmp_path, monkeypatch, "dedup", batch_size=2, workers=2,
+                                      dedup_threshold=0.75, id_column="ID")
+
+    # C2 clones C1 in the same section and priority; C3 and C5 differ in one of them
+    assert keys == ["C1", "C3", "C4", "C5"]
+    assert metadata[0] == {"text": steps, "duplicate_ids": "C2", "duplicate_count": 1}
+    assert metadata[1:] == [steps, "refund an order", steps]
+    assert vdb.document_text(metadata[0]) == steps
+
+
+def test_reimport_deletes_cases_that_are_now_near_duplicates(tmp_path, monkeypatch):
+    monkeypatch.setattr(csv_to_vector, "generate_embeddings", _fake_embeddings)
+    steps = " ".join(f"step {i} open the settings page {i} and verify toggle {i} is saved" for i in range(10))
+    pd.DataFrame({
+        "ID": ["C1", "C2", "C3"],
+        "Steps": [steps, "refund an order", "log out"],
+        "priority_id": [2, 2, 2],
+        "section_id": [17, 17, 17],
+    }).to_csv(tmp_path / "cases.csv", index=False)
+    assert _import(tmp_path, monkeypatch, "reimport", id_column="ID", dedup_threshold=0.75)[2] == ["C1", "C2", "C3"]
+    vdb.save_faiss_index(final=True)
+
+    # C2 has been edited into a clone of C1
+    pd.DataFrame({
+        "ID": ["C1", "C2", "C3"],
+        "Steps": [steps, steps + " again", "log out"],
+        "priority_id": [2, 2, 2],
+        "section_id": [17, 17, 17],
+    }).to_csv(tmp_path / "cases.csv", index=False)
+    vectors, metadata, keys = _import(tmp_path, monkeypatch, "reimport", id_column="ID", dedup_threshold=0.75)
+    assert keys == ["C1", "C3"]
+    assert metadata[0] == {"text": steps, "duplicate_ids": "C2", "duplicate_count": 1}
+    hits = vdb.search_similar_batch(_fake_embeddings(["refund an order"]), top_k=5)[0]
+    assert sorted(hit["id"] for hit in hits) == ["C1", "C3"]
@@ -0,0 +1,39 @@
+# test_dedup.py
+from utils.dedup import NearDuplicateIndex
+
+STEPS = " ".join(f"Step {i} open the settings page {i} and verify the toggle {i} is saved" for i in range(10))
+
+
+def test_clones_join_the_first_case_and_distinct_cases_stay_apart():
+    dedup = NearDuplicateIndex(threshold=0.75)
+
+    assert dedup.assign("1", f"Title: Save settings\n{STEPS}") == "1"
+    # Same case with one step reworded, as cloned TestRail cases usually are
+    assert dedup.assign("2", f"Title: Save settings\n{STEPS.replace('toggle 4 is saved', 'toggle 4 is reset')}") == "1"
+    assert dedup.assign("3", "Title: Refund an order\nStep 1 open an order and issue a refund") == "3"
+    # Shares only half its steps with case 1
+    assert dedup.assign("4", f"Title: Save settings\n{STEPS[:len(STEPS) // 2]}") == "4"
+    assert dedup.assign("5", "") == "5"
+
+    assert dedup.members == {"1": ["2"], "3": [], "4": []}
+    assert len(dedup) == 3
+
+
+def test_only_cases_of_the_same_group_are_folded():
+    dedup = NearDuplicateIndex(threshold=0.75)
+
+    assert dedup.assign("1", STEPS, group=(2, 17)) == "1"
+    assert dedup.assign("2", STEPS, group=(3, 17)) == "2"
+    assert dedup.assign("3", STEPS, group=(2, 18)) == "3"
+    assert dedup.assign("4", STEPS, group=(2, 17)) == "1"
+    assert dedup.members == {"1": ["4"], "2": [], "3": []}
+
+
+def test_assignment_is_deterministic():
+    texts = [(str(i), f"case {i % 7} " + " ".join(f"word{i % 7}_{j}" for j in range(40))) for i in range(50)]
+    runs = []
+    for _ in range(2):
+        dedup = NearDuplicateIndex()
+        runs.append([dedup.assign(item_id, text) for item_id, text in texts])
+    assert runs[0] == runs[1]
+    assert len(set(runs[0])) == 7
@@ -0,0 +1,48 @@
+# test_embedding_batches.py
+from types import SimpleNamespace
+
+import utils.embeddings as embeddings
+from utils.embeddings import pack_batches, generate_embeddings
+
+
+class FakeEmbeddingsAPI:
+    """Stands in for client.embeddings; records each request and returns vectors out of order."""
+
+    def __init__(self):
+        self.requests = []
+
+    def create(self, input, model, **kwargs):
+        self.requests.append(list(input))
+        data = [
+            SimpleNamespace(index=i, embedding=[float(len(text)), float(i)])
+            for i, text in enumerate(input)
+        ]
+        return SimpleNamespace(data=list(reversed(data)))
+
+
+def test_pack_batches_respects_input_and_token_limits():
+    texts = ["a" * 30] * 10
+    batches = pack_batches(texts, max_inputs=4, max_tokens=1000)
+    assert [len(b) for b in batches] == [4, 4, 2]
+
+    # Each text is ~11 estimated tokens, so only two fit under 25
+    batches = pack_batches(texts, max_inputs=100, max_tokens=25)
+    assert all(len(b) == 2 for b in batches)
+    assert [p for b in batches for p in b] == list(range(10))
+
+
+def test_generate_embeddings_preserves_input_order(monkeypatch):
+    api = FakeEmbeddingsAPI()
+    monkeypatch.setattr(embeddings, "OpenAI", lambda **kwargs: SimpleNamespace(embeddings=api))
+    monkeypatch.setattr(embeddings, "get_embedding_cache", lambda: None)
+    monkeypatch.setattr(embeddings, "get_rate_limiter", lambda name, model=None: None)
+    monkeypatch.setattr(embeddings, "call_with_rate_limit", lambda limiter, request, tokens: request())
+    monkeypatch.setattr(embeddings, "pack_batches",
+                        lambda texts: pack_batches(texts, max_inputs=2))
+
+    texts = ["one", "", "three", "four", "fives"]
+    vectors = generate_embeddings(texts)
+
+    assert len(api.requests) == 2
+    assert [v[0] for v in vectors] == [3.0, 0.0, 5.0, 4.0, 5.0]
+    assert vectors[1] == [0.0] * embeddings.EMBEDDING_DIMENSION
@@ -0,0 +1,34 @@
+# test_embedding_cache.py
+from utils.embedding_cache import EmbeddingCache
+
+
+def test_cache_round_trip_normalizes_text_and_counts(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"), max_bytes=10 * 1024 * 1024)
+    cache.put_many("model-a", 4, ["Login  works\n"], [[0.5, 0.25, 0.0, 1.0]])
+
+    assert cache.get_many("model-a", 4, ["Login works", "Logout works"]) == [[0.5, 0.25, 0.0, 1.0], None]
+    # Same text under a different model or dimension is a different entry
+    assert cache.get_many("model-b", 4, ["Login works"]) == [None]
+    assert cache.get_many("model-a", 2, ["Login works"]) == [None]
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 3, 1)
+
+    # A second handle on the same file (e.g. another process) sees the entry and the totals
+    other = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"))
+    assert other.get_many("model-a", 4, ["Login works"]) == [[0.5, 0.25, 0.0, 1.0]]
+    assert other.stats()["total_hits"] == 2
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    # Each entry is a 64-dim float32 vector (256 bytes) plus its key
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"), max_bytes=1500)
+    vector = [0.1] * 64
+    for i in range(8):
+        cache.put_many("m", 64, [f"text {i}"], [vector])
+        # Keep the first entry hot
+        cache.get_many("m", 64, ["text 0"])
+
+    assert cache.stats()["bytes"] <= 1500
+    assert cache.get_many("m", 64, ["text 0"])[0] is not None
+    assert cache.get_many("m", 64, ["text 1"]) == [None]
@@ -0,0 +1,40 @@
+# test_faiss_filters.py
+import numpy as np
+
+from utils.row_fields import RowFields
+from utils.vector_store import VectorStore
+
+
+def _vectors(seed, n=2000, dimension=16):
+    return np.random.RandomState(seed).rand(n, dimension).astype("float32")
+
+
+def test_id_lists_cover_rows_added_after_they_were_built(tmp_path):
+    fields = RowFields(str(tmp_path / "fields.npy"), fields=("priority_id", "section_id"))
+    fields.append([{"priority_id": row % 4, "section_id": str(row % 10)} for row in range(5000)])
+    assert sorted(fields.rows_matching("section_id", [3])) == list(range(3, 5000, 10))
+    fields.append([{"priority_id": 9}, None, {"section_id": 3}])
+    assert sorted(fields.rows_matching("section_id", [3]))[-1] == 5002
+    assert fields.mask({"priority_id": [1, 9], "section_id": 1}, 5003).sum() == 250
+
+
+def test_filtered_search_only_returns_matching_rows(tmp_path):
+    vectors = _vectors(0)
+    keys = [f"C{row}" for row in range(len(vectors))]
+    fields = [{"priority_id": row % 4, "section_id": row % 50} for row in range(len(vectors))]
+    store = VectorStore(root=str(tmp_path), dimension=16, index_type="hnsw")
+    store.upsert("cases", keys, vectors, keys, fields)
+    store.delete("cases", ["C7"])
+
+    queries = _vectors(1, n=10)
+    results = store.search_batch("cases", queries, top_k=5, filters={"section_id": [7, 8], "priority_id": 3})
+    allowed = [row for row in range(len(vectors)) if row % 50 in (7, 8) and row % 4 == 3 and row != 7]
+    distances = ((vectors[allowed][None] - queries[:, None]) ** 2).sum(axis=-1)
+    expected = [[keys[allowed[i]] for i in np.argsort(row)[:5]] for row in distances]
+    assert [[hit["id"] for hit in hits] for hits in results] == expected
+
+    # The fields are saved with the index and reloaded
+    store.close()
+    reopened = VectorStore(root=str(tmp_path), dimension=16, read_only=True)
+    assert reopened.search_batch("cases", queries, top_k=5, filters={"section_id": [7, 8], "priority_id": 3}) == results
+    assert reopened.search("cases", queries[0], filters={"section_id": 99}) == []
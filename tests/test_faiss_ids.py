@@ -0,0 +1,68 @@
+# test_faiss_ids.py
+import numpy as np
+
+import utils.vector_db_faiss as vdb
+from utils.vector_store import VectorStore
+
+
+def _vectors(n=400, dimension=16, seed=0):
+    return np.random.RandomState(seed).rand(n, dimension).astype("float32")
+
+
+def test_upsert_and_delete_by_case_id_survive_compaction(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    vectors = _vectors()
+    vdb.initialize_faiss_index(16, index_type="flat")
+    vdb.upsert_embeddings([f"C{i}" for i in range(400)], vectors, [f"case {i}" for i in range(400)])
+
+    # Replacing a case moves it; the old vector no longer matches
+    assert vdb.upsert_embeddings(["C7"], vectors[300:301] + 0.001, ["case 7 v2"]) == 1
+    assert vdb.search_similar(vectors[7], top_k=1) != ["case 7"]
+    assert vdb.search_similar(vectors[300], top_k=2) == ["case 300", "case 7 v2"]
+    assert vdb.delete_embeddings(["C300", "C999"]) == 1
+    assert vdb.search_similar(vectors[300], top_k=1) == ["case 7 v2"]
+    assert vdb.tombstone_count() == 2
+    vdb.save_faiss_index()
+    vdb.save_metadata()
+
+    # Tombstones persist, and compaction drops them without changing results
+    vdb.initialize_faiss_index(16)
+    assert vdb.tombstone_count() == 2 and vdb.INDEX.ntotal == 401
+    before = [vdb.search_similar(vectors[i], top_k=3) for i in range(0, 400, 37)]
+    assert vdb.compact_faiss_index() == 2
+    assert vdb.INDEX.ntotal == 399 and vdb.tombstone_count() == 0
+    assert [vdb.search_similar(vectors[i], top_k=3) for i in range(0, 400, 37)] == before
+
+    # Keys still resolve after compaction and a reload
+    vdb.initialize_faiss_index(16)
+    assert vdb.upsert_embeddings(["C5"], vectors[5:6], ["case 5 v2"]) == 1
+    assert vdb.search_similar(vectors[5], top_k=1) == ["case 5 v2"]
+
+
+def test_vector_store_skips_and_compacts_tombstones(tmp_path):
+    store = VectorStore(root=str(tmp_path), dimension=16, index_type="flat")
+    vectors = _vectors()
+    store.upsert("project", list(range(400)), vectors, [str(i) for i in range(400)])
+    assert store.delete("project", list(range(0, 400, 2))) == 200
+    assert store.search("project", vectors[10], top_k=3)[0] != "10"
+    assert all(int(item) % 2 for item in store.search("project", vectors[10], top_k=10))
+
+    assert store.compact("project", min_ratio=0.6) == 0
+    assert store.compact("project", min_ratio=0.5) == 200
+    assert store.tombstones("project") == 0
+    assert store.search("project", vectors[11], top_k=1) == ["11"]
+
+
+def test_batch_search_returns_ids_and_distances_per_query(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    vectors = _vectors()
+    vdb.initialize_faiss_index(16, index_type="flat")
+    vdb.upsert_embeddings([f"C{i}" for i in range(300)], vectors[:300], [f"case {i}" for i in range(300)])
+    vdb.add_embeddings(vectors[300:], [f"case {i}" for i in range(300, 400)])
+
+    results = vdb.search_similar_batch(vectors[[5, 350]], top_k=3)
+    assert [hits[0]["id"] for hits in results] == ["C5", "faiss-350"]
+    assert results[0][0]["document"] == "case 5" and results[0][0]["distance"] == 0.0
+    assert all(hits[0]["distance"] <= hits[1]["distance"] <= hits[2]["distance"] for hits in results)
+    assert [[hit["document"] for hit in hits] for hits in results] == [vdb.search_similar(vectors[i], top_k=3)
+                                                                       for i in (5, 350)]
@@ -0,0 +1,103 @@
+# test_faiss_index_types.py
+import numpy as np
+
+import utils.vector_db_faiss as vdb
+
+
+def _corpus(n=2000, dimension=32):
+    rng = np.random.RandomState(0)
+    centers = rng.randn(40, dimension) * 3
+    return (centers[rng.randint(0, 40, n)] + rng.randn(n, dimension)).astype("float32")
+
+
+def test_ivf_index_trains_once_enough_vectors_arrive(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    vectors = _corpus()
+    vdb.INDEX, vdb.METADATA, vdb.PENDING = vdb.build_faiss_index(32, "ivf_flat", nlist=8), [], []
+    vdb.ROW_KEYS, vdb.WAL = None, None
+    assert vdb.training_size(vdb.INDEX) == 8 * vdb.TRAIN_POINTS_PER_LIST
+
+    vdb.add_embeddings(vectors[:300], [f"case {i}" for i in range(300)])
+    assert vdb.INDEX.ntotal == 0 and not vdb.INDEX.is_trained
+
+    # Untrained vectors survive a save and reload
+    vdb.save_faiss_index()
+    vdb.save_metadata()
+    vdb.initialize_faiss_index(32)
+    assert sum(len(batch) for batch in vdb.PENDING) == 300
+
+    vdb.add_embeddings(vectors[300:], [f"case {i}" for i in range(300, len(vectors))])
+    assert vdb.INDEX.is_trained and vdb.INDEX.ntotal == len(vectors) and not vdb.PENDING
+    assert vdb.search_similar(vectors[1234], top_k=1) == ["case 1234"]
+
+
+def test_recall_at_k_against_exact_search():
+    vectors = _corpus()
+    queries = vectors[:50]
+
+    flat = vdb.build_faiss_index(32, "flat")
+    flat.add(vectors)
+    assert vdb.recall_at_k(flat, vectors, queries, k=5) == 1.0
+
+    ivf = vdb.train_faiss_index(vdb.build_faiss_index(32, "ivf_flat", nlist=16), vectors)
+    ivf.add(vectors)
+    vdb.set_search_params(ivf, nprobe=1)
+    low = vdb.recall_at_k(ivf, vectors, queries, k=5)
+    vdb.set_search_params(ivf, nprobe=16)
+    assert low <= vdb.recall_at_k(ivf, vectors, queries, k=5) == 1.0
+
+
+def test_int8_inner_product_index_reranks_from_full_vectors(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(vdb, "FAISS_RERANK", 4)
+    vectors = _corpus(n=3000, dimension=64)
+    vdb.INDEX, vdb.METADATA, vdb.PENDING = vdb.build_faiss_index(64, "flat", metric="ip", storage="int8"), [], []
+    vdb.ROW_KEYS, vdb.WAL = None, None
+    vdb.FULL_VECTORS = vdb.open_full_vectors(vdb.VECTORS_FILE, vdb.INDEX)
+    assert vdb.storage_of(vdb.INDEX) == "int8" and vdb.is_lossy(vdb.INDEX)
+
+    vdb.add_embeddings(vectors, [f"case {i}" for i in range(len(vectors))])
+    vdb.save_faiss_index(final=True)
+    vdb.save_metadata()
+    # Codes take a quarter of the float32 size; full vectors stay on disk
+    assert vdb.INDEX.sa_code_size() == 64
+    assert len(vdb.FULL_VECTORS) == len(vectors)
+
+    vdb.initialize_faiss_index(64, read_only=True)
+    assert vdb.search_similar(vectors[123] * 5, top_k=1) == ["case 123"]  # cosine ignores the scale
+    vdb.READ_ONLY = False
+
+
+class _UncopyableRows:
+    """Stands in for a VectorFile's memory map and fails if it is copied as a whole."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, ids):
+        return self.rows[ids]
+
+    def __array__(self, *args, **kwargs):
+        raise AssertionError("the whole vector file was copied into memory")
+
+
+def test_rerank_reads_stored_and_buffered_full_vectors_without_copying_the_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(vdb, "FAISS_RERANK", 4)
+    vectors = _corpus(n=600, dimension=32)
+    vdb.INDEX, vdb.METADATA, vdb.PENDING = vdb.build_faiss_index(32, "flat", storage="fp16"), [], []
+    vdb.ROW_KEYS, vdb.WAL = None, None
+    vdb.FULL_VECTORS = vdb.open_full_vectors(vdb.VECTORS_FILE, vdb.INDEX)
+    vdb.add_embeddings(vectors[:500], [f"case {i}" for i in range(500)])
+    vdb.FULL_VECTORS.flush()
+    # Rows added since the last flush are still buffered in memory
+    vdb.add_embeddings(vectors[500:], [f"case {i}" for i in range(500, 600)])
+    full_vectors = vdb.FULL_VECTORS
+    full_vectors._rows = _UncopyableRows(full_vectors._rows)
+
+    np.testing.assert_array_equal(full_vectors.take([550, 3, 599, 499, 500]), vectors[[550, 3, 599, 499, 500]])
+    assert vdb.search_similar(vectors[550], top_k=1) == ["case 550"]
+    assert vdb.search_similar(vectors[3], top_k=1) == ["case 3"]
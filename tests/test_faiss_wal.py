@@ -0,0 +1,48 @@
+# test_faiss_wal.py
+import os
+
+import numpy as np
+
+import utils.vector_db_faiss as vdb
+from utils.write_ahead_log import WriteAheadLog, OP_ADD, OP_DELETE
+
+
+def test_log_replays_complete_records_and_drops_a_torn_tail(tmp_path):
+    path = str(tmp_path / "wal.log")
+    log = WriteAheadLog(path)
+    log.append_add(np.ones((2, 4)), ["C1", None], [{"text": "one"}, "two"])
+    log.append_delete(["C1"])
+    log.sync()
+    log.close()
+    with open(path, "ab") as f:
+        f.write(b"\x01\x40\x00\x00\x00partial")
+
+    log = WriteAheadLog(path)
+    (op, vectors, body), (op2, _, body2) = log.records()
+    assert op == OP_ADD and vectors.shape == (2, 4) and body == {"keys": ["C1", None], "items": [{"text": "one"}, "two"]}
+    assert op2 == OP_DELETE and body2 == {"keys": ["C1"]}
+    assert os.path.getsize(path) == log.size
+
+
+def test_checkpoints_go_to_the_log_until_a_snapshot_merges_it(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    vectors = np.random.RandomState(0).rand(300, 16).astype("float32")
+    vdb.initialize_faiss_index(16, index_type="flat")
+    first = vdb.SNAPSHOTS.current()
+    vdb.upsert_embeddings([f"C{i}" for i in range(300)], vectors, [f"case {i}" for i in range(300)])
+    vdb.delete_embeddings(["C3"])
+    vdb.save_faiss_index()
+    vdb.save_metadata()
+
+    # A checkpoint only syncs the log; the snapshot is untouched
+    assert vdb.SNAPSHOTS.current() == first and os.path.getsize(os.path.join(first, vdb.WAL_FILE)) > 0
+    vdb.initialize_faiss_index(16)
+    assert vdb.INDEX.ntotal == 300 and vdb.tombstone_count() == 1
+    assert vdb.search_similar(vectors[3], top_k=1) != ["case 3"]
+
+    # A final save merges the log into a new snapshot that read-only processes see
+    vdb.save_faiss_index(final=True)
+    assert vdb.SNAPSHOTS.current() != first and not os.path.exists(first)
+    vdb.initialize_faiss_index(16, read_only=True)
+    assert vdb.INDEX.ntotal == 300 and vdb.search_similar(vectors[42], top_k=1) == ["case 42"]
+    vdb.READ_ONLY = False
@@ -0,0 +1,23 @@
+# test_ingest_journal.py
+from utils.ingest_journal import IngestJournal
+
+
+def test_resume_reads_committed_ids_and_ignores_a_torn_line(tmp_path):
+    path = str(tmp_path / "import.journal")
+    journal = IngestJournal(path)
+    journal.reset()
+    journal.record(["1:0", "1:1"])
+    journal.record([2])
+    # A crash in the middle of the next write leaves a line without its newline
+    with open(path, "ab") as f:
+        f.write(b"3:")
+
+    resumed = IngestJournal(path)
+    assert resumed.load() == {"1:0", "1:1", "2"}
+    # The torn line is poisoned, so it never reads back as an id
+    resumed.record(["3:0"])
+    assert IngestJournal(path).load() == {"1:0", "1:1", "2", "3:0"}
+    assert "2" in resumed and 2 in resumed and "3:" not in resumed
+
+    resumed.reset()
+    assert IngestJournal(path).load() == set()
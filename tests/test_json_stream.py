@@ -0,0 +1,62 @@
+# test_json_stream.py
+import json
+
+import pytest
+
+from utils.json_stream import iter_json_array
+
+
+def test_iter_json_array_matches_json_load_across_chunk_boundaries(tmp_path):
+    cases = [
+        {
+            "id": i,
+            "title": f"Case {i} with unicode é and \"quotes\"",
+            "custom_steps_separated": [{"content": "x" * (i * 7), "expected": "ok"}],
+        }
+        for i in range(50)
+    ]
+    path = tmp_path / "cases.json"
+    path.write_text(json.dumps(cases, indent=2), encoding="utf-8")
+
+    # A tiny chunk size forces values to straddle many chunk boundaries
+    for chunk_size in (3, 17, 1 << 16):
+        assert list(iter_json_array(path, chunk_size=chunk_size)) == cases
+
+
+def test_iter_json_array_handles_empty_and_invalid_files(tmp_path):
+    empty = tmp_path / "empty.json"
+    empty.write_text(" [ ] ", encoding="utf-8")
+    assert list(iter_json_array(empty)) == []
+
+    not_array = tmp_path / "object.json"
+    not_array.write_text('{"cases": []}', encoding="utf-8")
+    with pytest.raises(ValueError):
+        list(iter_json_array(not_array))
+
+    truncated = tmp_path / "truncated.json"
+    truncated.write_text('[{"id": 1}, {"id": 2', encoding="utf-8")
+    with pytest.raises(ValueError):
+        list(iter_json_array(truncated))
+
+
+@pytest.mark.parametrize("text", ["[1 2]", "[1,,2]", "[1,]", '[{"id": 1} {"id": 2}]', "[1;2]", "[,1]"])
+def test_iter_json_array_requires_one_comma_between_elements(tmp_path, text):
+    path = tmp_path / "malformed.json"
+    path.write_text(text, encoding="utf-8")
+    for chunk_size in (1, 1 << 16):
+        with pytest.raises(ValueError):
+            list(iter_json_array(path, chunk_size=chunk_size))
+
+
+def test_iter_json_array_decodes_a_large_element_a_few_times(tmp_path, monkeypatch):
+    cases = [{"id": 1, "steps": ["x" * 100] * 2000}, {"id": 2}]
+    path = tmp_path / "cases.json"
+    path.write_text(json.dumps(cases), encoding="utf-8")
+
+    calls = []
+    raw_decode = json.JSONDecoder.raw_decode
+    monkeypatch.setattr(json.JSONDecoder, "raw_decode",
+                        lambda self, s, idx=0: calls.append(idx) or raw_decode(self, s, idx))
+    assert list(iter_json_array(path, chunk_size=64)) == cases
+    # The ~200KB element spans ~3000 chunks but the buffer doubles on each retry
+    assert len(calls) < 20
@@ -0,0 +1,128 @@
+# test_json_to_vector.py
+import asyncio
+import json
+import time
+
+import pytest
+
+import utils.json_to_vector as json_to_vector
+
+
+def _case(case_id, steps, updated_on=1):
+    return {"id": case_id, "title": f"Case {case_id}", "updated_on": updated_on, "priority_id": 2, "section_id": 7,
+            "custom_steps_separated": [{"content": step, "expected": "ok"} for step in steps]}
+
+
+def _fake_embeddings(texts, model=None, dimensions=None):
+    if any("FAIL" in text for text in texts):
+        raise RuntimeError("embedding request failed")
+    return [[float(len(text)), float(sum(map(ord, text)) % 97), 1.0] for text in texts]
+
+
+@pytest.fixture
+def importer(tmp_path, monkeypatch):
+    """Runs json_to_vector.main against a scratch Chroma directory, with embeddings computed locally."""
+    monkeypatch.setattr(json_to_vector, "CHROMA_PATH", str(tmp_path / "chroma"))
+    monkeypatch.setattr(json_to_vector, "_import_version", None)
+    monkeypatch.setattr(json_to_vector, "generate_embeddings", _fake_embeddings)
+    # The collection's embedding function needs a key to be built, though it is never called
+    monkeypatch.setattr(json_to_vector, "openai_api_key", "test")
+
+    def run(cases, **kwargs):
+        path = tmp_path / "cases.json"
+        path.write_text(json.dumps(cases), encoding="utf-8")
+        kwargs = {"report_interval": 0, "dedup_threshold": 0, "chunk_tokens": 40, **kwargs}
+        run.stats = asyncio.run(json_to_vector.main(json_path=path, **kwargs))
+        page = json_to_vector.import_collection().get(include=["documents"])
+        return dict(zip(page["ids"], page["documents"]))
+
+    return run
+
+
+def test_sync_upserts_changed_cases_and_deletes_removed_ones(importer):
+    long_steps = [f"step {i} " + "word " * 20 for i in range(4)]
+    indexed = importer([_case(1, ["a"]), _case(2, long_steps), _case(3, ["c"])])
+    assert {doc_id.split(":")[0] for doc_id in indexed} == {"1", "2", "3"}
+    assert len([doc_id for doc_id in indexed if doc_id.startswith("2:")]) > 1
+
+    synced = importer([_case(1, ["a"]), _case(2, ["short now"], updated_on=2)], sync=True)
+    assert sorted(synced) == ["1:0", "2:0"]
+    assert "short now" in synced["2:0"]
+    assert synced["1:0"] == indexed["1:0"]
+
+
+def test_sync_keeps_old_chunks_when_the_new_version_fails(importer):
+    long_steps = [f"step {i} " + "word " * 20 for i in range(4)]
+    indexed = importer([_case(1, long_steps), _case(2, ["b"])])
+
+    synced = importer([_case(1, ["FAIL"], updated_on=2), _case(2, ["b"])], sync=True)
+    assert synced == indexed
+    # The next sync still sees case 1 as changed and retries it
+    synced = importer([_case(1, ["fixed"], updated_on=2), _case(2, ["b"])], sync=True)
+    assert sorted(synced) == ["1:0", "2:0"]
+
+
+def test_pipeline_applies_backpressure_and_reports_failures(importer, monkeypatch):
+    read = []
+    iter_json_array = json_to_vector.iter_json_array
+
+    def counting_reader(path):
+        for case in iter_json_array(path):
+            read.append(case["id"])
+            yield case
+
+    read_while_blocked = []
+
+    def slow_embeddings(texts, model=None, dimensions=None):
+        if not read_while_blocked:
+            time.sleep(0.3)
+            read_while_blocked.append(len(read))
+        return _fake_embeddings(texts)
+
+    monkeypatch.setattr(json_to_vector, "iter_json_array", counting_reader)
+    monkeypatch.setattr(json_to_vector, "generate_embeddings", slow_embeddings)
+    cases = [_case(case_id, [f"step {case_id}"]) for case_id in range(100)]
+    cases[50]["custom_steps_separated"][0]["content"] = "FAIL"
+    indexed = importer(cases, embed_batch_size=2, embed_workers=1, queue_size=1)
+
+    # While the first batch was embedding, reading stopped a few batches ahead instead of taking all 100 cases
+    assert read_while_blocked[0] <= 12
+    stats = importer.stats
+    assert (stats.read, stats.failed, stats.written) == (100, 2, 98)
+    assert "50:0" not in indexed and len(indexed) == 98
+
+
+def test_pipeline_raises_when_reading_fails(importer):
+    with pytest.raises(ValueError):
+        importer("not a list of cases")
+
+
+def test_resume_skips_cases_committed_by_the_interrupted_run(importer, monkeypatch):
+    cases = [_case(case_id, [f"step {case_id}"]) for case_id in range(10)]
+    cases[4]["custom_steps_separated"][0]["content"] = "FAIL"
+    importer(cases, embed_batch_size=1)
+    assert importer.stats.failed == 1
+
+    embedded = []
+
+    def recording_embeddings(texts, model=None, dimensions=None):
+        embedded.extend(texts)
+        return _fake_embeddings(texts)
+
+    monkeypatch.setattr(json_to_vector, "generate_embeddings", recording_embeddings)
+    cases[4]["custom_steps_separated"][0]["content"] = "step 4"
+    indexed = importer(cases, embed_batch_size=1, resume=True)
+    assert importer.stats.resumed == 9
+    assert len(embedded) == 1 and "step 4" in embedded[0]
+    assert sorted(indexed) == [f"{case_id}:0" for case_id in range(10)]
+
+
+def test_dedup_folds_clones_only_within_a_section_and_priority(importer):
+    steps = [f"open the settings page {i} and verify toggle {i} is saved" for i in range(12)]
+    other_section = {**_case(3, steps), "section_id": 8}
+    indexed = importer([_case(1, steps), _case(2, steps), other_section], dedup_threshold=0.75, chunk_tokens=512)
+
+    assert sorted(indexed) == ["1:0", "3:0"]
+    assert importer.stats.duplicates == 1
+    metadatas = json_to_vector.import_collection().get(ids=["1:0", "3:0"], include=["metadatas"])["metadatas"]
+    assert [metadata.get("duplicate_ids") for metadata in metadatas] == ["2", None]
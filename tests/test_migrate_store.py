@@ -0,0 +1,218 @@
+# test_migrate_store.py
+import functools
+import json
+import os
+
+import chromadb
+import faiss
+import numpy as np
+import pytest
+
+import utils.vector_db_faiss as vdb
+import utils.migrate_store as migrate_store
+from utils.migrate_store import chroma_to_faiss, faiss_to_chroma
+
+
+def _vectors(n, dimension=16, seed=0):
+    return np.random.RandomState(seed).rand(n, dimension).astype("float32")
+
+
+def _collection(chroma_path, name):
+    return chromadb.PersistentClient(path=chroma_path).get_or_create_collection(name=name, embedding_function=None)
+
+
+def _by_id(collection):
+    page = collection.get(include=["embeddings", "documents", "metadatas"])
+    return {doc_id: (np.asarray(embedding), document, metadata)
+            for doc_id, embedding, document, metadata in zip(page["ids"], page["embeddings"],
+                                                             page["documents"], page["metadatas"])}
+
+
+def _snapshot(vectors, index):
+    """Publish `vectors` in a snapshot of `index`, keeping full vectors as a writer would."""
+    dimension = vectors.shape[1]
+    vdb.INDEX, vdb.METADATA, vdb.PENDING = vdb.train_faiss_index(index, vectors), [], []
+    vdb.ROW_KEYS, vdb.WAL, vdb.DIMENSION = None, None, dimension
+    vdb.FULL_VECTORS = vdb.open_full_vectors(vdb.VECTORS_FILE, vdb.INDEX, dimension=dimension)
+    vdb.add_embeddings(vectors, [f"case {i}" for i in range(len(vectors))])
+    vdb.save_faiss_index(final=True)
+    return vdb.SNAPSHOTS.current()
+
+
+def _live(dimension=16):
+    vdb.initialize_faiss_index(dimension)
+    rows, vectors, metadata, keys = vdb.live_snapshot(vdb.INDEX, vdb.ROW_KEYS, vdb.METADATA, vdb.FULL_VECTORS)
+    return {key: (vector, item) for key, vector, item in zip(keys, vectors, metadata)}
+
+
+def test_chroma_to_faiss_to_chroma_keeps_ids_and_metadata(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    chroma_path = str(tmp_path / "chroma")
+    ids = ["1:0", "1:1", "2:0", "3:0"]
+    metadatas = [{"parent_id": "1", "chunk_index": 0, "priority_id": 2, "section_id": 7},
+                 {"parent_id": "1", "chunk_index": 1, "priority_id": 2, "section_id": 7},
+                 {"parent_id": "2", "chunk_index": 0, "priority_id": 3, "section_id": 8, "duplicate_ids": "5,6"},
+                 None]
+    vectors = _vectors(4)
+    _collection(chroma_path, "source").add(ids=ids, embeddings=vectors, metadatas=metadatas,
+                                           documents=["one a", "one b", "two", "three"])
+
+    assert chroma_to_faiss(chroma_path, "source", batch_size=3) == 4
+    vdb.initialize_faiss_index(16)
+    # Chroma ids are the row keys, and the filter fields come from Chroma metadata
+    assert [vdb.ROW_KEYS.keys[row] for row in range(4)] == ids
+    assert vdb.METADATA[0] == {**metadatas[0], "text": "one a"} and vdb.METADATA[3] == "three"
+    hits = vdb.search_similar_batch(vectors[:1], top_k=5, filters={"section_id": [7]})[0]
+    assert [hit["id"] for hit in hits] == ["1:0", "1:1"]
+    # Upserting by Chroma id replaces the row instead of adding a second one
+    assert vdb.upsert_embeddings(["2:0"], vectors[2:3] + 1, [{**metadatas[2], "text": "two v2"}]) == 1
+    vdb.save_faiss_index(final=True)
+
+    assert faiss_to_chroma(chroma_path=chroma_path, collection_name="copy", batch_size=2) == 4
+    source, copy = _by_id(_collection(chroma_path, "source")), _by_id(_collection(chroma_path, "copy"))
+    assert sorted(copy) == ids
+    for doc_id in ["1:0", "1:1", "3:0"]:
+        np.testing.assert_allclose(copy[doc_id][0], source[doc_id][0], rtol=1e-6)
+        assert copy[doc_id][1:] == source[doc_id][1:]
+    np.testing.assert_allclose(copy["2:0"][0], vectors[2] + 1, rtol=1e-6)
+    assert copy["2:0"][1:] == ("two v2", metadatas[2])
+
+
+@pytest.mark.parametrize("index_type, storage, metric, coarse_dimension", [
+    ("ivf_flat", "fp16", "ip", 0),
+    ("hnsw", "float32", "l2", 8),
+])
+def test_chroma_to_faiss_builds_the_configured_index(tmp_path, monkeypatch, index_type, storage, metric,
+                                                     coarse_dimension):
+    monkeypatch.chdir(tmp_path)
+    chroma_path = str(tmp_path / "chroma")
+    vectors = _vectors(600, dimension=32, seed=5)
+    _collection(chroma_path, "source").add(ids=[f"C{i}" for i in range(600)], embeddings=vectors,
+                                           documents=[f"case {i}" for i in range(600)])
+    monkeypatch.setattr(migrate_store, "build_faiss_index", functools.partial(
+        vdb.build_faiss_index, index_type=index_type, nlist=8, metric=metric, storage=storage,
+        coarse_dimension=coarse_dimension))
+
+    # An IVF index needs 8 * 64 vectors to train on, more than the first pages hold
+    assert chroma_to_faiss(chroma_path, "source", batch_size=100) == 600
+    index = vdb.initialize_faiss_index(32)
+    assert (vdb.index_type_of(index), vdb.storage_of(index), vdb.metric_of(index)) == (index_type, storage, metric)
+    assert index.d == (coarse_dimension or 32) and len(vdb.FULL_VECTORS) == 600
+    expected = vdb.prepare_vectors(vectors, index)
+    np.testing.assert_allclose(vdb.FULL_VECTORS.take([0, 599]), expected[[0, 599]], rtol=1e-6)
+    assert vdb.search_similar_batch(vectors[42:43], top_k=1)[0][0]["id"] == "C42"
+
+
+def test_chroma_to_faiss_refuses_to_drop_unmerged_changes_unless_forced(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    chroma_path = str(tmp_path / "chroma")
+    _collection(chroma_path, "source").add(ids=["C1", "C2"], embeddings=_vectors(2), documents=["one", "two"])
+    vdb.initialize_faiss_index(16, index_type="flat")
+    vdb.add_embeddings(_vectors(3, seed=6), ["a", "b", "c"])
+    vdb.save_faiss_index()
+
+    with pytest.raises(ValueError, match="--force"):
+        chroma_to_faiss(chroma_path, "source")
+    assert chroma_to_faiss(chroma_path, "source", force=True) == 2
+    vdb.initialize_faiss_index(16)
+    assert list(vdb.METADATA) == ["one", "two"]
+
+
+def test_faiss_to_chroma_skips_deleted_rows_and_refuses_unmerged_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    chroma_path = str(tmp_path / "chroma")
+    vectors = _vectors(10, seed=2)
+    vdb.initialize_faiss_index(16, index_type="flat")
+    vdb.add_embeddings(vectors[:2], ["unkeyed 0", "unkeyed 1"])
+    vdb.upsert_embeddings([f"C{i}" for i in range(2, 10)], vectors[2:], [f"case {i}" for i in range(2, 10)])
+    vdb.upsert_embeddings(["C3"], vectors[3:4] + 1, ["case 3 v2"])
+    vdb.delete_embeddings(["C4"])
+
+    # The deletes and the replacement are only in the log so far
+    vdb.save_faiss_index()
+    with pytest.raises(ValueError, match="save_faiss_index"):
+        faiss_to_chroma(chroma_path=chroma_path, collection_name="exported")
+
+    vdb.save_faiss_index(final=True)
+    assert faiss_to_chroma(chroma_path=chroma_path, collection_name="exported", batch_size=3) == 9
+    exported = _by_id(_collection(chroma_path, "exported"))
+    assert sorted(exported) == sorted(["faiss-0", "faiss-1"] + [f"C{i}" for i in range(2, 10) if i != 4])
+    assert exported["C3"][1] == "case 3 v2"
+    np.testing.assert_allclose(exported["C3"][0], vectors[3] + 1, rtol=1e-6)
+
+
+def test_faiss_to_chroma_to_faiss_keeps_keys_and_items(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    chroma_path = str(tmp_path / "chroma")
+    vectors = _vectors(300, seed=1)
+    items = [f"case {i}" for i in range(300)]
+    items[4] = {"text": "case 4", "duplicate_ids": "C9,C10", "duplicate_count": 2}
+    vdb.initialize_faiss_index(16, index_type="flat")
+    vdb.upsert_embeddings([f"C{i}" for i in range(300)], vectors, items,
+                          fields=[{"priority_id": i % 4, "section_id": i % 5} for i in range(300)])
+    vdb.save_faiss_index(final=True)
+    before = _live()
+
+    assert faiss_to_chroma(chroma_path=chroma_path, collection_name="exported", batch_size=64) == 300
+    exported = _by_id(_collection(chroma_path, "exported"))
+    assert exported["C4"][1:] == ("case 4", {"duplicate_ids": "C9,C10", "duplicate_count": 2})
+    assert exported["C5"][1:] == ("case 5", None)
+
+    assert chroma_to_faiss(chroma_path, "exported", batch_size=64) == 300
+    after = _live()
+    assert sorted(after) == sorted(before)
+    for key, (vector, item) in before.items():
+        np.testing.assert_allclose(after[key][0], vector, rtol=1e-6)
+        assert after[key][1] == item
+
+
+def test_faiss_to_chroma_exports_an_index_saved_before_snapshots_without_converting_it(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    chroma_path = str(tmp_path / "chroma")
+    vectors = _vectors(50, seed=4)
+    index = faiss.IndexFlatL2(16)
+    index.add(vectors)
+    faiss.write_index(index, vdb.INDEX_FILE)
+    with open(vdb.LEGACY_METADATA_FILE, "w", encoding="utf-8") as f:
+        json.dump([f"case {i}" for i in range(50)], f)
+    layout = sorted(os.listdir(tmp_path))
+
+    assert faiss_to_chroma(chroma_path=chroma_path, collection_name="exported") == 50
+    exported = _by_id(_collection(chroma_path, "exported"))
+    assert exported["faiss-7"][1:] == ("case 7", None)
+    np.testing.assert_allclose(exported["faiss-7"][0], vectors[7], rtol=1e-6)
+    # The JSON file is read as is; no blob store or snapshot is written
+    assert sorted(os.listdir(tmp_path)) == sorted(layout + ["chroma"])
+
+
+@pytest.mark.parametrize("index_type, storage, metric, coarse_dimension", [
+    ("flat", "float32", "l2", 0),
+    ("flat", "int8", "ip", 0),
+    ("ivf_flat", "float32", "l2", 0),
+    ("ivf_flat", "fp16", "l2", 0),
+    ("ivf_pq", "float32", "l2", 0),
+    ("hnsw", "int8", "l2", 0),
+    ("hnsw", "float32", "ip", 8),
+])
+def test_faiss_to_chroma_exports_full_precision_vectors(tmp_path, monkeypatch, index_type, storage, metric,
+                                                        coarse_dimension):
+    monkeypatch.chdir(tmp_path)
+    chroma_path = str(tmp_path / "chroma")
+    vectors = _vectors(10000 if index_type == "ivf_pq" else 2000, dimension=32, seed=3)
+    index = vdb.build_faiss_index(32, index_type, nlist=8, pq_m=8, metric=metric, storage=storage,
+                                  coarse_dimension=coarse_dimension)
+    snapshot = _snapshot(vectors, index)
+    assert vdb.index_type_of(vdb.INDEX) == index_type
+
+    assert faiss_to_chroma(chroma_path=chroma_path, collection_name="exported") == len(vectors)
+    exported = _by_id(_collection(chroma_path, "exported"))
+    expected = vdb.prepare_vectors(vectors, vdb.INDEX)
+    for row in range(0, len(vectors), 97):
+        np.testing.assert_allclose(exported[f"faiss-{row}"][0], expected[row], rtol=1e-6)
+
+    if storage != "float32":
+        # Without the full vectors, the approximate ones the index reconstructs are exported
+        os.remove(os.path.join(snapshot, vdb.VECTORS_FILE))
+        assert faiss_to_chroma(chroma_path=chroma_path, collection_name="approximate") == len(vectors)
+        approximate = _by_id(_collection(chroma_path, "approximate"))
+        np.testing.assert_allclose(approximate["faiss-5"][0], expected[5], atol=0.05)
@@ -0,0 +1,127 @@
+# test_rate_limiter.py
+import functools
+import os
+import sqlite3
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+import utils.rate_limiter as rate_limiter
+from config import parse_model_limits
+from utils.rate_limiter import RateLimiter, call_with_rate_limit, retry_after_seconds
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake clock for the limiter: sleeping advances it instead of waiting."""
+    now = [1_000_000.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(time=lambda: now[0], sleep=sleep))
+    monkeypatch.setattr(rate_limiter.random, "uniform", lambda low, high: low)
+    return SimpleNamespace(now=now, slept=slept)
+
+
+def _bucket(path, name):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT requests, tokens, blocked_until FROM buckets WHERE name = ?", (name,)).fetchone()
+
+
+def _rate_limit_error(headers):
+    response = httpx.Response(429, headers=headers, request=httpx.Request("POST", "https://api.openai.com/v1/x"))
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def test_token_bucket_waits_for_requests_and_tokens_to_refill(tmp_path, clock):
+    limiter = RateLimiter("chat:test", rpm=60, tpm=600, path=str(tmp_path / "limits.db"))
+    for _ in range(6):
+        limiter.acquire(100)
+    assert clock.slept == []
+
+    # The token bucket is empty: 100 more tokens refill in 10 seconds
+    limiter.acquire(100)
+    assert sum(clock.slept) == pytest.approx(10.0, abs=0.01)
+
+    # A reported usage below the estimate gives the difference back
+    limiter.reconcile(100, 40)
+    assert _bucket(limiter.path, limiter.name)[1] == pytest.approx(60.0, abs=0.1)
+
+
+def test_a_request_above_the_tpm_limit_is_reconciled_against_what_it_took(tmp_path, clock):
+    limiter = RateLimiter("chat:large", rpm=60, tpm=600, path=str(tmp_path / "limits.db"))
+    response = SimpleNamespace(usage=SimpleNamespace(total_tokens=500))
+    # Estimated at 900 tokens, only the 600 the bucket holds are taken
+    call_with_rate_limit(limiter, lambda: response, estimated_tokens=900)
+    assert _bucket(limiter.path, limiter.name)[1] == pytest.approx(100.0, abs=0.1)
+
+
+def test_processes_share_one_bucket_and_pause(tmp_path, clock):
+    path = str(tmp_path / "limits.db")
+    code = ("from utils.rate_limiter import RateLimiter; "
+            f"limiter = RateLimiter('embeddings:test', rpm=6, tpm=10**6, path={path!r}); "
+            "[limiter.acquire(1) for _ in range(6)]")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True,
+                            env=dict(os.environ, PYTHONPATH=ROOT))
+    assert result.returncode == 0, result.stderr
+    # The other process took the whole minute's budget
+    assert _bucket(path, "embeddings:test")[0] < 1
+
+    first = RateLimiter("chat:shared", rpm=600, tpm=10**6, path=path)
+    second = RateLimiter("chat:shared", rpm=600, tpm=10**6, path=path)
+    first.pause(30)
+    second.acquire(1)
+    assert sum(clock.slept) == pytest.approx(30.0, abs=0.01)
+
+
+def test_retry_after_header_parsing():
+    assert retry_after_seconds(_rate_limit_error({"retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(_rate_limit_error({"retry-after": "7"})) == 7.0
+    assert retry_after_seconds(_rate_limit_error({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+    assert retry_after_seconds(_rate_limit_error({"retry-after": "soon"})) is None
+    assert retry_after_seconds(_rate_limit_error({})) is None
+
+
+def test_call_with_rate_limit_retries_429s_and_reconciles_usage(tmp_path, clock):
+    limiter = RateLimiter("chat:retry", rpm=600, tpm=10**6, path=str(tmp_path / "limits.db"))
+    errors = [_rate_limit_error({"retry-after": "soon"}), _rate_limit_error({"retry-after": "3"})]
+
+    def request():
+        if errors:
+            raise errors.pop(0)
+        return SimpleNamespace(usage=SimpleNamespace(total_tokens=10))
+
+    response = call_with_rate_limit(limiter, request, estimated_tokens=500)
+    assert response.usage.total_tokens == 10
+    # The malformed header falls back to the 1s base backoff; the next one asks for 3s
+    assert clock.slept == pytest.approx([1.0, 3.0], abs=0.01)
+
+    errors.extend([_rate_limit_error({})] * 3)
+    with pytest.raises(openai.RateLimitError):
+        call_with_rate_limit(limiter, request, estimated_tokens=1, max_retries=2)
+
+
+def test_each_model_has_its_own_bucket(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_LIMITERS", {})
+    monkeypatch.setattr(rate_limiter, "RateLimiter", functools.partial(RateLimiter, path=str(tmp_path / "limits.db")))
+    monkeypatch.setattr(rate_limiter, "OPENAI_MODEL_LIMITS", {"gpt-4o-mini": (30, 200000)})
+
+    large = rate_limiter.get_rate_limiter("chat", "gpt-4o")
+    mini = rate_limiter.get_rate_limiter("chat", "gpt-4o-mini")
+    assert large is rate_limiter.get_rate_limiter("chat", "gpt-4o")
+    assert (large.name, large.rpm, large.tpm) == ("chat:gpt-4o", rate_limiter.OPENAI_CHAT_RPM, rate_limiter.OPENAI_CHAT_TPM)
+    assert (mini.name, mini.rpm, mini.tpm) == ("chat:gpt-4o-mini", 30, 200000)
+
+
+def test_malformed_model_limits_fall_back_to_the_defaults():
+    assert parse_model_limits("") == {}
+    assert parse_model_limits("gpt-4o-mini=500:200000, gpt-4o=fast,o1=5:6:7,broken") == {"gpt-4o-mini": (500, 200000)}
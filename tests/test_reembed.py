@@ -0,0 +1,112 @@
+# test_reembed.py
+import zlib
+
+import chromadb
+import numpy as np
+import pytest
+
+import utils.reembed as reembed
+from utils.index_versions import (BASE_COLLECTION, activate_version, get_active_version, load_registry,
+                                  version_name)
+
+
+def _vector(text, dimension):
+    return np.random.RandomState(zlib.crc32(text.encode())).rand(dimension).astype("float32")
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """A Chroma directory whose base collection holds 30 documents, with embeddings computed locally."""
+    chroma_path = str(tmp_path / "chroma")
+    client = chromadb.PersistentClient(path=chroma_path)
+    source = client.create_collection(name=BASE_COLLECTION, embedding_function=None)
+    documents = [f"test case {i}: open page {i} and check the total" for i in range(30)]
+    source.add(ids=[str(i) for i in range(30)], documents=documents,
+               embeddings=[_vector(document, 4) for document in documents],
+               metadatas=[{"section_id": i % 3} for i in range(30)])
+
+    embedded = []
+
+    def fake_embeddings(texts, model=None, dimensions=None):
+        embedded.extend(texts)
+        return [_vector(text, dimensions) for text in texts]
+
+    monkeypatch.setattr(reembed, "generate_embeddings", fake_embeddings)
+    return chroma_path, source, embedded
+
+
+def _target(chroma_path, name):
+    return chromadb.PersistentClient(path=chroma_path).get_collection(
+        name=load_registry(chroma_path)["versions"][name]["collection"], embedding_function=None)
+
+
+def test_reembed_copies_every_document_then_swaps_and_rolls_back(store, monkeypatch):
+    chroma_path, source, embedded = store
+    old = get_active_version(chroma_path)["name"]
+    original = reembed.sync_pass
+
+    def import_during_first_pass(source, target, version, progress, *args):
+        # A document imported while the first pass runs is carried over by the next one
+        if progress.pass_number == 1:
+            source.add(ids=["late"], documents=["imported during the migration"], embeddings=[[0.0] * 4])
+        return original(source, target, version, progress, *args)
+
+    monkeypatch.setattr(reembed, "sync_pass", import_during_first_pass)
+    recall = reembed.reembed("fake-model", 8, chroma_path, batch_size=7, recall_sample=10)
+
+    new = version_name("fake-model", 8)
+    registry = load_registry(chroma_path)
+    assert registry["active"] == new
+    assert registry["versions"][new]["status"] == "active" and registry["versions"][old]["status"] == "retired"
+    assert registry["versions"][new]["recall"] == recall and recall["sample"] == 10
+    assert get_active_version(chroma_path)["collection"] == f"{BASE_COLLECTION}__{new}"
+
+    page = _target(chroma_path, new).get(include=["documents", "metadatas", "embeddings"])
+    expected = source.get(include=["documents", "metadatas"])
+    assert sorted(zip(page["ids"], page["documents"])) == sorted(zip(expected["ids"], expected["documents"]))
+    assert dict(zip(page["ids"], page["metadatas"]))["7"] == {"section_id": 1}
+    assert len(page["embeddings"][0]) == 8
+    assert sorted(embedded) == sorted(expected["documents"])
+
+    # Rolling back is one registry write; the new version stays built for another swap
+    assert activate_version(chroma_path, old) == new
+    registry = load_registry(chroma_path)
+    assert registry["active"] == old and registry["versions"][new]["status"] == "retired"
+    assert get_active_version(chroma_path)["collection"] == BASE_COLLECTION
+    with pytest.raises(ValueError):
+        activate_version(chroma_path, "missing-version")
+
+
+def test_interrupted_reembed_resumes_without_re_embedding_finished_documents(store, monkeypatch):
+    chroma_path, source, embedded = store
+    fake_embeddings = reembed.generate_embeddings
+
+    def quota_after_two_batches(texts, model=None, dimensions=None):
+        if len(embedded) >= 20:
+            raise RuntimeError("quota exceeded")
+        return fake_embeddings(texts, model, dimensions)
+
+    monkeypatch.setattr(reembed, "generate_embeddings", quota_after_two_batches)
+    with pytest.raises(RuntimeError):
+        reembed.reembed("fake-model", 8, chroma_path, batch_size=10)
+    new = version_name("fake-model", 8)
+    assert load_registry(chroma_path)["versions"][new]["status"] == "building"
+    assert get_active_version(chroma_path)["name"] != new
+    assert _target(chroma_path, new).count() == 20
+
+    # Meanwhile one document changes, one is relabelled and one is deleted
+    source.update(ids=["3"], documents=["test case 3: rewritten"], embeddings=[[0.0] * 4])
+    source.update(ids=["25"], metadatas=[{"section_id": 9}])
+    source.delete(ids=["29"])
+    embedded.clear()
+    monkeypatch.setattr(reembed, "generate_embeddings", fake_embeddings)
+    reembed.reembed("fake-model", 8, chroma_path, batch_size=10, swap=False)
+
+    # Only the rows the first run never wrote, and the changed one, are embedded again
+    assert sorted(embedded) == sorted(["test case 3: rewritten"] +
+                                      [f"test case {i}: open page {i} and check the total" for i in range(20, 29)])
+    target = _target(chroma_path, new)
+    assert target.count() == 29
+    assert target.get(ids=["25"], include=["metadatas"])["metadatas"] == [{"section_id": 9}]
+    registry = load_registry(chroma_path)
+    assert registry["versions"][new]["status"] == "ready" and registry["active"] != new
@@ -0,0 +1,42 @@
+# test_sharded_index.py
+import numpy as np
+
+from utils.sharded_index import ShardedIndex, build_shards
+from utils.vector_db_faiss import build_faiss_index
+
+
+def _vectors(seed, n=600, dimension=16):
+    return np.random.RandomState(seed).rand(n, dimension).astype("float32")
+
+
+def test_merged_top_k_matches_exact_search(tmp_path):
+    vectors = _vectors(0)
+    keys = [f"C{row}" for row in range(len(vectors))]
+    index = ShardedIndex(root=str(tmp_path), num_shards=3, dimension=16, index_type="flat")
+    index.add(vectors, keys, keys)
+    # Re-adding a key replaces its row in the same shard
+    assert index.add(vectors[:5] + 5, ["moved"] * 5, keys[:5]) == 5
+    assert index.delete(keys[5:10] + ["unknown"]) == 5
+    assert index.tombstones() == 10
+
+    exact = build_faiss_index(16, "flat")
+    exact.add(vectors[10:])
+    queries = _vectors(1, n=20)
+    _, expected = exact.search(queries, 8)
+    results = index.search_batch(queries, top_k=8)
+    assert [[hit["id"] for hit in hits] for hits in results] == [[keys[row + 10] for row in rows] for rows in expected]
+    assert all(hits[0]["distance"] <= hits[-1]["distance"] for hits in results)
+    index.close()
+
+
+def test_build_shards_in_worker_processes(tmp_path):
+    vectors = _vectors(2)
+    root = str(tmp_path / "shards")
+    counts = build_shards(vectors, [str(row) for row in range(len(vectors))], root=root, num_shards=4,
+                          index_type="flat", workers=2)
+    assert counts == [150, 150, 150, 150]
+
+    index = ShardedIndex(root=root, read_only=True)
+    assert index.num_shards == 4
+    assert [index.search(vectors[row], top_k=1) for row in (0, 301, 599)] == [["0"], ["301"], ["599"]]
+    index.close()
@@ -0,0 +1,112 @@
+# test_testrail_api.py
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+import json
+
+import pytest
+
+import utils.testrail_api as testrail
+
+# project id -> suite id -> number of cases
+LAYOUT = {1: {10: 620, 11: 3}, 2: {20: 0}, 3: {30: 251}}
+
+
+def make_cases():
+    cases = {}
+    for project_id, suites in LAYOUT.items():
+        for suite_id, count in suites.items():
+            cases[suite_id] = [
+                {"id": suite_id * 1000 + i, "suite_id": suite_id, "title": f"Case {i}", "updated_on": 1000 + i}
+                for i in range(count)
+            ]
+    return cases
+
+
+class FakeTestRail(BaseHTTPRequestHandler):
+    cases = make_cases()
+    requests_seen = Counter()
+    throttle_once = set()
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        # TestRail routes on the query string: /index.php?/api/v2/<endpoint>&<params>
+        endpoint, _, query = self.path.split("?", 1)[1].partition("&")
+        params = dict(parse_qsl(query))
+        endpoint = endpoint[len("/api/v2/"):]
+        self.requests_seen[endpoint.split("/")[0]] += 1
+
+        if self.headers.get("Authorization") is None:
+            return self.respond(401, {"error": "Authentication failed"})
+
+        if endpoint in self.throttle_once:
+            self.throttle_once.discard(endpoint)
+            return self.respond(429, {"error": "API rate limit exceeded"}, {"Retry-After": "0"})
+
+        if endpoint == "get_projects":
+            return self.respond(200, {"offset": 0, "limit": 250, "size": len(LAYOUT), "_links": {"next": None},
+                                      "projects": [{"id": project_id} for project_id in LAYOUT]})
+        if endpoint.startswith("get_suites/"):
+            project_id = int(endpoint.split("/")[1])
+            return self.respond(200, [{"id": suite_id} for suite_id in LAYOUT[project_id]])
+        if endpoint.startswith("get_cases/"):
+            limit, offset = int(params["limit"]), int(params["offset"])
+            matching = [case for case in self.cases[int(params["suite_id"])]
+                        if case["updated_on"] > int(params.get("updated_after", 0))]
+            page = matching[offset:offset + limit]
+            has_next = offset + limit < len(matching)
+            return self.respond(200, {"offset": offset, "limit": limit, "size": len(page),
+                                      "_links": {"next": "/api/v2/get_cases/next" if has_next else None},
+                                      "cases": page})
+        return self.respond(400, {"error": f"Unknown method {endpoint}"})
+
+
+@pytest.fixture
+def server():
+    FakeTestRail.requests_seen.clear()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeTestRail)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_iter_cases_pulls_every_suite_once(server):
+    client = testrail.TestRailClient(server, "qa@example.com", "key", workers=4, page_size=100, pages_ahead=3)
+    FakeTestRail.throttle_once.add("get_suites/1")
+
+    cases = list(client.iter_cases())
+
+    expected = [case["id"] for suite in FakeTestRail.cases.values() for case in suite]
+    assert sorted(case["id"] for case in cases) == sorted(expected)
+    assert FakeTestRail.requests_seen["get_projects"] == 1
+
+
+def test_iter_cases_filters_by_project_and_updated_after(server):
+    client = testrail.TestRailClient(server, "qa@example.com", "key", page_size=100)
+
+    cases = list(client.iter_cases(project_ids=[1], updated_after=1600))
+
+    assert sorted(case["id"] for case in cases) == [10000 + i for i in range(601, 620)]
+    assert FakeTestRail.requests_seen["get_projects"] == 0
+
+
+def test_last_pull_round_trip(tmp_path):
+    path = tmp_path / "state.json"
+    assert testrail.load_last_pull(path) is None
+    testrail.save_last_pull(1234.9, path)
+    assert testrail.load_last_pull(path) == 1234
@@ -0,0 +1,26 @@
+# test_two_stage.py
+import numpy as np
+
+from utils.faiss_tune import _InMemoryVectors
+from utils.vector_db_faiss import build_faiss_index, coarsen, search_rows
+
+
+def test_coarse_candidates_are_reranked_at_full_dimension():
+    rng = np.random.RandomState(0)
+    vectors = (rng.randn(800, 16) @ rng.randn(16, 64)).astype("float32")
+    index = build_faiss_index(64, "flat", coarse_dimension=16)
+    assert index.d == 16
+    index.add(coarsen(vectors, index.d))
+
+    queries = vectors[:20] + 0.05
+    exact = build_faiss_index(64, "flat", coarse_dimension=0)
+    exact.add(vectors)
+    expected_distances, expected = exact.search(queries, 5)
+
+    full = _InMemoryVectors(vectors)
+    rows, distances = search_rows(index, queries, 5, full_vectors=full, candidates=len(vectors))
+    assert rows == expected.tolist()
+    assert np.allclose(distances, expected_distances, rtol=1e-4)
+    # Fewer candidates still return top_k rows, ordered by full-dimension distance
+    rows, distances = search_rows(index, queries, 5, full_vectors=full, candidates=50)
+    assert all(len(row) == 5 and row_distances == sorted(row_distances) for row, row_distances in zip(rows, distances))
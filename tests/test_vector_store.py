@@ -0,0 +1,51 @@
+# test_vector_store.py
+import threading
+
+import numpy as np
+
+from utils.vector_store import VectorStore
+
+
+def _vectors(seed, n=500, dimension=16):
+    return np.random.RandomState(seed).rand(n, dimension).astype("float32")
+
+
+def test_evicted_indexes_are_saved_and_reloaded(tmp_path):
+    store = VectorStore(root=str(tmp_path), dimension=16, index_type="flat", max_resident=2)
+    data = {f"project{i}": _vectors(i) for i in range(4)}
+    for name, vectors in data.items():
+        store.add(name, vectors, [f"{name}/{row}" for row in range(len(vectors))])
+
+    assert store.resident() == ["project2", "project3"]
+    assert store.names() == sorted(data)
+    # project0 was evicted; searching it loads it back from disk
+    assert store.search("project0", data["project0"][42], top_k=1) == ["project0/42"]
+    assert store.resident() == ["project3", "project0"]
+
+
+def test_searches_run_alongside_adds(tmp_path):
+    store = VectorStore(root=str(tmp_path), dimension=16, index_type="flat")
+    base = _vectors(0)
+    store.add("shared", base, [str(row) for row in range(len(base))])
+    errors = []
+
+    def search():
+        for row in range(0, len(base), 5):
+            if store.search("shared", base[row], top_k=1) != [str(row)]:
+                errors.append(row)
+
+    def add():
+        for batch in range(20):
+            store.add("shared", _vectors(100 + batch, n=10) + 10, ["new"] * 10)
+
+    threads = [threading.Thread(target=search) for _ in range(4)] + [threading.Thread(target=add)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(store.search_many("shared", base[:3], top_k=2)) == 3
+    store.close()
+    reopened = VectorStore(root=str(tmp_path), dimension=16, read_only=True)
+    assert reopened.search("shared", base[7] + 10, top_k=1) == ["new"]
@@ -0,0 +1,180 @@
+# utils/blob_store.py
+import json
+import mmap
+import os
+import shutil
+import zlib
+
+import numpy as np
+
+# Records shorter than this are stored raw; zlib only pays off on longer text
+COMPRESS_MIN_BYTES = 256
+COMPRESS_LEVEL = 6
+
+_RAW = b"\x00"
+_ZLIB = b"\x01"
+
+
+def encode_record(item, compress=True):
+    """Serialize one metadata item, zlib-compressing it when that helps."""
+    raw = json.dumps(item, ensure_ascii=False).encode("utf-8")
+    if compress and len(raw) >= COMPRESS_MIN_BYTES:
+        packed = zlib.compress(raw, COMPRESS_LEVEL)
+        if len(packed) < len(raw):
+            return _ZLIB + packed
+    return _RAW + raw
+
+
+def decode_record(blob):
+    body = bytes(blob[1:])
+    if blob[:1] == _ZLIB:
+        body = zlib.decompress(body)
+    return json.loads(body.decode("utf-8"))
+
+
+def offsets_path(path):
+    return f"{path}.offsets"
+
+
+class BlobStore:
+    """
+    Append-only, offset-indexed store of JSON records, used for the FAISS
+    metadata. Records live back to back in `path`; `path`.offsets holds
+    the end offset of each record as little-endian uint64. Both files are
+    memory-mapped, so opening is O(1) and a record is only decoded when it
+    is read. Processes sharing the files share their pages in the OS cache.
+
+    Behaves like a list for len(), indexing, slicing, append and extend.
+    Appends are buffered until flush(), which writes the data before the
+    offsets, so a reader or a crash never sees an offset without its record.
+    """
+
+    def __init__(self, path, compress=True, read_only=False):
+        self.path = path
+        self.compress = compress
+        self.read_only = read_only
+        self._pending = []
+        if not read_only:
+            self._repair()
+        self._map()
+
+    @classmethod
+    def write_all(cls, path, items, compress=True):
+        """
+        Replace the store at `path` with `items`. Each file is swapped in
+        atomically, but not the pair, so use this for offline rebuilds.
+        """
+        tmp_path = f"{path}.tmp"
+        for stale in (tmp_path, offsets_path(tmp_path)):
+            if os.path.exists(stale):
+                os.remove(stale)
+        store = cls(tmp_path, compress=compress)
+        store.extend(items)
+        store.flush()
+        count = len(store)
+        store.close()
+        os.replace(offsets_path(tmp_path), offsets_path(path))
+        os.replace(tmp_path, path)
+        return count
+
+    def _repair(self):
+        """Drop a torn tail left by an interrupted flush."""
+        for name in (self.path, offsets_path(self.path)):
+            if not os.path.exists(name):
+                open(name, "wb").close()
+        index_path = offsets_path(self.path)
+        count = os.path.getsize(index_path) // 8
+        if os.path.getsize(index_path) != count * 8:
+            os.truncate(index_path, count * 8)
+        end = 0
+        if count:
+            with open(index_path, "rb") as f:
+                f.seek((count - 1) * 8)
+                end = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+        if os.path.getsize(self.path) > end:
+            os.truncate(self.path, end)
+
+    def _map(self):
+        self._offsets = np.empty(0, dtype="<u8")
+        self._data = b""
+        index_path = offsets_path(self.path)
+        if not os.path.exists(index_path) or not os.path.exists(self.path):
+            return
+        count = os.path.getsize(index_path) // 8
+        if count:
+            self._offsets = np.memmap(index_path, dtype="<u8", mode="r", shape=(count,))
+        if os.path.getsize(self.path):
+            with open(self.path, "rb") as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # A reader may catch a writer between the data and offsets writes;
+        # only trust offsets whose record is fully on disk.
+        if count and int(self._offsets[-1]) > len(self._data):
+            self._offsets = self._offsets[:int(np.searchsorted(self._offsets, len(self._data), side="right"))]
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = b""
+        self._offsets = np.empty(0, dtype="<u8")
+
+    def __len__(self):
+        return len(self._offsets) + len(self._pending)
+
+    def _read(self, i):
+        stored = len(self._offsets)
+        if i >= stored:
+            return self._pending[i - stored]
+        start = int(self._offsets[i - 1]) if i else 0
+        return decode_record(self._data[start:int(self._offsets[i])])
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._read(i) for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("BlobStore index out of range")
+        return self._read(key)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._read(i)
+
+    def append(self, item):
+        if self.read_only:
+            raise ValueError(f"{self.path} is open read-only.")
+        self._pending.append(item)
+
+    def extend(self, items):
+        if self.read_only:
+            raise ValueError(f"{self.path} is open read-only.")
+        self._pending.extend(items)
+
+    def flush(self):
+        """Write buffered records to disk (data, then offsets, each fsynced)."""
+        if not self._pending:
+            return
+        end = int(self._offsets[-1]) if len(self._offsets) else 0
+        records = [encode_record(item, self.compress) for item in self._pending]
+        ends = end + np.cumsum([len(record) for record in records], dtype=np.uint64)
+        with open(self.path, "ab") as f:
+            f.write(b"".join(records))
+            f.flush()
+            os.fsync(f.fileno())
+        with open(offsets_path(self.path), "ab") as f:
+            f.write(ends.astype("<u8").tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending = []
+        self.close()
+        self._map()
+
+    def save_as(self, path):
+        """Write every record, buffered ones included, to a new store at `path`; this one is unchanged."""
+        for source, target in ((self.path, path), (offsets_path(self.path), offsets_path(path))):
+            if os.path.exists(source):
+                shutil.copyfile(source, target)
+        copy = BlobStore(path, compress=self.compress)
+        copy.extend(self._pending)
+        copy.flush()
+        copy.close()
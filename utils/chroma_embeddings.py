@@ -0,0 +1,37 @@
+# utils/chroma_embeddings.py
+import threading
+
+import numpy as np
+from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
+
+from utils.embeddings import generate_embeddings
+
+
+class CachedOpenAIEmbeddingFunction(OpenAIEmbeddingFunction):
+    """
+    Drop-in replacement for Chroma's OpenAIEmbeddingFunction that embeds
+    through utils.embeddings.generate_embeddings, so Chroma queries and
+    ingestion share the batching and the persistent embedding cache.
+
+    It keeps the parent's name and config, so collections created with the
+    stock OpenAI embedding function open with it unchanged.
+    """
+
+    def __call__(self, input):
+        texts = [input] if isinstance(input, str) else list(input)
+        vectors = generate_embeddings(texts, model=self.model_name, dimensions=self.dimensions)
+        return [np.asarray(vector, dtype=np.float32) for vector in vectors]
+
+
+_FUNCTIONS = {}
+_FUNCTIONS_LOCK = threading.Lock()
+
+
+def get_embedding_function(model_name, dimensions=None, api_key=None):
+    """Return the process-wide embedding function for `model_name` at `dimensions`."""
+    key = (model_name, dimensions, api_key)
+    with _FUNCTIONS_LOCK:
+        if key not in _FUNCTIONS:
+            _FUNCTIONS[key] = CachedOpenAIEmbeddingFunction(api_key=api_key, model_name=model_name,
+                                                            dimensions=dimensions)
+        return _FUNCTIONS[key]
@@ -0,0 +1,149 @@
+# utils/chroma_store.py
+import argparse
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from logger import logger
+from utils.index_versions import ActiveCollection, get_active_version, open_version_collection
+
+load_dotenv()
+
+# Process-wide Chroma clients, active-version readers and opened collections,
+# created on first use so importing a module that queries Chroma costs nothing
+_CLIENTS = {}
+_ACTIVE = {}
+_COLLECTIONS = {}
+_LOCK = threading.Lock()
+
+# Seconds spent on each stage of opening a Chroma directory, per path
+_TIMINGS = {}
+
+
+def _record(chroma_path, stage, seconds):
+    _TIMINGS.setdefault(chroma_path, {})[stage] = round(seconds, 4)
+
+
+def get_client(chroma_path):
+    """Return the process-wide PersistentClient of `chroma_path`, opening it on first use."""
+    with _LOCK:
+        if chroma_path not in _CLIENTS:
+            started = time.perf_counter()
+            import chromadb
+            imported = time.perf_counter()
+            _CLIENTS[chroma_path] = chromadb.PersistentClient(path=chroma_path)
+            _record(chroma_path, "import_chromadb", imported - started)
+            _record(chroma_path, "open_client", time.perf_counter() - imported)
+            logger.debug(f"Opened Chroma client at {chroma_path} in {time.perf_counter() - started:.2f}s.")
+        return _CLIENTS[chroma_path]
+
+
+def get_active_collection(chroma_path, api_key=None):
+    """
+    Return the process-wide ActiveCollection of `chroma_path`, which follows
+    the active index version. Nothing is opened until its get() is called.
+    """
+    client = get_client(chroma_path)
+    with _LOCK:
+        if chroma_path not in _ACTIVE:
+            _ACTIVE[chroma_path] = ActiveCollection(client, chroma_path, api_key)
+        return _ACTIVE[chroma_path]
+
+
+def get_version_collection(chroma_path, version=None, api_key=None):
+    """
+    Open the collection of an index version (the active one by default)
+    once per process.
+
+    Returns:
+        tuple: (collection, embedding function, version)
+    """
+    version = version or get_active_version(chroma_path)
+    client = get_client(chroma_path)
+    with _LOCK:
+        key = (chroma_path, version["collection"])
+        if key not in _COLLECTIONS:
+            collection, embedding_function = open_version_collection(client, version, api_key)
+            _COLLECTIONS[key] = (collection, embedding_function, version)
+        return _COLLECTIONS[key]
+
+
+def warm_up(chroma_path, api_key=None):
+    """
+    Open everything a first query needs: the client, the active version's
+    embedding function and collection, and the collection's vector index,
+    which Chroma only loads from disk when it is first searched.
+
+    Returns:
+        dict: Seconds spent per stage (import_chromadb, open_client,
+              embedding_function, get_collection, load_index) and their total,
+              including stages that ran before warm_up() was called.
+    """
+    active = get_active_collection(chroma_path, api_key)
+    collection, _, version = active.get()
+    timings = _TIMINGS.setdefault(chroma_path, {})
+    timings.update({stage: round(seconds, 4) for stage, seconds in active.timings.items()})
+    loading = time.perf_counter()
+    if collection.count():
+        collection.query(query_embeddings=[[0.0] * version["dimension"]], n_results=1, include=[])
+        _record(chroma_path, "load_index", time.perf_counter() - loading)
+    timings["total"] = round(sum(seconds for stage, seconds in timings.items() if stage != "total"), 4)
+    logger.info(f"Chroma at {chroma_path} ready in {timings['total']:.2f}s: "
+                + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items() if stage != "total"))
+    return dict(timings)
+
+
+def warm_up_in_background(chroma_path, api_key=None):
+    """
+    Run warm_up() on a daemon thread, so an interactive caller can start
+    right away. A query made before it finishes waits for the same
+    singletons instead of opening its own. Failures are logged, not raised;
+    the first query will report them again.
+
+    Returns:
+        threading.Thread: The warm-up thread.
+    """
+    def run():
+        try:
+            warm_up(chroma_path, api_key)
+        except Exception as e:
+            logger.error(f"Warming up Chroma at {chroma_path} failed: {e}")
+
+    thread = threading.Thread(target=run, name="chroma-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def reset(chroma_path):
+    """
+    Close the process-wide client of `chroma_path` and forget what was
+    opened through it. The next get_client() starts a fresh Chroma system,
+    which loads each index from disk again, e.g. to pick up a changed
+    search_ef.
+    """
+    with _LOCK:
+        client = _CLIENTS.pop(chroma_path, None)
+        _ACTIVE.pop(chroma_path, None)
+        for key in [key for key in _COLLECTIONS if key[0] == chroma_path]:
+            del _COLLECTIONS[key]
+        _TIMINGS.pop(chroma_path, None)
+    if client is not None:
+        client.close()
+
+
+def open_timings(chroma_path):
+    """Seconds spent so far on each stage of opening `chroma_path`."""
+    return dict(_TIMINGS.get(chroma_path, {}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Open a Chroma directory and report where the time goes.")
+    parser.add_argument("--chroma-path", default="./chroma_db", help="Chroma persistent client directory.")
+    args = parser.parse_args()
+
+    report = warm_up(args.chroma_path, os.getenv("OPENAI_API_KEY"))
+    print(f"{'stage':<20}{'seconds':>10}")
+    for stage, seconds in report.items():
+        print(f"{stage:<20}{seconds:>10.3f}")
@@ -0,0 +1,207 @@
+# utils/chroma_tune.py
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+from logger import logger
+
+from config import CHROMA_HNSW_SPACE, CHROMA_HNSW_M, CHROMA_HNSW_CONSTRUCTION_EF, CHROMA_HNSW_SEARCH_EF
+from utils.chroma_store import get_client, reset
+from utils.index_versions import apply_search_ef, get_active_version, hnsw_configuration
+
+load_dotenv()
+
+CHROMA_PATH = "./chroma_db"
+
+# Embeddings held out of the copied collection and used as queries
+QUERY_SAMPLE = 200
+TOP_K = 10
+
+SPACES = ("cosine", "l2", "ip")
+M_SWEEP = (16, 32)
+CONSTRUCTION_EF_SWEEP = (100, 200)
+SEARCH_EF_SWEEP = (10, 25, 50, 100, 200)
+
+BATCH_SIZE = 5000
+SWEEP_COLLECTION = "hnsw_sweep"
+
+
+def load_embeddings(chroma_path, collection_name=None, limit=0, batch_size=BATCH_SIZE):
+    """
+    Page the ids and embeddings out of a collection (by default the active
+    index version's), up to `limit` of them if set.
+
+    Returns:
+        tuple: (list of ids, float32 array of embeddings)
+    """
+    collection_name = collection_name or get_active_version(chroma_path)["collection"]
+    collection = get_client(chroma_path).get_collection(name=collection_name, embedding_function=None)
+    ids, embeddings = [], []
+    while not limit or len(ids) < limit:
+        size = min(batch_size, limit - len(ids)) if limit else batch_size
+        page = collection.get(include=["embeddings"], limit=size, offset=len(ids))
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        embeddings.append(np.asarray(page["embeddings"], dtype=np.float32))
+    if not ids:
+        raise ValueError(f"Collection '{collection_name}' in {chroma_path} is empty.")
+    return ids, np.concatenate(embeddings)
+
+
+def exact_neighbours(corpus, queries, k, space, batch_size=64):
+    """Rows of `corpus` nearest each query under Chroma's distance for `space`, nearest first."""
+    if space == "cosine":
+        corpus = corpus / np.maximum(np.linalg.norm(corpus, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    squared_norms = (corpus ** 2).sum(axis=1)
+    neighbours = []
+    for i in range(0, len(queries), batch_size):
+        scores = queries[i:i + batch_size] @ corpus.T
+        distances = squared_norms - 2 * scores if space == "l2" else -scores
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(distances, nearest, axis=1).argsort(axis=1)
+        neighbours.extend(np.take_along_axis(nearest, order, axis=1).tolist())
+    return neighbours
+
+
+def _reopen(path):
+    """
+    Open the sweep collection in a fresh Chroma system. Chroma reads
+    search_ef when it loads an index, so a changed value only applies to a
+    process (or here, a system) that has not loaded it yet.
+    """
+    reset(path)
+    return get_client(path).get_collection(name=SWEEP_COLLECTION, embedding_function=None)
+
+
+def time_queries(collection, queries, k):
+    """
+    Query one embedding at a time, like the RAG engine does.
+
+    Returns:
+        tuple: (ids found per query, latency per query in milliseconds)
+    """
+    # The first query loads the index from disk; keep it out of the latencies
+    collection.query(query_embeddings=queries[:1], n_results=k, include=[])
+    found, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        result = collection.query(query_embeddings=query[None], n_results=k, include=[])
+        latencies.append((time.perf_counter() - started) * 1000)
+        found.append(result["ids"][0])
+    return found, latencies
+
+
+def sweep(chroma_path=CHROMA_PATH, collection_name=None, spaces=(CHROMA_HNSW_SPACE,), ms=M_SWEEP,
+          construction_efs=CONSTRUCTION_EF_SWEEP, search_efs=SEARCH_EF_SWEEP, k=TOP_K,
+          query_sample=QUERY_SAMPLE, limit=0):
+    """
+    Measure Chroma HNSW settings on a copy of a collection's embeddings.
+    `query_sample` embeddings are held out as queries and the rest are
+    copied into one scratch collection per space, M and construction_ef,
+    which is then searched at each search_ef. The source collection is
+    only read.
+
+    Returns:
+        list: One dict per setting with space, m, construction_ef,
+              search_ef, recall (recall@k against exact search in that
+              space), p50_ms, p99_ms and build_seconds.
+    """
+    ids, embeddings = load_embeddings(chroma_path, collection_name, limit)
+    if len(ids) <= query_sample:
+        raise ValueError(f"Need more than {query_sample} embeddings to hold out as queries; found {len(ids)}.")
+    held_out = np.zeros(len(ids), dtype=bool)
+    held_out[np.random.RandomState(1).choice(len(ids), query_sample, replace=False)] = True
+    queries, corpus = embeddings[held_out], embeddings[~held_out]
+    corpus_ids = [doc_id for doc_id, query in zip(ids, held_out) if not query]
+    logger.info(f"Sweeping HNSW settings over {len(corpus_ids)} embeddings with {len(queries)} held-out queries.")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="chroma_tune_") as workdir:
+        for space in spaces:
+            truth = [{corpus_ids[row] for row in rows} for rows in exact_neighbours(corpus, queries, k, space)]
+            for m in ms:
+                for construction_ef in construction_efs:
+                    path = os.path.join(workdir, f"{space}-{m}-{construction_ef}")
+                    client = get_client(path)
+                    collection = client.create_collection(
+                        name=SWEEP_COLLECTION, embedding_function=None,
+                        configuration=hnsw_configuration(space, m, construction_ef, search_efs[0])
+                    )
+                    batch_size = min(BATCH_SIZE, client.get_max_batch_size())
+                    started = time.perf_counter()
+                    for i in range(0, len(corpus_ids), batch_size):
+                        collection.add(ids=corpus_ids[i:i + batch_size], embeddings=corpus[i:i + batch_size])
+                    build_seconds = time.perf_counter() - started
+                    for search_ef in search_efs:
+                        apply_search_ef(collection, search_ef)
+                        collection = _reopen(path)
+                        found, latencies = time_queries(collection, queries, k)
+                        recall = sum(len(set(hits) & nearest) for hits, nearest in zip(found, truth)) / (len(queries) * k)
+                        results.append({"space": space, "m": m, "construction_ef": construction_ef,
+                                        "search_ef": search_ef, "recall": round(recall, 4),
+                                        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                                        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+                                        "build_seconds": round(build_seconds, 2)})
+                        logger.info(f"space={space} M={m} construction_ef={construction_ef} search_ef={search_ef}: "
+                                    f"recall@{k} {results[-1]['recall']}, p50 {results[-1]['p50_ms']} ms, "
+                                    f"p99 {results[-1]['p99_ms']} ms")
+                    reset(path)
+    return results
+
+
+def store_search_ef(chroma_path=CHROMA_PATH, collection_name=None, search_ef=CHROMA_HNSW_SEARCH_EF):
+    """
+    Store `search_ef` with a collection (by default the active index
+    version's). Opening a collection never writes to it, so this is how a
+    new CHROMA_HNSW_SEARCH_EF reaches an existing collection; each process
+    uses it from the next time it loads the index.
+
+    Returns:
+        bool: True if search_ef was changed.
+    """
+    collection_name = collection_name or get_active_version(chroma_path)["collection"]
+    collection = get_client(chroma_path).get_collection(name=collection_name, embedding_function=None)
+    changed = apply_search_ef(collection, search_ef)
+    logger.info(f"Collection '{collection_name}' search_ef is {search_ef}" + ("." if changed else " already."))
+    return changed
+
+
+def print_results(results, k=TOP_K):
+    configured = (CHROMA_HNSW_SPACE, CHROMA_HNSW_M, CHROMA_HNSW_CONSTRUCTION_EF, CHROMA_HNSW_SEARCH_EF)
+    print(f"{'space':<8}{'M':>5}{'constr_ef':>11}{'search_ef':>11}{f'recall@{k}':>11}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'build s':>9}")
+    for row in results:
+        current = (row["space"], row["m"], row["construction_ef"], row["search_ef"]) == configured
+        print(f"{row['space']:<8}{row['m']:>5}{row['construction_ef']:>11}{row['search_ef']:>11}"
+              f"{row['recall']:>11.4f}{row['p50_ms']:>9.3f}{row['p99_ms']:>9.3f}{row['build_seconds']:>9.2f}"
+              + ("  (current)" if current else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare Chroma HNSW settings by query latency and recall@k.")
+    parser.add_argument("--chroma-path", default=CHROMA_PATH, help="Chroma persistent client directory.")
+    parser.add_argument("--collection", help="Collection to measure (default: the active index version's).")
+    parser.add_argument("--spaces", nargs="+", choices=SPACES, default=[CHROMA_HNSW_SPACE], help="Distance spaces.")
+    parser.add_argument("--m", type=int, nargs="+", default=list(M_SWEEP), help="HNSW neighbours per node.")
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=list(CONSTRUCTION_EF_SWEEP),
+                        help="Candidate list size while building.")
+    parser.add_argument("--search-ef", type=int, nargs="+", default=list(SEARCH_EF_SWEEP),
+                        help="Candidate list size while searching.")
+    parser.add_argument("--k", type=int, default=TOP_K, help="Neighbours per query for recall@k.")
+    parser.add_argument("--queries", type=int, default=QUERY_SAMPLE, help="Embeddings held out as queries.")
+    parser.add_argument("--limit", type=int, default=0, help="Use at most this many embeddings (0 = all).")
+    parser.add_argument("--store-search-ef", type=int, nargs="?", const=CHROMA_HNSW_SEARCH_EF, metavar="EF",
+                        help="Instead of sweeping, store this search_ef (default: CHROMA_HNSW_SEARCH_EF) with the "
+                             "collection.")
+    args = parser.parse_args()
+
+    if args.store_search_ef is not None:
+        store_search_ef(args.chroma_path, args.collection, args.store_search_ef)
+    else:
+        print_results(sweep(args.chroma_path, args.collection, args.spaces, args.m, args.construction_ef,
+                            args.search_ef, args.k, args.queries, args.limit), args.k)
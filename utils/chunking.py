@@ -0,0 +1,116 @@
+# utils/chunking.py
+from utils.embeddings import estimate_tokens
+
+# Token budget per chunk. Small enough that one step's wording is not
+# drowned out by the rest of a long case, large enough to keep most cases whole.
+MAX_CHUNK_TOKENS = 512
+
+# Chunks fetched per requested parent, so top_k distinct test cases survive aggregation
+PARENT_OVERFETCH = 4
+
+# Share of a chunk's budget the repeated title line may take; longer titles are cut
+CONTINUED_TITLE_SHARE = 4
+
+
+def chunk_id(parent_id, chunk_index):
+    """Document id of one chunk of a test case."""
+    return f"{parent_id}:{chunk_index}"
+
+
+def _split_oversized(text, max_tokens):
+    """Split a single block that exceeds the budget at word boundaries."""
+    pieces, current = [], ""
+    for word in text.split(" "):
+        candidate = f"{current} {word}" if current else word
+        if current and estimate_tokens(candidate) > max_tokens:
+            pieces.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    # A single word longer than the budget still has to be cut somewhere
+    max_chars = max(1, (max_tokens - 1) * 3)
+    return [piece[i:i + max_chars] for piece in pieces for i in range(0, len(piece), max_chars)]
+
+
+def chunk_test_case(header, steps, max_tokens=MAX_CHUNK_TOKENS):
+    """
+    Split a test case into chunks of at most `max_tokens` (estimated) tokens,
+    cutting only between steps. The first chunk starts with the full header
+    (title, description, preconditions); later chunks repeat just the title
+    line so each one can be understood on its own. The repeated title is cut
+    to a quarter of the budget, so a long title cannot crowd out the steps. A
+    step that alone exceeds the budget is split at word boundaries.
+
+    Args:
+        header (str): Title, description and preconditions block.
+        steps (list): Rendered text of each step, in order.
+        max_tokens (int): Token budget per chunk.
+
+    Returns:
+        list: Chunk texts, in reading order.
+    """
+    title_line = header.split("\n", 1)[0]
+    suffix = " (continued)\n"
+    title_chars = max(0, (max_tokens // CONTINUED_TITLE_SHARE - 1) * 3 - len(suffix))
+    if len(title_line) > title_chars:
+        title_line = title_line[:max(0, title_chars - 3)].rstrip() + "..."
+    continued = title_line + suffix
+
+    blocks = []
+    for block in ([header] if header else []) + list(steps):
+        if estimate_tokens(block) > max_tokens:
+            blocks.extend(_split_oversized(block, max(1, max_tokens - estimate_tokens(continued))))
+        else:
+            blocks.append(block)
+
+    chunks, current = [], ""
+    for block in blocks:
+        if current and estimate_tokens(current + block) > max_tokens:
+            chunks.append(current)
+            current = continued
+        current += block
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def aggregate_by_parent(ids, documents, metadatas, distances, top_k):
+    """
+    Collapse chunk-level query hits into the top_k distinct parent test cases.
+    A parent ranks by its best (smallest-distance) chunk; the text returned
+    for it joins the chunks that matched, in reading order.
+
+    Documents indexed before chunking have no parent_id and count as their
+    own parent.
+
+    Args:
+        ids (list): Chunk ids from a single query, best first.
+        documents (list): Chunk texts.
+        metadatas (list): Chunk metadata (parent_id, chunk_index, ...).
+        distances (list): Chunk distances.
+        top_k (int): Number of parents to return.
+
+    Returns:
+        list: Dicts with parent_id, document, distance and chunk_ids, best first.
+    """
+    parents = {}
+    for doc_id, document, metadata, distance in zip(ids, documents, metadatas, distances):
+        metadata = metadata or {}
+        parent_id = str(metadata.get("parent_id", doc_id))
+        hit = parents.setdefault(parent_id, {"parent_id": parent_id, "distance": distance, "chunks": []})
+        hit["distance"] = min(hit["distance"], distance)
+        hit["chunks"].append((metadata.get("chunk_index", 0), doc_id, document))
+
+    ranked = sorted(parents.values(), key=lambda hit: hit["distance"])[:top_k]
+    results = []
+    for hit in ranked:
+        chunks = sorted(hit["chunks"], key=lambda chunk: chunk[0])
+        results.append({
+            "parent_id": hit["parent_id"],
+            "document": "\n".join(document for _, _, document in chunks),
+            "distance": hit["distance"],
+            "chunk_ids": [doc_id for _, doc_id, _ in chunks],
+        })
+    return results
@@ -1,37 +1,215 @@
 # utils/csv_to_vector.py
-import csv
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
 from dotenv import load_dotenv
 from logger import logger
-from utils.vector_db_faiss import add_embedding
-from utils.embeddings import generate_embedding
+from utils.vector_db_faiss import add_embeddings, delete_embeddings, upsert_embeddings, save_faiss_index, save_metadata
+from utils.embeddings import generate_embeddings
+from utils.dedup import DEDUP_THRESHOLD, NearDuplicateIndex
+from config import FAISS_FILTER_FIELDS
 
 load_dotenv()
 
-def import_csv_to_faiss(csv_file_path, text_columns=None):
+# Number of rows read and embedded together; generate_embeddings splits further if needed
+BATCH_SIZE = 1000
+
+# Rows between durable checkpoints when a progress journal is in use; a
+# checkpoint only fsyncs the FAISS write-ahead log, so it can be frequent
+CHECKPOINT_EVERY = 1000
+
+# Embedding batches in flight at once; the shared rate limiter paces the actual requests
+EMBED_WORKERS = 4
+
+
+def combine_text_columns(chunk, text_columns):
+    """
+    Concatenate `text_columns` of a DataFrame chunk into one text per row.
+    Missing columns and blank cells count as empty strings.
+
+    Returns:
+        pandas.Series: Stripped combined text, indexed like `chunk`.
+    """
+    columns = chunk.reindex(columns=text_columns, fill_value="").fillna("").astype(str)
+    combined = columns.iloc[:, 0].str.cat([columns[col] for col in text_columns[1:]], sep=" ")
+    return combined.str.strip()
+
+
+def row_fields(chunk, field_columns):
+    """
+    Build the filter fields of each row of a DataFrame chunk from the CSV
+    columns named in `field_columns` ({filter field: column}). Columns the
+    CSV does not have are left out.
+
+    Returns:
+        list: One dict of filter fields per row, or None per row if no column is present.
+    """
+    present = {field: column for field, column in field_columns.items() if column in chunk.columns}
+    if not present:
+        return [None] * len(chunk)
+    columns = chunk[list(present.values())]
+    return [dict(zip(present, values)) for values in columns.itertuples(index=False, name=None)]
+
+
+def cluster_rows(csv_file_path, text_columns, dedup_threshold, field_columns, id_column=None,
+                 batch_size=BATCH_SIZE):
+    """
+    Find near-duplicate rows before anything is embedded, so each
+    representative row can be indexed together with the ids of the rows
+    folded into it. Only rows with the same filter fields (priority and
+    section) are compared. Every row is clustered, journaled or not, so a
+    resumed import clusters the same way.
+
+    Returns:
+        tuple: (set of row numbers that duplicate an earlier row,
+                {representative row number: list of member ids}), where a
+                member id is its `id_column` value or else its row number.
     """
-    Read test cases from a CSV file, concatenate data from specified columns,
-    generate embeddings, and store them in FAISS.
+    dedup = NearDuplicateIndex(dedup_threshold)
+    duplicate_rows, member_ids = set(), {}
+    reader = pd.read_csv(csv_file_path, dtype=str, keep_default_na=False,
+                         chunksize=batch_size, encoding='utf-8')
+    for chunk in reader:
+        combined = combine_text_columns(chunk, text_columns)
+        ids = chunk[id_column].tolist() if id_column else combined.index.tolist()
+        groups = row_fields(chunk, field_columns)
+        for (row, text), item_id, fields in zip(combined.items(), ids, groups):
+            if not text:
+                continue
+            rep_row = dedup.assign(row, text, group=tuple(sorted((fields or {}).items())))
+            if rep_row != row:
+                duplicate_rows.add(row)
+                member_ids.setdefault(rep_row, []).append(str(item_id))
+    logger.info(f"Found {len(duplicate_rows)} near-duplicate rows; {len(dedup)} distinct test cases.")
+    return duplicate_rows, member_ids
+
+
+def _embed_batch(texts):
+    """Embed one batch of texts as a contiguous float32 matrix."""
+    return np.ascontiguousarray(generate_embeddings(texts), dtype=np.float32)
+
+
+def _checkpoint(journal, rows):
+    """Make the index and metadata durable, then record the rows they now contain."""
+    save_faiss_index()
+    save_metadata()
+    journal.record(rows)
+    logger.info(f"Checkpoint: {len(journal)} CSV rows committed.")
+
+
+def import_csv_to_faiss(csv_file_path, text_columns=None, batch_size=BATCH_SIZE,
+                        journal=None, checkpoint_every=CHECKPOINT_EVERY, workers=EMBED_WORKERS,
+                        dedup_threshold=DEDUP_THRESHOLD, id_column=None, field_columns=None):
+    """
+    Read test cases from a CSV file in chunks, concatenate data from specified
+    columns, embed several chunks concurrently, and add each chunk's
+    embeddings to FAISS in a single call. Chunks are added in file order, so
+    the index and metadata line up with the CSV. Rows that are near-duplicates
+    of an earlier row with the same priority and section are not embedded,
+    so each cluster of cloned cases takes one slot in the index; the
+    representative's metadata becomes a dict of its text, duplicate_ids and
+    duplicate_count, as in the Chroma import.
+
+    With a progress journal, the index is flushed to disk every
+    `checkpoint_every` rows (and when the import stops, even on error) and
+    the flushed row numbers are journaled; rows already in the journal are
+    skipped, so an interrupted import can be resumed.
+
+    With `id_column`, rows are upserted by that column (e.g. the TestRail
+    case "ID"): re-importing an export replaces changed cases in place
+    instead of adding second copies, and deletes the rows of cases that
+    are now near-duplicates of another.
+
+    Each row's filter fields (FAISS_FILTER_FIELDS, e.g. priority_id and
+    section_id) are read from the columns of the same name, or those named
+    in `field_columns`, so searches can be restricted to them.
 
     Args:
         csv_file_path (str): Path to the CSV file.
         text_columns (list): List of column names whose values should be concatenated.
                              If None, defaults to ['test_case'].
+        batch_size (int): Number of rows read and embedded per chunk.
+        journal (IngestJournal): Optional progress journal keyed by CSV row number.
+        checkpoint_every (int): Rows between index flushes when journaling.
+        workers (int): Chunks embedded concurrently.
+        dedup_threshold (float): Estimated Jaccard similarity at which a row counts as a
+                                 near-duplicate of an earlier one of the same priority and
+                                 section; 0 disables it.
+        id_column (str): Optional column holding a stable key per row.
+        field_columns (dict): Column holding each filter field, e.g. {"section_id": "Section ID"}.
+                              Fields not listed are read from the column of their own name.
     """
     if text_columns is None:
         text_columns = ['test_case']
+    field_columns = {**{field: field for field in FAISS_FILTER_FIELDS}, **(field_columns or {})}
+
+    committed = {int(row) for row in journal.done} if journal is not None else set()
+    duplicate_rows, member_ids = set(), {}
+
+    # Row numbers added to the in-memory index but not yet flushed and journaled
+    uncommitted = []
+    # Keys upserted by this import
+    upserted = set()
+    # (future, metadata items, keys, fields, row numbers) of chunks being embedded, oldest first
+    in_flight = deque()
+
+    def add_oldest():
+        future, items, keys, fields, rows = in_flight.popleft()
+        if keys is None:
+            add_embeddings(future.result(), items, fields=fields)
+        else:
+            upsert_embeddings(keys, future.result(), items, fields=fields)
+            upserted.update(str(key) for key in keys)
+        uncommitted.extend(rows)
+        logger.debug(f"Processed and added {len(items)} test cases.")
 
+    executor = ThreadPoolExecutor(max_workers=workers)
     try:
-        with open(csv_file_path, 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                # Concatenate specified columns, filtering out None values or blanks
-                combined_text = " ".join(
-                    (row.get(col, '') or '') for col in text_columns
-                ).strip()
-
-                if combined_text:
-                    embedding = generate_embedding(combined_text)
-                    add_embedding(embedding, combined_text)
-                    logger.debug(f"Processed and added test case snippet: {combined_text[:50]}...")
+        if dedup_threshold > 0:
+            duplicate_rows, member_ids = cluster_rows(csv_file_path, text_columns, dedup_threshold,
+                                                      field_columns, id_column, batch_size)
+        reader = pd.read_csv(csv_file_path, dtype=str, keep_default_na=False,
+                             chunksize=batch_size, encoding='utf-8')
+        for chunk in reader:
+            combined = combine_text_columns(chunk, text_columns)
+            keep = (combined != "") & ~combined.index.isin(duplicate_rows)
+
+            # The default RangeIndex numbers rows across chunks, like the journal does
+            pending_rows = ~combined.index.isin(committed)
+            if not pending_rows.any():
+                continue
+
+            selected = keep & pending_rows
+            texts = combined[selected].tolist()
+            items = [{"text": text, "duplicate_ids": ",".join(member_ids[row]),
+                      "duplicate_count": len(member_ids[row])} if row in member_ids else text
+                     for row, text in combined[selected].items()]
+            keys = chunk[id_column][selected].tolist() if id_column else None
+            fields = [row for row, kept in zip(row_fields(chunk, field_columns), selected) if kept]
+            rows = combined.index[pending_rows].tolist()
+            in_flight.append((executor.submit(_embed_batch, texts), items, keys, fields, rows))
+
+            # Keep at most `workers` chunks embedding; add finished ones in file order
+            while len(in_flight) >= workers:
+                add_oldest()
+            if journal is not None and len(uncommitted) >= checkpoint_every:
+                _checkpoint(journal, uncommitted)
+                uncommitted.clear()
+
+        while in_flight:
+            add_oldest()
+        if id_column and member_ids:
+            # A case an earlier import indexed on its own may now be folded into a representative
+            folded = {key for members in member_ids.values() for key in members} - upserted
+            deleted = delete_embeddings(sorted(folded))
+            if deleted:
+                logger.info(f"Deleted {deleted} indexed test cases that are now near-duplicates of another.")
     except Exception as e:
         logger.error(f"Error importing CSV: {e}")
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        # Keep everything embedded so far, including when a quota error stopped the import
+        if journal is not None and uncommitted:
+            _checkpoint(journal, uncommitted)
@@ -0,0 +1,107 @@
+# utils/dedup.py
+import re
+import zlib
+
+import numpy as np
+
+# Word n-grams compared between test cases
+SHINGLE_SIZE = 3
+
+# LSH layout: BANDS x ROWS MinHash values. Pairs above ~0.6 Jaccard become
+# candidates; a case at the default threshold is found ~98% of the time.
+LSH_BANDS = 20
+LSH_ROWS = 6
+
+# Estimated Jaccard similarity at which two cases count as near-duplicates
+DEDUP_THRESHOLD = 0.75
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """Hash the distinct word n-grams of a text, case- and punctuation-insensitive."""
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    grams = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+class NearDuplicateIndex:
+    """
+    Online MinHash/LSH clustering of near-identical test cases.
+
+    Items are assigned one at a time, in ingestion order. An item whose
+    estimated Jaccard similarity to an existing representative of the same
+    group (e.g. TestRail priority and section) reaches the threshold joins
+    that representative's cluster; otherwise it becomes a new
+    representative. Items of different groups are never folded together. Only representatives are kept in the LSH tables,
+    so memory grows with the number of distinct cases, not the corpus.
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, bands=LSH_BANDS, rows=LSH_ROWS, seed=1):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        rng = np.random.RandomState(seed)
+        num_perm = bands * rows
+        self._a = rng.randint(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._tables = [{} for _ in range(bands)]
+        self._signatures = {}
+        self._order = {}
+        self.members = {}
+
+    def signature(self, text):
+        """MinHash signature of a text, or None if it has no words."""
+        hashes = shingle_hashes(text)
+        if not len(hashes):
+            return None
+        # Universal hashing (a*h + b) mod p; uint64 wraparound is fine for MinHash
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature, group):
+        return [(group, signature[i * self.rows:(i + 1) * self.rows].tobytes()) for i in range(self.bands)]
+
+    def assign(self, item_id, text, group=None):
+        """
+        Place an item in a cluster.
+
+        Args:
+            item_id: Id of the item, e.g. a TestRail case id or CSV row number.
+            text (str): Text compared between items.
+            group: Hashable scope, e.g. (priority_id, section_id); only items
+                   of the same group can be near-duplicates.
+
+        Returns:
+            The id of the item's representative; the item's own id if it
+            starts a new cluster.
+        """
+        signature = self.signature(text)
+        if signature is None:
+            return item_id
+
+        keys = self._band_keys(signature, group)
+        candidates = {rep_id for table, key in zip(self._tables, keys) for rep_id in table.get(key, ())}
+        best_id, best_similarity = None, -1.0
+        # Oldest representative first, so ties resolve the same way on every run
+        for rep_id in sorted(candidates, key=self._order.get):
+            similarity = float(np.mean(self._signatures[rep_id] == signature))
+            if similarity >= self.threshold and similarity > best_similarity:
+                best_id, best_similarity = rep_id, similarity
+
+        if best_id is not None:
+            self.members[best_id].append(item_id)
+            return best_id
+
+        self._signatures[item_id] = signature
+        self._order[item_id] = len(self._order)
+        self.members[item_id] = []
+        for table, key in zip(self._tables, keys):
+            table.setdefault(key, []).append(item_id)
+        return item_id
+
+    def __len__(self):
+        return len(self._signatures)
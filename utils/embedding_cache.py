@@ -0,0 +1,202 @@
+# utils/embedding_cache.py
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+from logger import logger
+from config import EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_MB
+
+# When the cache grows past its budget, evict down to this fraction of it
+EVICTION_TARGET = 0.9
+EVICTION_CHUNK = 1000
+
+
+def normalize_text(text):
+    """
+    Normalize text for cache keys: Unicode NFC, collapsed whitespace, stripped.
+    Texts that differ only by such formatting share a cache entry.
+    """
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(model, dimensions, text):
+    """Content-addressed key for an embedding of `text` by `model` at `dimensions`."""
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{dimensions}:{digest}"
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache backed by SQLite.
+
+    Entries are keyed by (model, dimensions, normalized-text hash) and evicted
+    least-recently-used once the stored vectors exceed `max_bytes`. SQLite in
+    WAL mode makes the cache safe to share between threads and processes;
+    hit/miss counters are kept both per process and cumulatively on disk.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._counter_lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " vector BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.executemany(
+                "INSERT OR IGNORE INTO stats (name, value) VALUES (?, 0)",
+                [("hits",), ("misses",), ("bytes",)]
+            )
+
+    def _connection(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, model, dimensions, texts):
+        """
+        Look up embeddings for many texts.
+
+        Returns:
+            list: One vector (list of floats) per text, or None for a miss.
+        """
+        if not texts:
+            return []
+
+        keys = [cache_key(model, dimensions, text) for text in texts]
+        conn = self._connection()
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(unique_keys), 500):
+            chunk = unique_keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+        results = [found.get(key) for key in keys]
+        hits = sum(1 for r in results if r is not None)
+        misses = len(results) - hits
+
+        with self._counter_lock:
+            self.hits += hits
+            self.misses += misses
+
+        now = time.time()
+        with conn:
+            if found:
+                conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+            conn.execute("UPDATE stats SET value = value + ? WHERE name = 'hits'", (hits,))
+            conn.execute("UPDATE stats SET value = value + ? WHERE name = 'misses'", (misses,))
+
+        return results
+
+    def put_many(self, model, dimensions, texts, embeddings):
+        """Store embeddings for many texts, evicting old entries if over budget."""
+        if not texts:
+            return
+
+        now = time.time()
+        rows = {}
+        for text, embedding in zip(texts, embeddings):
+            blob = np.asarray(embedding, dtype=np.float32).tobytes()
+            key = cache_key(model, dimensions, text)
+            rows[key] = (key, blob, len(blob) + len(key), now)
+
+        conn = self._connection()
+        with conn:
+            added = 0
+            for row in rows.values():
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, size, last_access) VALUES (?, ?, ?, ?)", row
+                )
+                if cursor.rowcount:
+                    added += row[2]
+            conn.execute("UPDATE stats SET value = value + ? WHERE name = 'bytes'", (added,))
+            total = conn.execute("SELECT value FROM stats WHERE name = 'bytes'").fetchone()[0]
+
+            if total > self.max_bytes:
+                self._evict(conn, total)
+
+    def _evict(self, conn, total):
+        """Delete least-recently-used entries until under the eviction target. Runs inside a transaction."""
+        target = int(self.max_bytes * EVICTION_TARGET)
+        evicted = 0
+        while total > target:
+            rows = conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_access LIMIT ?", (EVICTION_CHUNK,)
+            ).fetchall()
+            if not rows:
+                break
+            victims, freed = [], 0
+            for key, size in rows:
+                if total - freed <= target:
+                    break
+                victims.append((key,))
+                freed += size
+            conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+            total -= freed
+            evicted += len(victims)
+            conn.execute("UPDATE stats SET value = value - ? WHERE name = 'bytes'", (freed,))
+        logger.debug(f"Embedding cache evicted {evicted} entries; now {total} bytes.")
+
+    def stats(self):
+        """Return per-process and cumulative hit/miss counters plus the cache size."""
+        conn = self._connection()
+        persisted = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+        entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": persisted.get("hits", 0),
+            "total_misses": persisted.get("misses", 0),
+            "entries": entries,
+            "bytes": persisted.get("bytes", 0),
+        }
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_embedding_cache():
+    """Return the process-wide embedding cache, or None if caching is disabled."""
+    global _CACHE
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = EmbeddingCache()
+            logger.debug(f"Embedding cache opened at {EMBEDDING_CACHE_PATH}.")
+    return _CACHE
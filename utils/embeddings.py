@@ -3,13 +3,145 @@ import os
 from logger import logger
 from dotenv import load_dotenv
 from openai import OpenAI  # Import the new OpenAI class
+from config import EMBEDDING_MODEL, EMBEDDING_DIMENSION
+from utils.embedding_cache import get_embedding_cache
+from utils.rate_limiter import get_rate_limiter, call_with_rate_limit
 
 load_dotenv()
 
+# Output size of each model when no `dimensions` is requested
+NATIVE_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+# Per-request limits of the OpenAI embeddings endpoint. We stay a bit under the
+# documented token ceiling because token counts are estimated, not measured.
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_REQUEST = 250_000
+MAX_TOKENS_PER_INPUT = 8191
+
+
+def estimate_tokens(text):
+    """
+    Cheap, conservative token estimate for packing requests.
+    English text averages ~4 characters per token; we assume 3 so that
+    batches of IDs, code and punctuation still fit under the limits.
+    """
+    return len(text) // 3 + 1
+
+
+def output_dimension(model, dimensions=None):
+    """
+    Size of the vectors `model` returns. An explicit `dimensions` wins; the
+    configured model defaults to EMBEDDING_DIMENSION, other models to their
+    native size.
+    """
+    if dimensions:
+        return dimensions
+    if model == EMBEDDING_MODEL:
+        return EMBEDDING_DIMENSION
+    return NATIVE_DIMENSIONS.get(model, EMBEDDING_DIMENSION)
+
+
+def request_dimensions(model, dimension):
+    """The `dimensions` argument to send for a wanted output size, or None for the model's native size."""
+    return None if NATIVE_DIMENSIONS.get(model) == dimension else dimension
+
+
+def pack_batches(texts, max_inputs=MAX_INPUTS_PER_REQUEST, max_tokens=MAX_TOKENS_PER_REQUEST):
+    """
+    Split texts into request-sized batches of positions, preserving order.
+    Each batch stays under both the input-count and the token budget.
+
+    Args:
+        texts (list): The input texts.
+        max_inputs (int): Maximum number of texts per request.
+        max_tokens (int): Maximum estimated tokens per request.
+
+    Returns:
+        list: Lists of positions into `texts`, one list per request.
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for position, text in enumerate(texts):
+        tokens = min(estimate_tokens(text), MAX_TOKENS_PER_INPUT)
+        if current and (len(current) >= max_inputs or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(position)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def generate_embeddings(texts, model=EMBEDDING_MODEL, dimensions=None):
+    """
+    Generate embeddings for many texts, packing them into as few requests
+    as the provider's per-request limits allow. Texts already in the
+    persistent embedding cache are not sent; new vectors are added to it.
+
+    Empty texts are not sent (the API rejects them) and get a zero vector.
+
+    Args:
+        texts (list): The input texts.
+        model (str): The embedding model to use.
+        dimensions (int): Optional shortened output size (text-embedding-3 models);
+                          see output_dimension for the default.
+
+    Returns:
+        list: One embedding vector per input text, in input order.
+
+    Raises:
+        Exception: Propagates any error from the embeddings API.
+    """
+    dimension = output_dimension(model, dimensions)
+    dimensions = request_dimensions(model, dimension)
+    embeddings = [[0.0] * dimension for _ in texts]
+    pending = [i for i, text in enumerate(texts) if text and text.strip()]
+    if not pending:
+        return embeddings
+
+    cache = get_embedding_cache()
+    if cache is not None:
+        cached = cache.get_many(model, dimension, [texts[i] for i in pending])
+        for i, vector in zip(pending, cached):
+            if vector is not None:
+                embeddings[i] = vector
+        pending = [i for i, vector in zip(pending, cached) if vector is None]
+        if not pending:
+            return embeddings
+
+    # Retries are handled by the shared rate limiter, not the SDK
+    client = OpenAI(max_retries=0)
+    limiter = get_rate_limiter("embeddings", model)
+    extra = {"dimensions": dimensions} if dimensions else {}
+    for batch in pack_batches([texts[i] for i in pending]):
+        positions = [pending[b] for b in batch]
+        batch_texts = [texts[p] for p in positions]
+        response = call_with_rate_limit(
+            limiter,
+            lambda: client.embeddings.create(input=batch_texts, model=model, **extra),
+            sum(estimate_tokens(text) for text in batch_texts)
+        )
+        # The API reports each vector's position within the request
+        for item in response.data:
+            embeddings[positions[item.index]] = item.embedding
+        logger.debug(f"Embedded batch of {len(positions)} texts in one request.")
+
+        # Cache each batch as it arrives so a later failure loses nothing
+        if cache is not None:
+            cache.put_many(model, dimension, batch_texts, [embeddings[p] for p in positions])
+
+    return embeddings
+
+
 def generate_embedding(text):
     """
     Generate an embedding for the given text using OpenAI's new embeddings API.
-    Uses the small model "text-embedding-3-small".
+    Uses the configured EMBEDDING_MODEL.
 
     Args:
         text (str): The input text.
@@ -18,18 +150,8 @@ def generate_embedding(text):
         list: The embedding vector.
     """
     try:
-        client = OpenAI()
-        response = client.embeddings.create(
-            input=text,
-            model="text-embedding-3-small"  # Using the small model
-        )
-        # Extract the embedding from the response
-        embedding = response.data[0].embedding
-        return embedding
+        return generate_embeddings([text])[0]
     except Exception as e:
         logger.error(f"Error generating embedding: {e}")
-        # Determine the dimension for the small model.
-        # For illustration, we'll assume a dimension of 768.
-        # Adjust this number based on the actual dimension of the small model.
-        small_model_dimension = 1536
-        return [0.0] * small_model_dimension
\ No newline at end of file
+        # Fall back to a zero vector of the configured dimension
+        return [0.0] * EMBEDDING_DIMENSION
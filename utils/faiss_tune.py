@@ -0,0 +1,286 @@
+# utils/faiss_tune.py
+import argparse
+import os
+import time
+
+import faiss
+import numpy as np
+from logger import logger
+
+from config import (EMBEDDING_DIMENSION, FAISS_NLIST, FAISS_PQ_M, FAISS_HNSW_M, FAISS_METRIC, FAISS_STORAGE,
+                    FAISS_RERANK)
+from utils.vector_db_faiss import (INDEX_FILE, VECTORS_FILE, INDEX_TYPES, METRICS, STORAGES, build_faiss_index,
+                                   coarsen, data_path, train_faiss_index, set_search_params, index_type_of, is_lossy,
+                                   open_full_vectors, prepare_vectors, recall_at_k, rerank, search_rows, storage_of)
+
+# Query vectors drawn from the corpus for each measurement
+QUERY_SAMPLE = 200
+TOP_K = 10
+
+NPROBE_SWEEP = (1, 2, 4, 8, 16, 32, 64, 128)
+EF_SEARCH_SWEEP = (16, 32, 64, 128, 256)
+# Two-stage retrieval: coarse dimensions and re-ranked candidates per query
+COARSE_DIMENSION_SWEEP = (256, 512)
+CANDIDATE_SWEEP = (50, 100, 200, 400)
+
+
+def load_vectors(index_file=None):
+    """
+    Read every vector back out of a FAISS index file (by default the
+    current snapshot's), in order. Lossy and two-stage indexes are read
+    from the full-precision vector file next to them.
+
+    Raises:
+        ValueError: If the index stores compressed vectors without a full-precision
+                    file, so it cannot give back the vectors exact search needs.
+    """
+    index_file = index_file or data_path(INDEX_FILE)
+    index = faiss.read_index(index_file)
+    full_vectors = open_full_vectors(os.path.join(os.path.dirname(index_file), VECTORS_FILE), index, read_only=True,
+                                     dimension=max(index.d, EMBEDDING_DIMENSION))
+    if full_vectors is not None and len(full_vectors) >= index.ntotal:
+        return np.ascontiguousarray(full_vectors.take(np.arange(index.ntotal)), dtype=np.float32)
+    if is_lossy(index):
+        raise ValueError(f"{index_file} stores compressed vectors. Tune from a float32 flat, IVF-Flat or HNSW index.")
+    if faiss.try_extract_index_ivf(index) is not None:
+        # IVF indexes can only reconstruct by position once they keep a direct map
+        faiss.extract_index_ivf(index).make_direct_map()
+    return np.ascontiguousarray(index.reconstruct_n(0, index.ntotal), dtype=np.float32)
+
+
+def time_search(index, queries, k=TOP_K):
+    """Average search latency per query in milliseconds."""
+    started = time.perf_counter()
+    index.search(queries, k)
+    return (time.perf_counter() - started) * 1000 / len(queries)
+
+
+def build_and_fill(vectors, index_type, nlist=FAISS_NLIST, pq_m=FAISS_PQ_M, hnsw_m=FAISS_HNSW_M,
+                   metric=FAISS_METRIC, storage=FAISS_STORAGE, coarse_dimension=0):
+    """
+    Build, train (on a corpus sample) and fill an index of `index_type` with
+    `vectors`, or with their first `coarse_dimension` dimensions if set.
+    """
+    index = build_faiss_index(vectors.shape[1], index_type, nlist=nlist, pq_m=pq_m, hnsw_m=hnsw_m,
+                              metric=metric, storage=storage, coarse_dimension=coarse_dimension)
+    vectors = prepare_vectors(vectors, index)
+    index = train_faiss_index(index, vectors)
+    index.add(coarsen(vectors, index.d))
+    return index
+
+
+class _InMemoryVectors:
+    """Full vectors held in memory, shaped like a VectorFile for rerank()."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def take(self, ids):
+        return self.vectors[ids]
+
+
+def rerank_recall(index, vectors, queries, k, factor):
+    """recall@k after re-ranking k * factor candidates against the full vectors."""
+    exact = faiss.IndexFlat(vectors.shape[1], index.metric_type)
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+    _, candidates = index.search(queries, k * factor)
+    full = _InMemoryVectors(vectors)
+    hits = sum(len(set(t) & set(rerank(query, row, full, index.metric_type, k)))
+               for query, row, t in zip(queries, candidates, truth.tolist()))
+    return hits / (len(queries) * k)
+
+
+def sweep(vectors, index_types=INDEX_TYPES, k=TOP_K, query_sample=QUERY_SAMPLE,
+          nlist=FAISS_NLIST, pq_m=FAISS_PQ_M, hnsw_m=FAISS_HNSW_M,
+          metric=FAISS_METRIC, storages=("float32",), rerank_factor=FAISS_RERANK):
+    """
+    Build each index type (in each storage) over `vectors` and measure
+    recall@k and latency against exact search for every nprobe / efSearch
+    setting. Lossy indexes are also measured with float32 re-ranking when
+    `rerank_factor` is set.
+
+    Returns:
+        list: One dict per setting with index_type, storage, param, value,
+              recall, recall_rerank, ms_per_query, speedup (vs flat),
+              size_mb and build_seconds.
+    """
+    rows = np.random.RandomState(1).choice(len(vectors), min(query_sample, len(vectors)), replace=False)
+    exact = faiss.IndexFlat(vectors.shape[1], METRICS[metric])
+    vectors = prepare_vectors(vectors, exact)
+    queries = vectors[np.sort(rows)]
+    exact.add(vectors)
+    exact_ms = time_search(exact, queries, k)
+
+    results = []
+    for index_type in index_types:
+        # PQ brings its own compression; the storage option does not apply
+        for storage in (("float32",) if index_type == "ivf_pq" else storages):
+            started = time.monotonic()
+            index = build_and_fill(vectors, index_type, nlist, pq_m, hnsw_m, metric, storage)
+            build_seconds = time.monotonic() - started
+            size_mb = len(faiss.serialize_index(index)) / (1024 * 1024)
+
+            if index_type_of(index) in ("ivf_flat", "ivf_pq"):
+                lists = faiss.extract_index_ivf(index).nlist
+                settings = [("nprobe", value) for value in NPROBE_SWEEP if value <= lists]
+            elif index_type == "hnsw":
+                settings = [("efSearch", value) for value in EF_SEARCH_SWEEP]
+            else:
+                settings = [(None, None)]
+
+            for param, value in settings:
+                if param == "nprobe":
+                    set_search_params(index, nprobe=value, ef_search=None)
+                elif param == "efSearch":
+                    set_search_params(index, nprobe=None, ef_search=max(value, k))
+                ms = time_search(index, queries, k)
+                reranked = None
+                if rerank_factor and is_lossy(index):
+                    reranked = round(rerank_recall(index, vectors, queries, k, rerank_factor), 4)
+                results.append({
+                    "index_type": index_type,
+                    "storage": storage_of(index),
+                    "param": param,
+                    "value": value,
+                    "recall": round(recall_at_k(index, vectors, queries, k), 4),
+                    "recall_rerank": reranked,
+                    "ms_per_query": round(ms, 4),
+                    "speedup": round(exact_ms / ms, 1) if ms else None,
+                    "size_mb": round(size_mb, 1),
+                    "build_seconds": round(build_seconds, 2),
+                })
+                logger.info(f"{index_type}/{storage_of(index)} {param or ''}={value if value is not None else '-'}: "
+                            f"recall@{k} {results[-1]['recall']}, {ms:.3f} ms/query")
+    return results
+
+
+def print_results(results, k=TOP_K):
+    print(f"{'index':<10}{'storage':<9}{'setting':<16}{f'recall@{k}':>10}{'reranked':>10}"
+          f"{'ms/query':>11}{'speedup':>9}{'MB':>9}{'build s':>9}")
+    for row in results:
+        setting = f"{row['param']}={row['value']}" if row["param"] else "exact"
+        reranked = f"{row['recall_rerank']:.4f}" if row["recall_rerank"] is not None else "-"
+        print(f"{row['index_type']:<10}{row['storage']:<9}{setting:<16}{row['recall']:>10.4f}{reranked:>10}"
+              f"{row['ms_per_query']:>11.3f}{row['speedup']:>8}x{row['size_mb']:>9.1f}{row['build_seconds']:>9.2f}")
+
+
+def two_stage_sweep(vectors, dimensions=COARSE_DIMENSION_SWEEP, candidates=CANDIDATE_SWEEP, k=TOP_K,
+                    query_sample=QUERY_SAMPLE, index_type="flat", nlist=FAISS_NLIST, metric=FAISS_METRIC,
+                    storage=FAISS_STORAGE):
+    """
+    Measure two-stage retrieval over `vectors`: for each coarse dimension,
+    recall@k against exact full-dimension search of the coarse index alone
+    and after re-ranking each number of `candidates` at full dimension,
+    with the size of the in-memory index. The full vectors are held in
+    memory here; served from disk, re-ranking also reads
+    candidates x dimension x 4 bytes per query, mostly from the OS cache.
+
+    Returns:
+        list: One dict per setting with dimension, candidates (None for the
+              coarse index alone), recall, ms_per_query, size_mb and ratio
+              (full-dimension index size over this one).
+    """
+    rows = np.random.RandomState(1).choice(len(vectors), min(query_sample, len(vectors)), replace=False)
+    exact = faiss.IndexFlat(vectors.shape[1], METRICS[metric])
+    vectors = prepare_vectors(vectors, exact)
+    queries = vectors[np.sort(rows)]
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+    full_mb = len(faiss.serialize_index(exact)) / (1024 * 1024)
+    full = _InMemoryVectors(vectors)
+
+    def recall(found):
+        return round(sum(len(set(row) & set(t)) for row, t in zip(found, truth.tolist())) / (len(queries) * k), 4)
+
+    results = [{"dimension": vectors.shape[1], "candidates": None, "recall": 1.0,
+                "ms_per_query": round(time_search(exact, queries, k), 4), "size_mb": round(full_mb, 1), "ratio": 1.0}]
+    for dimension in dimensions:
+        if dimension >= vectors.shape[1]:
+            logger.warning(f"Skipping coarse dimension {dimension}: the vectors only have {vectors.shape[1]}.")
+            continue
+        index = build_and_fill(vectors, index_type, nlist, metric=metric, storage=storage, coarse_dimension=dimension)
+        size_mb = len(faiss.serialize_index(index)) / (1024 * 1024)
+        coarse_queries = coarsen(queries, index.d)
+        settings = [(None, time_search(index, coarse_queries, k), index.search(coarse_queries, k)[1].tolist())]
+        for count in candidates:
+            started = time.perf_counter()
+            found, _ = search_rows(index, queries, k, full_vectors=full, rerank_factor=1, candidates=count)
+            settings.append((count, (time.perf_counter() - started) * 1000 / len(queries), found))
+        for count, ms, found in settings:
+            results.append({"dimension": dimension, "candidates": count, "recall": recall(found),
+                            "ms_per_query": round(ms, 4), "size_mb": round(size_mb, 1),
+                            "ratio": round(full_mb / size_mb, 1) if size_mb else None})
+            logger.info(f"{dimension} dims, {count or 'no'} re-ranked: recall@{k} {results[-1]['recall']}, "
+                        f"{ms:.3f} ms/query")
+    return results
+
+
+def print_two_stage_results(results, k=TOP_K):
+    print(f"{'dims':<8}{'re-ranked':<11}{f'recall@{k}':>10}{'ms/query':>11}{'MB':>9}{'smaller':>9}")
+    for row in results:
+        reranked = str(row["candidates"]) if row["candidates"] else ("exact" if row["ratio"] == 1.0 else "-")
+        print(f"{row['dimension']:<8}{reranked:<11}{row['recall']:>10.4f}{row['ms_per_query']:>11.3f}"
+              f"{row['size_mb']:>9.1f}{row['ratio']:>8}x")
+
+
+def rebuild_index(index_type, index_file=None, nlist=FAISS_NLIST, pq_m=FAISS_PQ_M, hnsw_m=FAISS_HNSW_M,
+                  metric=FAISS_METRIC, storage=FAISS_STORAGE, coarse_dimension=0):
+    """
+    Re-index the vectors of `index_file` as `index_type` in place. Vector
+    order is kept, so the metadata store still lines up. A lossy or
+    coarse (`coarse_dimension`) result gets its full-precision vector file
+    written next to it for re-ranking.
+    """
+    index_file = index_file or data_path(INDEX_FILE)
+    vectors = load_vectors(index_file)
+    index = build_and_fill(vectors, index_type, nlist, pq_m, hnsw_m, metric, storage, coarse_dimension)
+    if is_lossy(index) or index.d < vectors.shape[1]:
+        vectors_file = os.path.join(os.path.dirname(index_file), VECTORS_FILE)
+        prepare_vectors(vectors, index).astype("<f4").tofile(vectors_file)
+    faiss.write_index(index, index_file)
+    logger.info(f"Rebuilt {index_file} as {index_type_of(index)} with {index.ntotal} vectors.")
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure recall@k and latency of FAISS index types against exact search, or rebuild the index."
+    )
+    parser.add_argument("--index-file", help="FAISS index whose vectors are used (default: the current snapshot's).")
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES), help="Index types to compare.")
+    parser.add_argument("--k", type=int, default=TOP_K, help="Neighbours per query for recall@k.")
+    parser.add_argument("--queries", type=int, default=QUERY_SAMPLE, help="Corpus vectors used as queries.")
+    parser.add_argument("--nlist", type=int, default=FAISS_NLIST, help="IVF inverted lists.")
+    parser.add_argument("--pq-m", type=int, default=FAISS_PQ_M, help="PQ sub-quantizers (must divide the dimension).")
+    parser.add_argument("--hnsw-m", type=int, default=FAISS_HNSW_M, help="HNSW neighbours per node.")
+    parser.add_argument("--metric", choices=list(METRICS), default=FAISS_METRIC, help="l2, or ip for cosine similarity.")
+    parser.add_argument("--storage", nargs="+", choices=list(STORAGES), default=[FAISS_STORAGE],
+                        help="Vector storage(s) to compare; --rebuild uses the first.")
+    parser.add_argument("--rerank", type=int, default=FAISS_RERANK,
+                        help="Also measure lossy indexes re-ranked from k * this many candidates (0 = off).")
+    parser.add_argument("--rebuild", choices=INDEX_TYPES, help="Rebuild the index file as this type instead of measuring.")
+    parser.add_argument("--coarse-dimension", type=int, default=0,
+                        help="With --rebuild, index only this many leading dimensions (two-stage retrieval).")
+    parser.add_argument("--two-stage", action="store_true",
+                        help="Measure two-stage retrieval (coarse search, full-dimension re-rank) with the first of --types.")
+    parser.add_argument("--coarse-dimensions", type=int, nargs="+", default=list(COARSE_DIMENSION_SWEEP),
+                        help="Coarse dimensions compared by --two-stage.")
+    parser.add_argument("--candidates", type=int, nargs="+", default=list(CANDIDATE_SWEEP),
+                        help="Candidates re-ranked per query compared by --two-stage.")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        rebuild_index(args.rebuild, args.index_file, args.nlist, args.pq_m, args.hnsw_m, args.metric, args.storage[0],
+                      args.coarse_dimension)
+    elif args.two_stage:
+        corpus = load_vectors(args.index_file)
+        print_two_stage_results(two_stage_sweep(corpus, args.coarse_dimensions, args.candidates, args.k, args.queries,
+                                                args.types[0], args.nlist, args.metric, args.storage[0]), args.k)
+    else:
+        corpus = load_vectors(args.index_file)
+        print_results(sweep(corpus, args.types, args.k, args.queries, args.nlist, args.pq_m, args.hnsw_m,
+                            args.metric, args.storage, args.rerank), args.k)
@@ -0,0 +1,224 @@
+# utils/index_versions.py
+import json
+import os
+import re
+import threading
+import time
+
+from config import (EMBEDDING_MODEL, EMBEDDING_DIMENSION, CHROMA_HNSW_SPACE, CHROMA_HNSW_M, CHROMA_HNSW_CONSTRUCTION_EF,
+                    CHROMA_HNSW_SEARCH_EF)
+from logger import logger
+from utils.embeddings import request_dimensions
+
+# Collection that holds the index built before versioning existed
+BASE_COLLECTION = "testrail_test_cases"
+
+# Registry of index versions, kept inside the Chroma directory it describes
+REGISTRY_FILE = "index_versions.json"
+
+COLLECTION_DESCRIPTION = "TestRail test cases stored with Chroma"
+
+
+def version_name(model, dimension):
+    """Stable name of the index built with `model` at `dimension`, e.g. text-embedding-3-small-1536."""
+    return f"{re.sub(r'[^A-Za-z0-9]+', '-', model).strip('-')}-{dimension}"
+
+
+def registry_path(chroma_path):
+    return os.path.join(chroma_path, REGISTRY_FILE)
+
+
+def _default_registry():
+    # Before any migration the base collection holds the configured model's vectors
+    name = version_name(EMBEDDING_MODEL, EMBEDDING_DIMENSION)
+    return {
+        "active": name,
+        "versions": {
+            name: {
+                "collection": BASE_COLLECTION,
+                "model": EMBEDDING_MODEL,
+                "dimension": EMBEDDING_DIMENSION,
+                "status": "active",
+            }
+        },
+    }
+
+
+def load_registry(chroma_path):
+    """
+    Read the version registry of a Chroma directory.
+
+    Returns:
+        dict: {"active": name, "versions": {name: version}}, where each version
+              records its collection, model, dimension and status.
+    """
+    path = registry_path(chroma_path)
+    if not os.path.exists(path):
+        return _default_registry()
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_registry(chroma_path, registry):
+    """
+    Write the registry atomically: readers see either the old or the new
+    file, never a partial one. This is what makes a version swap atomic.
+    """
+    os.makedirs(chroma_path, exist_ok=True)
+    path = registry_path(chroma_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(registry, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def get_active_version(chroma_path):
+    """Return the version queries and imports should use, with its name."""
+    registry = load_registry(chroma_path)
+    return {"name": registry["active"], **registry["versions"][registry["active"]]}
+
+
+def register_version(chroma_path, model, dimension):
+    """Add (or return) the version for `model` at `dimension` without activating it."""
+    registry = load_registry(chroma_path)
+    name = version_name(model, dimension)
+    if name not in registry["versions"]:
+        registry["versions"][name] = {
+            "collection": f"{BASE_COLLECTION}__{name}",
+            "model": model,
+            "dimension": dimension,
+            "status": "building",
+            "created": int(time.time()),
+        }
+        save_registry(chroma_path, registry)
+    return {"name": name, **registry["versions"][name]}
+
+
+def update_version(chroma_path, name, **fields):
+    """Merge `fields` (status, progress, recall, ...) into a version's registry entry."""
+    registry = load_registry(chroma_path)
+    registry["versions"][name].update(fields)
+    save_registry(chroma_path, registry)
+
+
+def activate_version(chroma_path, name):
+    """
+    Point queries and imports at version `name` in one atomic registry write.
+    The previously active version is kept as "retired" for rollback.
+    """
+    registry = load_registry(chroma_path)
+    if name not in registry["versions"]:
+        raise ValueError(f"Unknown index version '{name}'.")
+    previous = registry["active"]
+    if previous != name:
+        registry["versions"][previous]["status"] = "retired"
+    registry["versions"][name].update(status="active", activated=int(time.time()))
+    registry["active"] = name
+    save_registry(chroma_path, registry)
+    return previous
+
+
+def hnsw_configuration(space=CHROMA_HNSW_SPACE, m=CHROMA_HNSW_M, construction_ef=CHROMA_HNSW_CONSTRUCTION_EF,
+                       search_ef=CHROMA_HNSW_SEARCH_EF):
+    """Configuration for a new Chroma collection whose HNSW index uses these parameters."""
+    return {"hnsw": {"space": space, "max_neighbors": m, "ef_construction": construction_ef, "ef_search": search_ef}}
+
+
+def apply_search_ef(collection, search_ef=CHROMA_HNSW_SEARCH_EF):
+    """
+    Set the HNSW search_ef of an existing collection. Chroma stores it with
+    the collection and reads it when a process first loads the index, so it
+    only affects queries in processes that have not searched the
+    collection yet, such as one that has just opened it. Only tuning and
+    admin tools call this (see chroma_tune); opening a collection does not.
+
+    Returns:
+        bool: True if search_ef was changed.
+    """
+    hnsw = (collection.configuration or {}).get("hnsw")
+    if hnsw is None or hnsw.get("ef_search") == search_ef:
+        return False
+    collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+    return True
+
+
+def open_version_collection(client, version, api_key=None, timings=None):
+    """
+    Open (creating if needed) the collection of an index version together
+    with the process-wide embedding function for the version's model and
+    dimension. A new collection gets the configured HNSW parameters; an
+    existing one is opened as stored, without writing to it (see
+    apply_search_ef). If given, `timings` receives the seconds spent on each.
+
+    Returns:
+        tuple: (collection, embedding function)
+    """
+    started = time.perf_counter()
+    # Imports chromadb, so it is only paid for once a collection is opened
+    from utils.chroma_embeddings import get_embedding_function
+    embedding_function = get_embedding_function(
+        version["model"], request_dimensions(version["model"], version["dimension"]), api_key
+    )
+    created = time.perf_counter()
+    collection = client.get_or_create_collection(
+        name=version["collection"],
+        configuration=hnsw_configuration(),
+        embedding_function=embedding_function,
+        metadata={"description": COLLECTION_DESCRIPTION}
+    )
+    # The index parameters of an existing collection cannot change; only search_ef can
+    hnsw = (collection.configuration or {}).get("hnsw") or {}
+    built = (hnsw.get("space"), hnsw.get("max_neighbors"), hnsw.get("ef_construction"))
+    if hnsw and built != (CHROMA_HNSW_SPACE, CHROMA_HNSW_M, CHROMA_HNSW_CONSTRUCTION_EF):
+        logger.warning(f"Collection '{version['collection']}' was built with space={built[0]}, M={built[1]}, "
+                       f"construction_ef={built[2]}; re-embed it into a new version to use the configured values.")
+    # Opening never writes: readers share the collection and may be configured differently
+    if hnsw and hnsw.get("ef_search") != CHROMA_HNSW_SEARCH_EF:
+        logger.info(f"Collection '{version['collection']}' searches with search_ef={hnsw.get('ef_search')}, not "
+                    f"the configured {CHROMA_HNSW_SEARCH_EF}; python -m utils.chroma_tune --store-search-ef "
+                    f"stores it.")
+    if timings is not None:
+        timings["embedding_function"] = created - started
+        timings["get_collection"] = time.perf_counter() - created
+    return collection, embedding_function
+
+
+class ActiveCollection:
+    """
+    Resolves the active index version for a long-running reader. The
+    registry file is re-checked on every call (one stat), so a swap made by
+    the re-embedding job is picked up by the next query without a restart.
+    Safe to share between threads; a version is opened only once.
+    """
+
+    def __init__(self, client, chroma_path, api_key=None):
+        self.client = client
+        self.chroma_path = chroma_path
+        self.api_key = api_key
+        self.timings = {}  # Seconds spent opening the current version
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._name = None
+        self._opened = None
+
+    def get(self):
+        """
+        Returns:
+            tuple: (collection, embedding function, version) of the active version.
+        """
+        path = registry_path(self.chroma_path)
+        stamp = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        with self._lock:
+            if self._opened is None or stamp != self._stamp:
+                version = get_active_version(self.chroma_path)
+                if version["name"] != self._name:
+                    timings = {}
+                    collection, embedding_function = open_version_collection(self.client, version, self.api_key,
+                                                                             timings)
+                    self._opened = (collection, embedding_function, version)
+                    self._name = version["name"]
+                    self.timings = timings
+                self._stamp = stamp
+            return self._opened
@@ -0,0 +1,64 @@
+# utils/ingest_journal.py
+import os
+import threading
+from logger import logger
+
+TORN_LINE_MARKER = b"\x00"
+
+
+class IngestJournal:
+    """
+    Durable, append-only record of the work items (test case ids, CSV row
+    numbers, ...) an ingestion job has committed to its vector store.
+
+    Each call to `record` appends one line per id and fsyncs, so after a
+    crash the journal never claims more than what was actually committed.
+    A job started with --resume loads the journal and skips those items.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read the ids committed by a previous run. Returns the set of ids."""
+        self.done = set()
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    # A line without its newline (or poisoned later) was cut off by a crash mid-write
+                    if line.endswith("\n") and line.strip() and TORN_LINE_MARKER.decode() not in line:
+                        self.done.add(line.rstrip("\n"))
+            logger.info(f"Resuming: {len(self.done)} items already committed according to {self.path}.")
+        return self.done
+
+    def reset(self):
+        """Start a fresh journal for a new (non-resumed) job."""
+        self.done = set()
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record(self, ids):
+        """Durably append newly committed ids."""
+        ids = [str(i) for i in ids]
+        if not ids:
+            return
+        with self._lock, open(self.path, "ab+") as f:
+            # Poison and terminate a line cut off by an earlier crash so it is never read as an id
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(TORN_LINE_MARKER + b"\n")
+            f.write("".join(f"{i}\n" for i in ids).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            self.done.update(ids)
+
+    def __contains__(self, item_id):
+        return str(item_id) in self.done
+
+    def __len__(self):
+        return len(self.done)
@@ -0,0 +1,97 @@
+# utils/json_stream.py
+import json
+
+# Errors a truncated but otherwise valid value can raise; any other decode
+# error is malformed input, wherever it is in the buffer
+_TRUNCATION_ERRORS = ("Unterminated string",)
+# A \uXXXX escape cut by the buffer edge fails a few characters before it
+_ESCAPE_MARGIN = 6
+
+
+def _may_be_truncated(error, buffer):
+    return error.pos >= len(buffer) - _ESCAPE_MARGIN or error.msg.startswith(_TRUNCATION_ERRORS)
+
+
+def iter_json_array(json_path, chunk_size=1 << 16):
+    """
+    Incrementally parse a file holding a top-level JSON array (such as a
+    TestRail cases.json export) and yield one element at a time. Only the
+    current chunk of the file and the element being decoded are held in
+    memory, so memory use stays flat no matter how large the file is.
+
+    An element that does not fit in the buffer is retried after reading at
+    least as much again as is buffered, so even one very large element is
+    decoded a logarithmic number of times rather than once per chunk.
+
+    Args:
+        json_path (str or Path): Path to the JSON file.
+        chunk_size (int): Number of characters read from the file at a time.
+
+    Yields:
+        The decoded array elements (test cases, for TestRail exports).
+
+    Raises:
+        ValueError: If the file is not a well-formed JSON array, e.g. elements
+                    are not separated by exactly one comma. json.JSONDecodeError
+                    is a ValueError.
+    """
+    decoder = json.JSONDecoder()
+    whitespace = " \t\n\r"
+
+    with open(json_path, "r", encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def fill(size=chunk_size):
+            nonlocal buffer, pos, eof
+            chunk = f.read(size)
+            if not chunk:
+                eof = True
+            # Drop everything already consumed before appending the new chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in whitespace:
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                fill()
+
+        def next_char():
+            skip_whitespace()
+            if pos >= len(buffer):
+                raise ValueError(f"Unexpected end of file while reading {json_path}.")
+            return buffer[pos]
+
+        skip_whitespace()
+        if pos >= len(buffer) or buffer[pos] != "[":
+            raise ValueError(f"{json_path} does not contain a top-level JSON array.")
+        pos += 1
+        if next_char() == "]":
+            return
+
+        while True:
+            next_char()
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # A value that ends exactly at the buffer edge may be truncated
+                if end >= len(buffer) and not eof:
+                    raise json.JSONDecodeError("Value may continue in the next chunk", buffer, end)
+            except json.JSONDecodeError as e:
+                if eof or not _may_be_truncated(e, buffer):
+                    raise
+                fill(max(chunk_size, len(buffer) - pos))
+                continue
+            pos = end
+            yield value
+
+            separator = next_char()
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or ']' between array elements of {json_path}, found {separator!r}.")
+            pos += 1
@@ -1,52 +1,65 @@
+import argparse
+import hashlib
 import json
 import asyncio
+import time
 from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
 import os
-import numpy as np
 
 from dotenv import load_dotenv
 load_dotenv()  # Load environment variables from .env
 
 from config import DEBUG
 
-import chromadb
-import chromadb.utils.embedding_functions as embedding_functions
+from utils.chroma_store import get_client, get_version_collection
+from utils.chunking import MAX_CHUNK_TOKENS, chunk_id, chunk_test_case
+from utils.dedup import DEDUP_THRESHOLD, NearDuplicateIndex
+from utils.embeddings import generate_embeddings
+from utils.index_versions import get_active_version
+from utils.ingest_journal import IngestJournal
+from utils.json_stream import iter_json_array
+from utils.testrail_api import TestRailClient, load_last_pull, save_last_pull, INCREMENTAL_OVERLAP_SECONDS
 
-# ---------------------------
-# 1) CREATE A PERSISTENT CLIENT (NEW API)
-# ---------------------------
-client = chromadb.PersistentClient(path="./chroma_db")
-
-# ---------------------------
-# 2) DEFINE CUSTOM EMBEDDING FUNCTION
-# ---------------------------
+CHROMA_PATH = "./chroma_db"
 openai_api_key = os.getenv("OPENAI_API_KEY")
-try:
-    openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-        api_key=openai_api_key,
-        model_name="text-embedding-3-small"
-    )
-except AttributeError as e:
-    print("Warning: Could not find OpenAIEmbeddingFunction. Check your ChromaDB version.")
-    raise e
-
-# ---------------------------
-# 3) GET OR CREATE YOUR COLLECTION
-# ---------------------------
-collection = client.get_or_create_collection(
-    name="testrail_test_cases",
-    embedding_function=openai_ef,
-    metadata={"description": "TestRail test cases stored with Chroma"}
-)
-
-async def process_and_insert(executor, test_case):
-    loop = asyncio.get_event_loop()
 
+# Index version this process imports into, resolved on first use
+_import_version = None
+
+
+def import_version():
+    """
+    The index version imports write to: whichever model/dimension version
+    was live when the import first needed it (see utils/index_versions.py).
+    It stays fixed for the rest of the process.
+    """
+    global _import_version
+    if _import_version is None:
+        _import_version = get_active_version(CHROMA_PATH)
+    return _import_version
+
+
+def import_collection():
+    """
+    The collection of import_version(), opened once per process on first
+    use, so importing this module does not open Chroma. Its embedding
+    function goes through the same batching and persistent embedding cache
+    as generate_embeddings.
+    """
+    return get_version_collection(CHROMA_PATH, import_version(), openai_api_key)[0]
+
+
+def build_test_case_parts(test_case):
+    """
+    Render a single TestRail test case as a header block (title, description,
+    preconditions) and one text block per step.
+    """
     # ---------------------------
     # BUILD TEXT FROM JSON FIELDS
     # ---------------------------
-    combined_text = (
+    header = (
         f"Title: {test_case.get('title', '')}\n"
         f"Description: {test_case.get('custom_testcase_description', '')}\n"
         f"Preconditions: {test_case.get('custom_preconds', '')}\n"
@@ -56,105 +69,490 @@ async def process_and_insert(executor, test_case):
     if DEBUG:
         print(f"Processing test case ID {test_case.get('id')} with {len(steps)} steps.")
 
+    step_texts = []
     for idx, step in enumerate(steps):
-        step_info = (
+        step_texts.append(
             f"Step {idx + 1} Content: {step.get('content', '')}\n"
             f"Expected: {step.get('expected', '')}\n"
             f"Additional Info: {step.get('additional_info', '')}\n"
             f"Refs: {step.get('refs', '')}\n"
         )
-        combined_text += step_info
+
+    return header, step_texts
+
+
+def content_hash(text):
+    """Short, stable hash of a test case's embedded text, used to detect changes."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def load_index_state(page_size=5000):
+    """
+    Read the updated_on, content hash, chunk ids and near-duplicate count
+    of every test case already in the collection, paging through it so
+    large collections are not fetched in one call. Documents indexed before
+    chunking have no parent_id and are their own parent.
+
+    Returns:
+        dict: Maps parent test case id to an (updated_on, content_hash, chunk_ids, duplicate_count) tuple.
+    """
+    state = {}
+    offset = 0
+    while True:
+        page = import_collection().get(include=["metadatas"], limit=page_size, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        for doc_id, metadata in zip(ids, page.get("metadatas") or [{}] * len(ids)):
+            metadata = metadata or {}
+            parent_id = str(metadata.get("parent_id", doc_id))
+            _, _, chunk_ids, _ = state.setdefault(
+                parent_id,
+                (metadata.get("updated_on"), metadata.get("content_hash"), set(), metadata.get("duplicate_count", 0))
+            )
+            chunk_ids.add(doc_id)
+        offset += len(ids)
 
     if DEBUG:
-        print(f"Combined text for test case {test_case.get('id')} prepared. Original length: {len(combined_text)}")
+        print(f"Loaded index state for {len(state)} test cases.")
+    return state
 
-    # ---------------------------
-    # TRIM IF TEXT IS TOO LARGE
-    # ---------------------------
-    max_length = 2000
-    if len(combined_text) > max_length:
-        combined_text = combined_text[:max_length]
-        if DEBUG:
-            print(f"Trimmed text to {max_length} characters.")
 
-    # ---------------------------
-    # GENERATE EMBEDDING WITH THROTTLING
-    # ---------------------------
-    try:
-        result = await loop.run_in_executor(executor, openai_ef, combined_text)
-
-        if isinstance(result, list) and len(result) > 0:
-            # Flatten embedding if needed
-            if isinstance(result[0], np.ndarray):
-                embedding = result[0].tolist()
-            elif (
-                isinstance(result[0], list) and
-                len(result[0]) > 0 and
-                isinstance(result[0][0], np.ndarray)
-            ):
-                embedding = [np.array(x).tolist() for x in result]
-            else:
-                embedding = result
+def is_unchanged(parent_id, records, index_state):
+    """
+    True if the indexed copy of a test case has the same updated_on, content
+    hash and chunk ids as the one being imported.
+    """
+    indexed = index_state.get(parent_id)
+    if indexed is None:
+        return False
+    indexed_updated_on, indexed_hash, indexed_chunk_ids, _ = indexed
+    metadata = records[0][2]
+    return (indexed_updated_on == metadata["updated_on"]
+            and indexed_hash == metadata["content_hash"]
+            and indexed_chunk_ids == {doc_id for doc_id, _, _ in records})
+
+
+def delete_removed_test_cases(index_state, seen_ids, stale_ids=(), batch_size=5000):
+    """
+    Delete the chunks of indexed test cases that no longer appear in the
+    export, plus stale chunks of changed cases that now have fewer chunks.
+    """
+    removed = [parent_id for parent_id in index_state if parent_id not in seen_ids]
+    doomed = [doc_id for parent_id in removed for doc_id in index_state[parent_id][2]]
+    doomed.extend(stale_ids)
+    for i in range(0, len(doomed), batch_size):
+        import_collection().delete(ids=doomed[i:i + batch_size])
+
+    if DEBUG:
+        print(f"Deleted {len(removed)} test cases that were removed from the export "
+              f"and {len(doomed)} chunks in total.")
+    return len(removed)
+
+
+def record_duplicate_members(dedup, rep_chunk_ids, index_state, batch_size=5000):
+    """
+    Store the ids of each representative's near-duplicates on its chunks
+    (a metadata-only update; nothing is re-embedded). Representatives that
+    had duplicates in the index but no longer do are cleared.
+
+    Returns:
+        int: Number of representatives that have near-duplicates.
+    """
+    ids, metadatas = [], []
+    clusters = 0
+    for rep_id, members in dedup.members.items():
+        previously = index_state[rep_id][3] if index_state and rep_id in index_state else 0
+        if not members and not previously:
+            continue
+        if members:
+            clusters += 1
+            metadata = {"duplicate_ids": ",".join(members), "duplicate_count": len(members)}
         else:
-            embedding = result
+            metadata = {"duplicate_ids": None, "duplicate_count": 0}
+        for doc_id in rep_chunk_ids[rep_id]:
+            ids.append(doc_id)
+            metadatas.append(metadata)
 
-        # Throttle to avoid exceeding rate limits
-        await asyncio.sleep(0.2)  # 0.2 seconds pause between requests
+    for i in range(0, len(ids), batch_size):
+        import_collection().update(ids=ids[i:i + batch_size], metadatas=metadatas[i:i + batch_size])
 
-    except Exception as e:
-        print(f"Error generating embedding for test case ID {test_case.get('id')}: {e}")
-        return
+    if DEBUG:
+        print(f"Recorded near-duplicate members on {clusters} representative test cases.")
+    return clusters
+
+
+def build_records(test_case, max_tokens=MAX_CHUNK_TOKENS):
+    """
+    Turn a TestRail test case into the (id, document, metadata) triples of
+    its chunks, as stored in Chroma. Chunks are cut at step boundaries and
+    carry their parent test case id, so query hits can be aggregated back
+    to whole test cases.
+
+    Returns:
+        tuple: The parent test case id and the list of chunk records.
+    """
+    parent_id = str(test_case["id"])
+    header, step_texts = build_test_case_parts(test_case)
+    chunks = chunk_test_case(header, step_texts, max_tokens)
 
-    doc_id = str(test_case["id"])
-    metadata = {
+    base_metadata = {
         "title": test_case.get("title"),
         "priority_id": test_case.get("priority_id"),
         "section_id": test_case.get("section_id"),
+        "updated_on": test_case.get("updated_on"),
+        "content_hash": content_hash(header + "".join(step_texts)),
+        "parent_id": parent_id,
+        "chunk_count": len(chunks),
     }
+    if DEBUG and len(chunks) > 1:
+        print(f"Split test case {parent_id} into {len(chunks)} chunks.")
 
-    if DEBUG:
-        print(f"Inserting test case ID {doc_id} into Chroma collection.")
-
-    try:
-        collection.add(
-            ids=[doc_id],
-            documents=[combined_text],
-            embeddings=[embedding],
-            metadatas=[metadata]
+    records = [
+        (chunk_id(parent_id, index), text, {**base_metadata, "chunk_index": index})
+        for index, text in enumerate(chunks)
+    ]
+    return parent_id, records
+
+
+class PipelineStats:
+    """Counters shared by the pipeline stages, with a one-line throughput readout."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.read = 0
+        self.skipped = 0
+        self.resumed = 0
+        self.duplicates = 0
+        self.embedded = 0
+        self.written = 0
+        self.failed = 0
+        self.failed_ids = set()  # Chunks that could not be embedded or written
+
+    def report(self, embed_queue, write_queue):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        print(
+            f"[json_to_vector] {elapsed:7.1f}s | "
+            f"read {self.read} cases ({self.read / elapsed:.0f}/s), skipped {self.skipped}, "
+            f"duplicates {self.duplicates}, resumed {self.resumed} | "
+            f"embedded {self.embedded} chunks ({self.embedded / elapsed:.0f}/s) | "
+            f"written {self.written} chunks ({self.written / elapsed:.0f}/s) | "
+            f"failed {self.failed} | "
+            f"queues embed {embed_queue.qsize()}/{embed_queue.maxsize} write {write_queue.qsize()}/{write_queue.maxsize}"
         )
-    except Exception as e:
-        print(f"Error inserting test case ID {doc_id} into collection: {e}")
-        return
 
-    if DEBUG:
-        print(f"Test case ID {doc_id} inserted successfully.")
 
-async def main():
-    json_path = Path(__file__).parent / "cases.json"
-    if DEBUG:
-        print(f"Loading JSON data from {json_path}")
+async def build_stage(executor, test_cases, embed_queue, embed_batch_size, stats, index_state, seen_ids,
+                      stale_ids, journal, max_tokens, dedup, rep_chunk_ids):
+    """
+    Stage 1: read test cases, chunk them and build their metadata, drop
+    near-duplicates of earlier cases, unchanged ones in sync mode and ones
+    a resumed job already committed, and hand embedding-sized batches of
+    chunks to the next stage. Blocks when the embed queue is full, which
+    throttles reading.
+    """
+    loop = asyncio.get_running_loop()
 
-    with open(json_path, 'r') as f:
-        data = json.load(f)
+    def next_cases():
+        cases = []
+        for test_case in islice(test_cases, embed_batch_size):
+            parent_id, records = build_records(test_case, max_tokens)
+            rep_id = parent_id
+            if dedup is not None:
+                # Cases of different priorities or sections are kept apart, however alike
+                rep_id = dedup.assign(parent_id, "".join(text for _, text, _ in records),
+                                      group=(test_case.get("priority_id"), test_case.get("section_id")))
+            cases.append((parent_id, records, rep_id))
+        return cases
 
-    if DEBUG:
-        print(f"Loaded {len(data)} test cases from JSON.")
+    pending = []
+    while True:
+        cases = await loop.run_in_executor(executor, next_cases)
+        if not cases:
+            break
+        stats.read += len(cases)
 
-    all_data = data  # Use all test cases
-    batch_size = 100  # Adjust as needed
+        for parent_id, records, rep_id in cases:
+            if rep_id != parent_id:
+                # Represented by an earlier near-identical case; not indexed on its own
+                stats.duplicates += 1
+                if index_state is not None:
+                    seen_ids.add(parent_id)
+                    if parent_id in index_state:
+                        replaced_by = tuple(rep_chunk_ids.get(rep_id, ()))
+                        stale_ids.extend((doc_id, replaced_by) for doc_id in index_state[parent_id][2])
+                continue
+            rep_chunk_ids[parent_id] = [doc_id for doc_id, _, _ in records]
 
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        for i in range(0, len(all_data), batch_size):
-            batch = all_data[i:i + batch_size]
-            if DEBUG:
-                print(f"Processing batch {i // batch_size + 1}: Test cases {i} to {i + len(batch) - 1}")
-            tasks = [process_and_insert(executor, test_case) for test_case in batch]
-            await asyncio.gather(*tasks)
+            if index_state is not None:
+                seen_ids.add(parent_id)
+                if is_unchanged(parent_id, records, index_state):
+                    stats.skipped += 1
+                    continue
+                if parent_id in index_state:
+                    # Chunks the new version no longer has are deleted once the import finishes,
+                    # and only if the new version was written
+                    new_ids = tuple(doc_id for doc_id, _, _ in records)
+                    stale_ids.extend((doc_id, new_ids) for doc_id in index_state[parent_id][2]
+                                     if doc_id not in new_ids)
+            if all(doc_id in journal for doc_id, _, _ in records):
+                stats.resumed += 1
+                continue
+            pending.extend(records)
+
+        while len(pending) >= embed_batch_size:
+            await embed_queue.put(pending[:embed_batch_size])
+            pending = pending[embed_batch_size:]
+
+    if pending:
+        await embed_queue.put(pending)
+
+
+async def embed_stage(executor, embed_queue, write_queue, stats):
+    """
+    Stage 2: embed each batch with batched, rate-limited requests and pass
+    the results on. Several of these run concurrently.
+    """
+    loop = asyncio.get_running_loop()
+    version = import_version()
+    while True:
+        records = await embed_queue.get()
+        try:
+            texts = [text for _, text, _ in records]
+            embeddings = await loop.run_in_executor(
+                executor, generate_embeddings, texts, version["model"], version["dimension"]
+            )
+            stats.embedded += len(records)
+            await write_queue.put([record + (embedding,) for record, embedding in zip(records, embeddings)])
+        except Exception as e:
+            stats.failed += len(records)
+            stats.failed_ids.update(doc_id for doc_id, _, _ in records)
+            print(f"Error generating embeddings for {len(records)} chunks starting at ID {records[0][0]}: {e}")
+        finally:
+            embed_queue.task_done()
+
+
+async def write_stage(executor, write_queue, write_batch_size, stats, journal):
+    """
+    Stage 3: upsert embedded test cases into Chroma. Whatever is already
+    waiting in the queue is merged into one call of up to write_batch_size
+    documents, so each SQLite transaction covers many documents. Committed
+    ids are recorded in the progress journal after every upsert.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        groups = [await write_queue.get()]
+        size = len(groups[0])
+        while size < write_batch_size and not write_queue.empty():
+            groups.append(write_queue.get_nowait())
+            size += len(groups[-1])
+
+        rows = [row for group in groups for row in group]
+        written = 0
+        try:
+            for i in range(0, len(rows), write_batch_size):
+                chunk = rows[i:i + write_batch_size]
+                ids = [doc_id for doc_id, _, _, _ in chunk]
+                await loop.run_in_executor(executor, lambda: import_collection().upsert(
+                    ids=ids,
+                    documents=[text for _, text, _, _ in chunk],
+                    metadatas=[metadata for _, _, metadata, _ in chunk],
+                    embeddings=[embedding for _, _, _, embedding in chunk],
+                ))
+                await loop.run_in_executor(executor, journal.record, ids)
+                written += len(chunk)
+                stats.written += len(chunk)
             if DEBUG:
-                print(f"Completed batch {i // batch_size + 1}")
+                print(f"Upserted {len(rows)} chunks into Chroma collection.")
+        except Exception as e:
+            stats.failed += len(rows) - written
+            stats.failed_ids.update(row[0] for row in rows[written:])
+            print(f"Error upserting {len(rows)} chunks starting at ID {rows[0][0]} into collection: {e}")
+        finally:
+            for _ in groups:
+                write_queue.task_done()
+
+
+async def report_stage(stats, embed_queue, write_queue, interval):
+    """Print a live throughput readout every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        stats.report(embed_queue, write_queue)
+
+
+async def main(json_path=None, sync=False, embed_batch_size=500, embed_workers=4,
+               write_batch_size=5000, write_workers=1, queue_size=8, report_interval=10.0,
+               resume=False, journal_path=None, chunk_tokens=MAX_CHUNK_TOKENS,
+               testrail=False, project_ids=None, updated_after=None, incremental=False,
+               dedup_threshold=DEDUP_THRESHOLD):
+    """
+    Import test cases from a TestRail JSON export, or straight from the
+    TestRail API, into Chroma through a three-stage pipeline (build text ->
+    embed -> bulk write). The stages are connected by bounded queues, so a
+    slow stage applies backpressure to the ones before it instead of letting
+    work pile up in memory.
+
+    Args:
+        json_path (str or Path): Path to cases.json; defaults to the file next to this script.
+        sync (bool): Only embed and upsert new or changed cases, and delete
+                     indexed cases that are missing from the export.
+        embed_batch_size (int): Chunks per embedding batch.
+        embed_workers (int): Embedding batches in flight at once.
+        write_batch_size (int): Maximum documents per Chroma upsert.
+        write_workers (int): Concurrent Chroma writers.
+        queue_size (int): Capacity, in batches, of each queue between stages.
+        report_interval (float): Seconds between throughput readouts; 0 disables them.
+        resume (bool): Skip test cases the progress journal records as committed by an earlier run.
+        journal_path (str): Progress journal location; defaults to <json_path>.journal.
+        chunk_tokens (int): Token budget per chunk; test cases are split at step boundaries.
+        testrail (bool): Pull cases from the TestRail API instead of reading cases.json.
+        project_ids (list): TestRail projects to pull; all projects if None.
+        updated_after (int): Only pull cases updated after this Unix time. Implies
+                             sync, but nothing is deleted because the pull is partial.
+        incremental (bool): Set updated_after from the last successful TestRail pull.
+        dedup_threshold (float): Estimated Jaccard similarity at which a case is folded
+                                 into an earlier near-identical one of the same priority
+                                 and section; 0 disables it.
+
+    Returns:
+        PipelineStats: Counts of what was read, skipped, embedded, written and failed.
+    """
+    pull_started = time.time()
+    if testrail:
+        if incremental and updated_after is None:
+            last_pull = load_last_pull()
+            if last_pull is not None:
+                updated_after = int(last_pull - INCREMENTAL_OVERLAP_SECONDS)
+        print(f"Pulling test cases from the TestRail API"
+              + (f" updated after {updated_after}." if updated_after is not None else "."))
+        test_cases = TestRailClient.from_env().iter_cases(project_ids, updated_after)
+        journal_path = journal_path or "testrail.journal"
+    else:
+        json_path = json_path or Path(__file__).parent / "cases.json"
+        if DEBUG:
+            print(f"Streaming JSON data from {json_path}")
+
+        # Stream the export instead of loading it whole
+        test_cases = iter_json_array(json_path)
+        journal_path = journal_path or f"{json_path}.journal"
+
+    # A partial pull still has to replace the chunks of the cases it contains
+    partial = testrail and updated_after is not None
+    sync = sync or partial
+
+    # Clusters need the whole corpus; a partial pull would misreport members
+    dedup = NearDuplicateIndex(dedup_threshold) if dedup_threshold > 0 and not partial else None
+    rep_chunk_ids = {}
+
+    seen_ids = set()
+    stale_ids = []
+    index_state = load_index_state() if sync else None
+
+    journal = IngestJournal(journal_path)
+    if resume:
+        journal.load()
+    else:
+        journal.reset()
+
+    # Chroma rejects upserts above its maximum batch size
+    write_batch_size = min(write_batch_size, get_client(CHROMA_PATH).get_max_batch_size())
+
+    stats = PipelineStats()
+    embed_queue = asyncio.Queue(maxsize=queue_size)
+    write_queue = asyncio.Queue(maxsize=queue_size)
+
+    with ThreadPoolExecutor(max_workers=embed_workers + write_workers + 1) as executor:
+        workers = [asyncio.create_task(embed_stage(executor, embed_queue, write_queue, stats))
+                   for _ in range(embed_workers)]
+        workers += [asyncio.create_task(write_stage(executor, write_queue, write_batch_size, stats, journal))
+                    for _ in range(write_workers)]
+        reporter = (asyncio.create_task(report_stage(stats, embed_queue, write_queue, report_interval))
+                    if report_interval > 0 else None)
+
+        try:
+            await build_stage(executor, test_cases, embed_queue, embed_batch_size, stats,
+                              index_state, seen_ids, stale_ids, journal, chunk_tokens, dedup, rep_chunk_ids)
+            # Drain the stages in order before shutting the workers down
+            await embed_queue.join()
+            await write_queue.join()
+        finally:
+            for task in workers + ([reporter] if reporter else []):
+                task.cancel()
+            await asyncio.gather(*workers, *([reporter] if reporter else []), return_exceptions=True)
+
+    stats.report(embed_queue, write_queue)
+
+    if dedup is not None:
+        clusters = record_duplicate_members(dedup, rep_chunk_ids, index_state)
+        print(f"Near-duplicates: {stats.duplicates} test cases folded into {clusters} representatives.")
+
+    if sync:
+        # Keep the old chunks of a case whose new version failed, so it stays searchable
+        kept = [doc_id for doc_id, replaced_by in stale_ids if not stats.failed_ids.isdisjoint(replaced_by)]
+        stale_ids = [doc_id for doc_id, replaced_by in stale_ids if stats.failed_ids.isdisjoint(replaced_by)]
+        if kept:
+            print(f"Kept {len(kept)} stale chunks because the chunks replacing them failed; re-run --sync to retry.")
+        if partial:
+            # Cases missing from a partial pull were not removed, just not updated
+            removed = delete_removed_test_cases({}, seen_ids, stale_ids)
+        else:
+            removed = delete_removed_test_cases(index_state, seen_ids, stale_ids)
+        print(f"Sync complete: {stats.written} chunks of new or changed test cases upserted, "
+              f"{stats.skipped} unchanged, {removed} removed.")
+
+    if testrail and stats.failed == 0:
+        save_last_pull(pull_started)
 
     if DEBUG:
         print("All test cases have been processed and inserted into Chroma.")
+    return stats
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Import TestRail test cases into Chroma from cases.json or the API.")
+    parser.add_argument("--json-path", help="Path to cases.json (defaults to the file next to this script).")
+    parser.add_argument("--sync", action="store_true",
+                        help="Only re-embed new or changed cases and delete cases removed from the export.")
+    parser.add_argument("--embed-batch-size", type=int, default=500, help="Chunks per embedding batch.")
+    parser.add_argument("--embed-workers", type=int, default=4, help="Embedding batches in flight at once.")
+    parser.add_argument("--write-batch-size", type=int, default=5000, help="Maximum documents per Chroma upsert.")
+    parser.add_argument("--write-workers", type=int, default=1, help="Concurrent Chroma writers.")
+    parser.add_argument("--queue-size", type=int, default=8, help="Batches buffered between stages.")
+    parser.add_argument("--report-interval", type=float, default=10.0,
+                        help="Seconds between throughput readouts (0 to disable).")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted import, skipping cases it already committed.")
+    parser.add_argument("--journal", help="Progress journal path (defaults to <json-path>.journal).")
+    parser.add_argument("--chunk-tokens", type=int, default=MAX_CHUNK_TOKENS,
+                        help="Token budget per chunk; long test cases are split at step boundaries.")
+    parser.add_argument("--dedup-threshold", type=float, default=DEDUP_THRESHOLD,
+                        help="Similarity at which near-identical cases of the same priority and section "
+                             "are indexed once (0 to disable).")
+    parser.add_argument("--testrail", action="store_true",
+                        help="Pull cases from the TestRail API (TESTRAIL_URL, TESTRAIL_USERNAME, TESTRAIL_API_KEY).")
+    parser.add_argument("--project-id", type=int, action="append", dest="project_ids",
+                        help="TestRail project to pull; repeat for several (default: all projects).")
+    parser.add_argument("--updated-after", type=int,
+                        help="Only pull cases updated after this Unix timestamp.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only pull cases updated since the last successful TestRail pull.")
+    args = parser.parse_args()
+    stats = asyncio.run(main(
+        json_path=args.json_path,
+        sync=args.sync,
+        embed_batch_size=args.embed_batch_size,
+        embed_workers=args.embed_workers,
+        write_batch_size=args.write_batch_size,
+        write_workers=args.write_workers,
+        queue_size=args.queue_size,
+        report_interval=args.report_interval,
+        resume=args.resume,
+        journal_path=args.journal,
+        chunk_tokens=args.chunk_tokens,
+        testrail=args.testrail,
+        project_ids=args.project_ids,
+        updated_after=args.updated_after,
+        incremental=args.incremental,
+        dedup_threshold=args.dedup_threshold,
+    ))
+    if stats.failed:
+        raise SystemExit(f"{stats.failed} chunks failed to import; see the errors above.")
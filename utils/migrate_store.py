@@ -0,0 +1,282 @@
+# utils/migrate_store.py
+import argparse
+import functools
+import itertools
+import os
+import time
+
+import faiss
+import numpy as np
+import chromadb
+from logger import logger
+
+from utils.row_keys import RowKeys
+from utils.vector_db_faiss import (INDEX_FILE, METADATA_FILE, LEGACY_METADATA_FILE, KEYS_FILE, DELETED_FILE, WAL_FILE,
+                                   PENDING_FILE, VECTORS_FILE, SNAPSHOTS, build_faiss_index, document_text, is_lossy,
+                                   open_full_vectors, open_metadata_store, prepare_vectors, train_faiss_index,
+                                   training_size, write_faiss_snapshot)
+from utils.index_versions import COLLECTION_DESCRIPTION, get_active_version, hnsw_configuration
+
+CHROMA_PATH = "./chroma_db"
+
+BATCH_SIZE = 5000
+
+
+def faiss_item(document, metadata):
+    """
+    FAISS metadata item of a Chroma record: its document, or a dict of the
+    document ("text") and its Chroma metadata (parent_id, priority_id, ...).
+    """
+    return {**metadata, "text": document} if metadata else document
+
+
+def chroma_metadata(item):
+    """Chroma metadata of a FAISS metadata item, the inverse of faiss_item(); None for plain text."""
+    if not isinstance(item, dict):
+        return None
+    return {name: value for name, value in item.items() if name != "text"} or None
+
+
+def iter_chroma_batches(collection, batch_size=BATCH_SIZE):
+    """
+    Page through a Chroma collection, yielding stored embeddings with their
+    ids, documents and metadata. Nothing is re-embedded.
+
+    Yields:
+        tuple: (ids, float32 embedding matrix, documents, metadatas) per page.
+    """
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            return
+        embeddings = np.ascontiguousarray(page["embeddings"], dtype=np.float32)
+        documents = [document or "" for document in (page.get("documents") or [None] * len(ids))]
+        metadatas = page.get("metadatas") or [None] * len(ids)
+        yield ids, embeddings, documents, metadatas
+        offset += len(ids)
+
+
+def unmerged_changes(snapshot):
+    """Path of the write-ahead log of `snapshot` if it holds changes not merged into it yet, else None."""
+    path = os.path.join(snapshot, WAL_FILE)
+    return path if os.path.exists(path) and os.path.getsize(path) else None
+
+
+def live_rows(index, row_keys):
+    """Rows of `index` that are not deleted or replaced; rows indexed before keys were tracked are live."""
+    deleted = np.zeros(index.ntotal, dtype=bool)
+    saved = row_keys.deleted[:index.ntotal]
+    deleted[:len(saved)] = saved
+    return np.flatnonzero(~deleted)
+
+
+def open_snapshot_vectors(snapshot, index):
+    """
+    Open the full-precision vectors saved next to a lossy (fp16, int8, PQ)
+    or two-stage index in `snapshot`. Their dimension is read off the file
+    size, since a two-stage index only holds the leading dimensions.
+
+    Returns:
+        VectorFile or None: None when the index stores full vectors itself,
+                            or the file is missing or does not line up.
+    """
+    path = os.path.join(snapshot, VECTORS_FILE)
+    if not index.ntotal or not os.path.exists(path):
+        if is_lossy(index):
+            logger.warning(f"{path} is missing; exporting the approximate vectors the index reconstructs.")
+        return None
+    pending_path = os.path.join(snapshot, PENDING_FILE)
+    rows = index.ntotal + (len(np.load(pending_path, mmap_mode="r")) if os.path.exists(pending_path) else 0)
+    dimension, remainder = divmod(os.path.getsize(path), 4 * rows)
+    if remainder or dimension < index.d:
+        logger.warning(f"{path} does not line up with the {rows} vectors of the index; ignoring it.")
+        return None
+    return open_full_vectors(path, index, read_only=True, dimension=dimension)
+
+
+def iter_faiss_batches(index, documents, row_keys, full_vectors=None, batch_size=BATCH_SIZE):
+    """
+    Read the live rows of a FAISS index back out in order, paired with
+    their documents, Chroma metadata and ids. Deleted and replaced rows are
+    skipped. A row's id is its key; unkeyed rows are named "faiss-<row>",
+    as searches name them.
+
+    Vectors come from `full_vectors` when given (see open_snapshot_vectors),
+    so a lossy or two-stage index exports the embeddings it was built from
+    rather than its compressed or shortened copies.
+
+    Yields:
+        tuple: (ids, float32 embedding matrix, documents, metadatas) per batch.
+    """
+    if full_vectors is None and isinstance(index, faiss.IndexIVF):
+        # IVF indexes can only reconstruct by position once they keep a direct map
+        index.make_direct_map()
+
+    rows = live_rows(index, row_keys)
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        vectors = full_vectors.take(batch) if full_vectors is not None else index.reconstruct_batch(batch)
+        embeddings = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids, batch_documents, metadatas = [], [], []
+        for row in batch.tolist():
+            key = row_keys.keys[row] if row < len(row_keys) else None
+            item = documents[row]
+            ids.append(key if key is not None else f"faiss-{row}")
+            batch_documents.append(document_text(item))
+            metadatas.append(chroma_metadata(item))
+        yield ids, embeddings, batch_documents, metadatas
+
+
+def chroma_to_faiss(chroma_path=CHROMA_PATH, collection_name=None, batch_size=BATCH_SIZE, force=False):
+    """
+    Copy a Chroma collection into a FAISS index of the configured type,
+    metric, storage and coarse dimension (FAISS_INDEX_TYPE, FAISS_METRIC,
+    FAISS_STORAGE, FAISS_COARSE_DIMENSION), using the embeddings Chroma
+    already stores, and publish it as a new FAISS snapshot. Defaults to the
+    collection of the active index version.
+
+    Each Chroma id becomes its row's key, so later upserts and deletes by
+    that id replace the row instead of adding a copy. The document and
+    Chroma metadata (including the TestRail filter fields and the parent_id
+    that groups a test case's chunks) become the row's metadata item.
+    Records are written page by page as they are read; an index that needs
+    training is trained on the leading pages first.
+
+    Args:
+        force (bool): Replace the current snapshot even if its write-ahead
+                      log holds changes not merged into it; they are lost.
+
+    Raises:
+        ValueError: If the current snapshot has unmerged changes and `force` is not set.
+
+    Returns:
+        int: Number of vectors written.
+    """
+    current = SNAPSHOTS.current()
+    log = unmerged_changes(current) if current else None
+    if log and not force:
+        raise ValueError(f"{log} holds changes that are not in the current snapshot yet, and the new snapshot "
+                         f"would drop them. Open the index writable and call save_faiss_index(final=True) to "
+                         f"merge them, or pass --force to discard them.")
+
+    client = chromadb.PersistentClient(path=chroma_path)
+    collection_name = collection_name or get_active_version(chroma_path)["collection"]
+    # No embedding function: vectors are read back, never computed
+    collection = client.get_collection(name=collection_name, embedding_function=None)
+
+    pages = iter_chroma_batches(collection, batch_size)
+    first = next(pages, None)
+    if first is None:
+        logger.warning(f"Chroma collection '{collection_name}' is empty; nothing to migrate.")
+        return 0
+    dimension = first[1].shape[1]
+    index = build_faiss_index(dimension)
+    read = [first]
+    if not index.is_trained:
+        # Hold pages back until they are enough to train on (or the collection ends)
+        while sum(len(page[0]) for page in read) < training_size(index):
+            page = next(pages, None)
+            if page is None:
+                break
+            read.append(page)
+        index = train_faiss_index(index, prepare_vectors(np.concatenate([page[1] for page in read]), index))
+
+    def batches():
+        started = time.monotonic()
+        for ids, embeddings, documents, metadatas in itertools.chain(read, pages):
+            items = [faiss_item(document, metadata) for document, metadata in zip(documents, metadatas)]
+            yield prepare_vectors(embeddings, index), items, ids, metadatas
+            logger.info(f"Copied {index.ntotal} vectors from Chroma ({time.monotonic() - started:.1f}s).")
+
+    destination = write_faiss_snapshot(index, batches(), dimension)
+    logger.info(f"Wrote {index.ntotal} vectors to {destination}.")
+    return index.ntotal
+
+
+def faiss_to_chroma(snapshot=None, chroma_path=CHROMA_PATH, collection_name=None, batch_size=BATCH_SIZE):
+    """
+    Bulk-load a FAISS snapshot (the current one by default, or the index
+    saved in the working directory before snapshots existed) into a Chroma
+    collection, upserting the stored vectors directly. Row keys become the
+    Chroma ids and dict metadata items are split back into document and
+    metadata, so a Chroma -> FAISS -> Chroma round trip restores both.
+    Only live rows are copied, with their full-precision vectors when the
+    index is lossy or two-stage. Defaults to the collection of the active
+    index version.
+
+    Raises:
+        ValueError: If the snapshot's write-ahead log holds changes not yet
+                    merged into it; save_faiss_index(final=True) merges them.
+
+    Returns:
+        int: Number of vectors written.
+    """
+    snapshot = snapshot or SNAPSHOTS.current() or "."
+    path = functools.partial(os.path.join, snapshot)
+    if unmerged_changes(snapshot):
+        raise ValueError(f"{path(WAL_FILE)} holds changes that are not in the snapshot yet. Open the index "
+                         f"writable and call save_faiss_index(final=True) to merge them, then migrate.")
+    index = faiss.read_index(path(INDEX_FILE))
+    # An index saved before snapshots existed may still keep its metadata as JSON; read it without converting
+    documents = open_metadata_store(path(METADATA_FILE), read_only=True,
+                                    legacy_path=path(LEGACY_METADATA_FILE) if snapshot == "." else None)
+    if len(documents) != index.ntotal:
+        raise ValueError(f"{path(METADATA_FILE)} has {len(documents)} entries but {path(INDEX_FILE)} "
+                         f"has {index.ntotal} vectors.")
+    row_keys = RowKeys(path(KEYS_FILE), path(DELETED_FILE), read_only=True)
+    full_vectors = open_snapshot_vectors(snapshot, index)
+    total = len(live_rows(index, row_keys))
+
+    client = chromadb.PersistentClient(path=chroma_path)
+    collection_name = collection_name or get_active_version(chroma_path)["collection"]
+    # Created without an embedding function; the import scripts reopen it with the OpenAI one
+    collection = client.get_or_create_collection(
+        name=collection_name,
+        configuration=hnsw_configuration(),
+        embedding_function=None,
+        metadata={"description": COLLECTION_DESCRIPTION}
+    )
+    batch_size = min(batch_size, client.get_max_batch_size())
+
+    written = 0
+    started = time.monotonic()
+    try:
+        batches = iter_faiss_batches(index, documents, row_keys, full_vectors, batch_size)
+        for ids, embeddings, batch_documents, metadatas in batches:
+            collection.upsert(
+                ids=ids,
+                embeddings=embeddings,
+                documents=batch_documents,
+                metadatas=metadatas if any(metadatas) else None,
+            )
+            written += len(ids)
+            logger.info(f"Copied {written}/{total} vectors into Chroma ({time.monotonic() - started:.1f}s).")
+    finally:
+        if hasattr(documents, "close"):
+            documents.close()
+        row_keys.close()
+        if full_vectors is not None:
+            full_vectors.close()
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Copy stored embeddings between the Chroma and FAISS stores without re-embedding."
+    )
+    parser.add_argument("direction", choices=["chroma-to-faiss", "faiss-to-chroma"])
+    parser.add_argument("--chroma-path", default=CHROMA_PATH, help="Chroma persistent client directory.")
+    parser.add_argument("--collection", help="Chroma collection name (defaults to the active index version's).")
+    parser.add_argument("--snapshot", help="FAISS snapshot directory to read (default: the current one).")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Vectors per read and write.")
+    parser.add_argument("--force", action="store_true",
+                        help="chroma-to-faiss: replace the current snapshot even if it has unmerged changes.")
+    args = parser.parse_args()
+
+    if args.direction == "chroma-to-faiss":
+        count = chroma_to_faiss(args.chroma_path, args.collection, args.batch_size, args.force)
+    else:
+        count = faiss_to_chroma(args.snapshot, args.chroma_path, args.collection, args.batch_size)
+    print(f"Migrated {count} vectors ({args.direction}).")
@@ -0,0 +1,254 @@
+# utils/rate_limiter.py
+import email.utils
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import openai
+from logger import logger
+from config import (
+    RATE_LIMIT_DB_PATH,
+    OPENAI_EMBEDDING_RPM, OPENAI_EMBEDDING_TPM,
+    OPENAI_CHAT_RPM, OPENAI_CHAT_TPM, OPENAI_MODEL_LIMITS,
+)
+
+# Backoff used when a 429 carries no Retry-After header
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+MAX_RETRIES = 6
+
+# Budgeted completion size for chat calls; corrected from reported usage afterwards
+CHAT_RESPONSE_TOKEN_ESTIMATE = 1500
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter covering both requests-per-minute and
+    tokens-per-minute for one class of OpenAI calls.
+
+    Bucket state lives in a small SQLite database, so every process on the
+    host that uses the same file draws from the same budget. A 429 from the
+    API pauses the bucket for all of them until its Retry-After has passed.
+    """
+
+    def __init__(self, name, rpm, tpm, path=RATE_LIMIT_DB_PATH):
+        self.name = name
+        self.rpm = float(rpm)
+        self.tpm = float(tpm)
+        self.path = path
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " name TEXT PRIMARY KEY,"
+                " requests REAL NOT NULL,"
+                " tokens REAL NOT NULL,"
+                " updated REAL NOT NULL,"
+                " blocked_until REAL NOT NULL)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets (name, requests, tokens, updated, blocked_until) VALUES (?, ?, ?, ?, 0)",
+                (name, self.rpm, self.tpm, time.time())
+            )
+
+    def _connection(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _refill(self, requests, tokens, updated, now):
+        elapsed = max(0.0, now - updated)
+        requests = min(self.rpm, requests + elapsed * self.rpm / 60.0)
+        tokens = min(self.tpm, tokens + elapsed * self.tpm / 60.0)
+        return requests, tokens
+
+    def acquire(self, tokens=1):
+        """
+        Block until one request carrying `tokens` tokens fits in both budgets,
+        then take it from the shared buckets.
+
+        Returns:
+            float: Tokens taken, which reconcile() corrects against the real usage.
+        """
+        # A single request larger than the whole TPM budget can never fit; let it through at full bucket
+        needed = min(float(tokens), self.tpm)
+        conn = self._connection()
+        while True:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                requests, bucket_tokens, updated, blocked_until = conn.execute(
+                    "SELECT requests, tokens, updated, blocked_until FROM buckets WHERE name = ?", (self.name,)
+                ).fetchone()
+                requests, bucket_tokens = self._refill(requests, bucket_tokens, updated, now)
+
+                if now < blocked_until:
+                    wait = blocked_until - now
+                elif requests >= 1 and bucket_tokens >= needed:
+                    conn.execute(
+                        "UPDATE buckets SET requests = ?, tokens = ?, updated = ? WHERE name = ?",
+                        (requests - 1, bucket_tokens - needed, now, self.name)
+                    )
+                    conn.execute("COMMIT")
+                    return needed
+                else:
+                    wait = max(
+                        (1 - requests) * 60.0 / self.rpm,
+                        (needed - bucket_tokens) * 60.0 / self.tpm,
+                    )
+
+                conn.execute(
+                    "UPDATE buckets SET requests = ?, tokens = ?, updated = ? WHERE name = ?",
+                    (requests, bucket_tokens, now, self.name)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+            # Jitter keeps waiting processes from waking in lockstep
+            time.sleep(wait * random.uniform(1.0, 1.2) + 0.001)
+
+    def reconcile(self, acquired_tokens, actual_tokens):
+        """
+        Correct the token bucket once the API reports the real usage of a
+        request, given the tokens acquire() took for it.
+        """
+        delta = float(acquired_tokens) - float(actual_tokens)
+        if not delta:
+            return
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE buckets SET tokens = MIN(?, tokens + ?) WHERE name = ?",
+                (self.tpm, delta, self.name)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def pause(self, seconds):
+        """Block this bucket for every process sharing it, e.g. after a 429."""
+        until = time.time() + seconds
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE buckets SET blocked_until = MAX(blocked_until, ?) WHERE name = ?",
+                (until, self.name)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def retry_after_seconds(error):
+    """
+    Read the server's requested delay from a rate-limit error, if it sent
+    one. A header that is neither a number nor an HTTP date counts as absent.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+
+    retry_ms = headers.get("retry-after-ms")
+    if retry_ms:
+        try:
+            return float(retry_ms) / 1000.0
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+        try:
+            parsed = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        if parsed is not None:
+            return max(0.0, parsed.timestamp() - time.time())
+    return None
+
+
+def call_with_rate_limit(limiter, request, estimated_tokens, max_retries=MAX_RETRIES):
+    """
+    Run an OpenAI request under `limiter`, retrying 429s and transient
+    server errors with jittered exponential backoff.
+
+    Args:
+        limiter (RateLimiter): The bucket this call draws from.
+        request (callable): Zero-argument function performing the API call.
+        estimated_tokens (int): Tokens the call is expected to consume.
+        max_retries (int): Retries before the last error is re-raised.
+
+    Returns:
+        The API response.
+    """
+    for attempt in range(max_retries + 1):
+        acquired = limiter.acquire(estimated_tokens)
+        try:
+            response = request()
+        except openai.RateLimitError as e:
+            if attempt == max_retries:
+                raise
+            delay = retry_after_seconds(e)
+            if delay is None:
+                delay = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempt)
+            delay *= random.uniform(1.0, 1.5)
+            logger.warning(f"OpenAI rate limit hit on '{limiter.name}'; pausing all callers for {delay:.1f}s.")
+            limiter.pause(delay)
+            continue
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            if attempt == max_retries:
+                raise
+            delay = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.5)
+            logger.warning(f"Transient OpenAI error on '{limiter.name}': {e}. Retrying in {delay:.1f}s.")
+            time.sleep(delay)
+            continue
+
+        usage = getattr(response, "usage", None)
+        actual_tokens = getattr(usage, "total_tokens", None)
+        if isinstance(actual_tokens, (int, float)):
+            limiter.reconcile(acquired, actual_tokens)
+        return response
+
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+_LIMITS = {
+    "embeddings": (OPENAI_EMBEDDING_RPM, OPENAI_EMBEDDING_TPM),
+    "chat": (OPENAI_CHAT_RPM, OPENAI_CHAT_TPM),
+}
+
+
+def get_rate_limiter(name, model=None):
+    """
+    Return the process-wide limiter for 'embeddings' or 'chat' calls to
+    `model`. Each model has its own bucket, as OpenAI limits each model
+    separately, with its OPENAI_MODEL_LIMITS entry or the defaults for
+    `name`.
+    """
+    key = f"{name}:{model}" if model else name
+    with _LIMITERS_LOCK:
+        if key not in _LIMITERS:
+            rpm, tpm = OPENAI_MODEL_LIMITS.get(model, _LIMITS[name])
+            _LIMITERS[key] = RateLimiter(key, rpm, tpm)
+        return _LIMITERS[key]
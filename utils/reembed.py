@@ -0,0 +1,309 @@
+# utils/reembed.py
+import argparse
+import random
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+from logger import logger
+
+from utils.chroma_store import get_client
+from utils.embeddings import generate_embeddings
+from utils.index_versions import (
+    COLLECTION_DESCRIPTION,
+    activate_version,
+    get_active_version,
+    hnsw_configuration,
+    load_registry,
+    register_version,
+    update_version,
+)
+
+load_dotenv()
+
+CHROMA_PATH = "./chroma_db"
+BATCH_SIZE = 500
+
+# Catch-up passes after the first full copy, for documents imported while it ran
+MAX_PASSES = 4
+
+# Documents sampled for the old-vs-new recall comparison
+RECALL_SAMPLE = 200
+RECALL_TOP_K = 5
+
+# Seconds between progress writes to the registry
+PROGRESS_INTERVAL = 5.0
+
+
+class ReembedProgress:
+    """Progress of one pass, logged and mirrored into the version's registry entry."""
+
+    def __init__(self, chroma_path, version_name, total, pass_number):
+        self.chroma_path = chroma_path
+        self.version_name = version_name
+        self.total = total
+        self.pass_number = pass_number
+        self.started = time.monotonic()
+        self.checked = 0
+        self.reembedded = 0
+        self._last_saved = 0.0
+
+    def snapshot(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        rate = self.checked / elapsed
+        remaining = max(self.total - self.checked, 0)
+        return {
+            "pass": self.pass_number,
+            "checked": self.checked,
+            "total": self.total,
+            "reembedded": self.reembedded,
+            "per_second": round(rate, 1),
+            "eta_seconds": round(remaining / rate) if rate else None,
+        }
+
+    def advance(self, checked, reembedded):
+        self.checked += checked
+        self.reembedded += reembedded
+        snapshot = self.snapshot()
+        percent = 100.0 * self.checked / self.total if self.total else 100.0
+        logger.info(
+            f"Re-embed pass {self.pass_number}: {self.checked}/{self.total} documents ({percent:.0f}%), "
+            f"{self.reembedded} re-embedded, {snapshot['per_second']}/s, ETA {snapshot['eta_seconds']}s."
+        )
+        if time.monotonic() - self._last_saved >= PROGRESS_INTERVAL:
+            update_version(self.chroma_path, self.version_name, progress=snapshot)
+            self._last_saved = time.monotonic()
+
+
+class RecallSample:
+    """Uniform reservoir sample of document ids, used to compare the old and new index."""
+
+    def __init__(self, size=RECALL_SAMPLE, seed=0):
+        self.size = size
+        self.ids = []
+        self.seen = 0
+        self._rng = random.Random(seed)
+
+    def offer(self, doc_id):
+        self.seen += 1
+        if len(self.ids) < self.size:
+            self.ids.append(doc_id)
+        else:
+            slot = self._rng.randrange(self.seen)
+            if slot < self.size:
+                self.ids[slot] = doc_id
+
+
+def sync_pass(source, target, version, progress, batch_size=BATCH_SIZE, sample=None):
+    """
+    Bring `target` in line with `source`: documents that are missing from
+    the target or whose text changed are re-embedded with the target
+    version's model, metadata-only changes are copied without embedding,
+    and documents deleted from the source are deleted from the target.
+    Documents already identical are skipped, which makes an interrupted job
+    resumable and later passes cheap.
+
+    Args:
+        sample (RecallSample): Optional reservoir that collects ids for the recall comparison.
+
+    Returns:
+        int: Number of documents written or deleted in the target.
+    """
+    changes = 0
+    source_ids = set()
+    offset = 0
+    while True:
+        page = source.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        offset += len(ids)
+        documents = page.get("documents") or [""] * len(ids)
+        metadatas = page.get("metadatas") or [None] * len(ids)
+        source_ids.update(ids)
+
+        if sample is not None:
+            for doc_id in ids:
+                sample.offer(doc_id)
+
+        existing = target.get(ids=ids, include=["documents", "metadatas"])
+        indexed = dict(zip(existing["ids"], zip(existing["documents"], existing["metadatas"])))
+
+        stale = [i for i, doc_id in enumerate(ids) if doc_id not in indexed or indexed[doc_id][0] != documents[i]]
+        relabel = [i for i, doc_id in enumerate(ids)
+                   if doc_id in indexed and indexed[doc_id][0] == documents[i] and indexed[doc_id][1] != metadatas[i]]
+
+        if stale:
+            texts = [documents[i] for i in stale]
+            embeddings = generate_embeddings(texts, model=version["model"], dimensions=version["dimension"])
+            target.upsert(
+                ids=[ids[i] for i in stale],
+                embeddings=np.asarray(embeddings, dtype=np.float32),
+                documents=texts,
+                metadatas=[metadatas[i] for i in stale] if any(metadatas[i] for i in stale) else None,
+            )
+        if relabel:
+            target.update(ids=[ids[i] for i in relabel], metadatas=[metadatas[i] for i in relabel])
+        changes += len(stale) + len(relabel)
+        progress.advance(len(ids), len(stale))
+
+    removed = []
+    offset = 0
+    while True:
+        page = target.get(include=[], limit=batch_size, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        offset += len(ids)
+        removed.extend(doc_id for doc_id in ids if doc_id not in source_ids)
+    for i in range(0, len(removed), batch_size):
+        target.delete(ids=removed[i:i + batch_size])
+    return changes + len(removed)
+
+
+def compare_recall(source, target, sample_ids, top_k=RECALL_TOP_K):
+    """
+    Compare retrieval in the old and new index, using sampled documents as
+    queries (each embedded with its own index's model, so no API calls).
+
+    Returns:
+        dict: neighbour_overlap is the mean fraction of a document's top_k
+              neighbours in the old index that the new index also returns;
+              self_hit_* is how often a document retrieves itself first.
+    """
+    if not sample_ids:
+        return {"sample": 0, "top_k": top_k}
+
+    old = source.get(ids=sample_ids, include=["embeddings"])
+    new = target.get(ids=old["ids"], include=["embeddings"])
+    old_vectors = dict(zip(old["ids"], old["embeddings"]))
+    new_vectors = dict(zip(new["ids"], new["embeddings"]))
+    ids = [doc_id for doc_id in old["ids"] if doc_id in new_vectors]
+    if not ids:
+        return {"sample": 0, "top_k": top_k}
+
+    old_hits = source.query(query_embeddings=[old_vectors[i] for i in ids], n_results=top_k + 1, include=[])["ids"]
+    new_hits = target.query(query_embeddings=[new_vectors[i] for i in ids], n_results=top_k + 1, include=[])["ids"]
+
+    overlaps, old_self, new_self = [], 0, 0
+    for doc_id, old_ids, new_ids in zip(ids, old_hits, new_hits):
+        old_self += bool(old_ids) and old_ids[0] == doc_id
+        new_self += bool(new_ids) and new_ids[0] == doc_id
+        old_neighbours = [i for i in old_ids if i != doc_id][:top_k]
+        new_neighbours = set([i for i in new_ids if i != doc_id][:top_k])
+        if old_neighbours:
+            overlaps.append(len(new_neighbours.intersection(old_neighbours)) / len(old_neighbours))
+
+    return {
+        "sample": len(ids),
+        "top_k": top_k,
+        "neighbour_overlap": round(float(np.mean(overlaps)), 4) if overlaps else None,
+        "self_hit_old": round(old_self / len(ids), 4),
+        "self_hit_new": round(new_self / len(ids), 4),
+    }
+
+
+def reembed(model, dimension, chroma_path=CHROMA_PATH, batch_size=BATCH_SIZE, swap=True,
+            min_overlap=0.0, recall_sample=RECALL_SAMPLE, top_k=RECALL_TOP_K, max_passes=MAX_PASSES):
+    """
+    Build the index version for `model` at `dimension` from the active
+    version's documents while queries keep using the active one, then
+    compare recall and, if allowed, swap it in atomically.
+
+    The copy runs in passes until one finds nothing to do, so documents
+    imported during the migration are carried over before the swap.
+    Re-running after an interruption continues where the last run stopped.
+
+    Args:
+        model (str): Embedding model of the new version.
+        dimension (int): Output dimension of the new version.
+        chroma_path (str): Chroma directory holding both versions.
+        batch_size (int): Documents per read, embedding batch and write.
+        swap (bool): Activate the new version once it is complete.
+        min_overlap (float): Refuse to swap below this neighbour overlap.
+        recall_sample (int): Documents sampled for the recall comparison.
+        top_k (int): Neighbours compared per sampled document.
+        max_passes (int): Passes before giving up on reaching a quiet state.
+
+    Returns:
+        dict: The recall comparison.
+    """
+    client = get_client(chroma_path)
+    active = get_active_version(chroma_path)
+    version = register_version(chroma_path, model, dimension)
+    if version["name"] == active["name"]:
+        raise ValueError(f"Index version '{version['name']}' is already active.")
+
+    logger.info(f"Re-embedding '{active['name']}' into '{version['name']}'; queries stay on '{active['name']}'.")
+    update_version(chroma_path, version["name"], status="building")
+
+    # Vectors are supplied explicitly, so neither collection needs an embedding function here
+    source = client.get_collection(name=active["collection"], embedding_function=None)
+    target = client.get_or_create_collection(
+        name=version["collection"], configuration=hnsw_configuration(), embedding_function=None,
+        metadata={"description": COLLECTION_DESCRIPTION}
+    )
+
+    sample = RecallSample(recall_sample)
+    for pass_number in range(1, max_passes + 1):
+        progress = ReembedProgress(chroma_path, version["name"], source.count(), pass_number)
+        changes = sync_pass(source, target, version, progress, batch_size, sample if pass_number == 1 else None)
+        update_version(chroma_path, version["name"], progress=progress.snapshot())
+        logger.info(f"Pass {pass_number} finished with {changes} changes.")
+        if changes == 0:
+            break
+    else:
+        logger.warning(f"The active index was still changing after {max_passes} passes; "
+                       f"the next sync import will pick up the rest.")
+
+    recall = compare_recall(source, target, sample.ids, top_k)
+    logger.info(f"Recall comparison of '{version['name']}' against '{active['name']}': {recall}")
+    update_version(chroma_path, version["name"], status="ready", recall=recall, completed=int(time.time()))
+
+    overlap = recall.get("neighbour_overlap")
+    if not swap:
+        logger.info(f"Version '{version['name']}' is ready. Activate it with --activate {version['name']}.")
+    elif overlap is not None and overlap < min_overlap:
+        logger.warning(f"Not swapping: neighbour overlap {overlap} is below {min_overlap}.")
+    else:
+        previous = activate_version(chroma_path, version["name"])
+        logger.info(f"Swapped the active index from '{previous}' to '{version['name']}'.")
+    return recall
+
+
+def print_versions(chroma_path=CHROMA_PATH):
+    registry = load_registry(chroma_path)
+    for name, version in registry["versions"].items():
+        marker = "*" if name == registry["active"] else " "
+        print(f"{marker} {name}: {version['status']}, collection {version['collection']}"
+              f"{', progress ' + str(version['progress']) if version.get('progress') else ''}"
+              f"{', recall ' + str(version['recall']) if version.get('recall') else ''}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Re-embed the Chroma index with another model in the background, then swap it in."
+    )
+    parser.add_argument("--model", help="Embedding model for the new index version.")
+    parser.add_argument("--dimension", type=int, help="Output dimension for the new index version.")
+    parser.add_argument("--chroma-path", default=CHROMA_PATH, help="Chroma persistent client directory.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Documents per batch.")
+    parser.add_argument("--no-swap", action="store_true", help="Build and compare, but leave the old version active.")
+    parser.add_argument("--min-overlap", type=float, default=0.0,
+                        help="Only swap if the neighbour overlap with the old index reaches this value.")
+    parser.add_argument("--recall-sample", type=int, default=RECALL_SAMPLE, help="Documents sampled for recall.")
+    parser.add_argument("--top-k", type=int, default=RECALL_TOP_K, help="Neighbours compared per sampled document.")
+    parser.add_argument("--activate", metavar="VERSION", help="Make an existing version active (swap or roll back).")
+    parser.add_argument("--list", action="store_true", help="Show index versions and their status.")
+    args = parser.parse_args()
+
+    if args.list:
+        print_versions(args.chroma_path)
+    elif args.activate:
+        previous = activate_version(args.chroma_path, args.activate)
+        print(f"Active index version: {args.activate} (was {previous}).")
+    elif args.model and args.dimension:
+        reembed(args.model, args.dimension, args.chroma_path, args.batch_size, swap=not args.no_swap,
+                min_overlap=args.min_overlap, recall_sample=args.recall_sample, top_k=args.top_k)
+    else:
+        parser.error("Give --model and --dimension, --activate VERSION, or --list.")
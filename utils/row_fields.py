@@ -0,0 +1,142 @@
+# utils/row_fields.py
+import os
+
+import numpy as np
+
+from config import FAISS_FILTER_FIELDS
+
+# Value of a field a row does not have
+MISSING = -1
+
+
+def fields_path(keys_path):
+    """The filter fields are kept next to the row keys."""
+    return f"{keys_path}.fields.npy"
+
+
+def as_value(value):
+    """Filter values are integers (TestRail ids); anything else counts as missing."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return MISSING
+
+
+class RowFields:
+    """
+    Structured filter fields of every row of an index, e.g. the TestRail
+    priority_id and section_id of each case, stored as one integer column
+    per field.
+
+    Each column has a precomputed id list per value (the rows sorted by
+    value), so the rows matching a filter are found by binary search
+    rather than by scanning metadata. Rows appended after the id lists
+    were built are scanned directly until there are enough of them to
+    rebuild the lists.
+    """
+
+    def __init__(self, path, fields=FAISS_FILTER_FIELDS, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.fields = tuple(fields)
+        self._dtype = np.dtype([(field, "<i8") for field in self.fields])
+        self._values = np.full(1024, MISSING, dtype=self._dtype)
+        self._count = 0
+        if os.path.exists(path):
+            saved = np.load(path)
+            self._grow(len(saved))
+            for field in self.fields:
+                if field in (saved.dtype.names or ()):
+                    self._values[field][:len(saved)] = saved[field]
+            self._count = len(saved)
+        self._dirty = False
+        # (rows covered, {field: (sorted values, rows in that order)}), replaced as a whole
+        self._id_lists = (0, None)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def values(self):
+        """Field values of every row, as a structured array."""
+        return self._values[:self._count]
+
+    def _grow(self, count):
+        if count > len(self._values):
+            grown = np.full(max(count, 2 * len(self._values)), MISSING, dtype=self._dtype)
+            grown[:self._count] = self._values[:self._count]
+            self._values = grown
+
+    def append(self, rows):
+        """Record the fields of newly added rows; each is a dict (missing fields allowed) or None."""
+        rows = list(rows)
+        self._grow(self._count + len(rows))
+        for offset, row in enumerate(rows):
+            if row:
+                for field in self.fields:
+                    self._values[field][self._count + offset] = as_value(row.get(field))
+        self._count += len(rows)
+        self._dirty = True
+
+    def truncate(self, count):
+        """Drop rows past `count`, e.g. fields saved for rows whose keys were not."""
+        if count < self._count:
+            self._count = count
+            self._id_lists = (0, None)
+            self._dirty = True
+
+    def _build_id_lists(self):
+        count = self._count
+        lists = {}
+        for field in self.fields:
+            column = self._values[field][:count]
+            order = np.argsort(column, kind="stable")
+            lists[field] = (column[order], order)
+        self._id_lists = (count, lists)
+        return self._id_lists
+
+    def rows_matching(self, field, values):
+        """Rows whose `field` is one of `values`, unsorted."""
+        if field not in self.fields:
+            raise ValueError(f"Unknown filter field '{field}'; expected one of {', '.join(self.fields)}.")
+        indexed, lists = self._id_lists
+        if lists is None or self._count - indexed > max(1024, indexed // 8):
+            indexed, lists = self._build_id_lists()
+        values = np.array([as_value(value) for value in values], dtype=np.int64)
+        sorted_values, order = lists[field]
+        starts = np.searchsorted(sorted_values, values, side="left")
+        ends = np.searchsorted(sorted_values, values, side="right")
+        matches = [order[start:end] for start, end in zip(starts, ends)]
+        tail = self._values[field][indexed:self._count]
+        matches.append(indexed + np.flatnonzero(np.isin(tail, values)))
+        return np.concatenate(matches)
+
+    def mask(self, filters, total):
+        """
+        Flag the first `total` rows that pass `filters`: a dict of field to
+        a value or a list of values. A row must match every field, and any
+        of that field's values.
+        """
+        selected = np.ones(total, dtype=bool)
+        for field, values in filters.items():
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            matching = np.zeros(total, dtype=bool)
+            rows = self.rows_matching(field, values)
+            matching[rows[rows < total]] = True
+            selected &= matching
+        return selected
+
+    def flush(self):
+        """Persist the fields if rows were added."""
+        if self.read_only or not self._dirty:
+            return
+        tmp_path = f"{self.path}.tmp.npy"
+        np.save(tmp_path, self.values)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def save_as(self, path, rows=None):
+        """Write the fields (of `rows` only, if given) to a new file; this object is unchanged."""
+        tmp_path = f"{path}.tmp.npy"
+        np.save(tmp_path, self.values if rows is None else self.values[rows])
+        os.replace(tmp_path, path)
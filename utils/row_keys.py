@@ -0,0 +1,128 @@
+# utils/row_keys.py
+import os
+
+import numpy as np
+
+from utils.blob_store import BlobStore
+from utils.row_fields import RowFields, fields_path
+
+
+class RowKeys:
+    """
+    Stable ids for the rows of an append-only FAISS index.
+
+    Row i of the index, the metadata store and the full-vector file is
+    tagged with an external key (a TestRail case id, or None for rows added
+    without one). Upserting a key appends a new row and tombstones the
+    key's previous row; deleting a key tombstones its row. Tombstoned rows
+    are skipped by searches until compaction rewrites the index without
+    them.
+
+    Keys are kept in an append-only blob store next to the index; the
+    tombstone bitmap is rewritten (atomically) on flush. The rows' filter
+    fields (`fields`, a RowFields) are kept and saved alongside.
+    """
+
+    def __init__(self, keys_path, deleted_path, read_only=False):
+        self.deleted_path = deleted_path
+        self.read_only = read_only
+        self.keys = BlobStore(keys_path, compress=False, read_only=read_only)
+        count = len(self.keys)
+        self.fields = RowFields(fields_path(keys_path), read_only=read_only)
+        if not read_only:
+            # Rows keyed before filter fields were tracked have none
+            self.fields.truncate(count)
+            self.fields.append([None] * (count - len(self.fields)))
+        self._deleted = np.zeros(max(count, 1024), dtype=bool)
+        if os.path.exists(deleted_path):
+            saved = np.load(deleted_path)[:count]
+            self._deleted[:len(saved)] = saved
+        self._count = count
+        self.tombstones = int(self._deleted[:count].sum())
+        # Live row of each key; only writers need it
+        self.rows = {}
+        if not read_only:
+            for row, key in enumerate(self.keys):
+                if key is not None and not self._deleted[row]:
+                    self.rows[key] = row
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def deleted(self):
+        """Tombstone flag of every row."""
+        return self._deleted[:self._count]
+
+    def _grow(self, count):
+        if count > len(self._deleted):
+            grown = np.zeros(max(count, 2 * len(self._deleted)), dtype=bool)
+            grown[:self._count] = self._deleted[:self._count]
+            self._deleted = grown
+
+    def pad_to(self, count):
+        """Tag rows added before keys were tracked as unkeyed."""
+        if count > self._count:
+            self.append([None] * (count - self._count))
+
+    def append(self, keys, fields=None):
+        """
+        Record keys (and optionally filter fields, one dict per row) for
+        newly added rows, tombstoning each key's previous row.
+
+        Returns:
+            int: Number of rows tombstoned.
+        """
+        keys = [None if key is None else str(key) for key in keys]
+        self._grow(self._count + len(keys))
+        replaced = 0
+        for offset, key in enumerate(keys):
+            if key is None:
+                continue
+            previous = self.rows.get(key)
+            if previous is not None:
+                self._deleted[previous] = True
+                replaced += 1
+            self.rows[key] = self._count + offset
+        self.keys.extend(keys)
+        self.fields.append(fields if fields is not None else [None] * len(keys))
+        self._count += len(keys)
+        self.tombstones += replaced
+        return replaced
+
+    def delete(self, keys):
+        """
+        Tombstone the rows of `keys`; unknown keys are ignored.
+
+        Returns:
+            int: Number of rows deleted.
+        """
+        deleted = 0
+        for key in keys:
+            row = self.rows.pop(str(key), None)
+            if row is not None:
+                self._deleted[row] = True
+                deleted += 1
+        self.tombstones += deleted
+        return deleted
+
+    def live_rows(self):
+        """Row numbers that are not tombstoned, in order."""
+        return np.flatnonzero(~self.deleted)
+
+    def flush(self):
+        """Persist new keys and the tombstone bitmap."""
+        self.keys.flush()
+        self.fields.flush()
+        tmp_path = f"{self.deleted_path}.tmp.npy"
+        np.save(tmp_path, self.deleted)
+        os.replace(tmp_path, self.deleted_path)
+
+    def save_as(self, keys_path, deleted_path):
+        """Write the keys, filter fields and tombstones to new files; this object is unchanged."""
+        self.keys.save_as(keys_path)
+        self.fields.save_as(fields_path(keys_path))
+        np.save(deleted_path, self.deleted)
+
+    def close(self):
+        self.keys.close()
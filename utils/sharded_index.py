@@ -0,0 +1,381 @@
+# utils/sharded_index.py
+import argparse
+import heapq
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import faiss
+import numpy as np
+from logger import logger
+
+from config import (EMBEDDING_DIMENSION, FAISS_INDEX_TYPE, FAISS_METADATA_COMPRESS, FAISS_SHARDS,
+                    FAISS_SHARD_WORKERS, FAISS_STORE_MEMORY_MB)
+from utils.blob_store import BlobStore
+from utils.row_fields import MISSING, RowFields, fields_path
+from utils.row_keys import RowKeys
+from utils.vector_db_faiss import (INDEX_FILE, METADATA_FILE, VECTORS_FILE, KEYS_FILE, DELETED_FILE, INDEX_TYPES,
+                                   build_faiss_index, coarsen, collect_vectors, data_path, is_lossy,
+                                   open_full_vectors, open_metadata_store, prepare_vectors, train_faiss_index)
+from utils.vector_file import VectorFile
+from utils.vector_store import VectorStore
+
+# One VectorStore directory per shard, plus a manifest fixing the shard count
+SHARD_ROOT = "faiss_shards"
+MANIFEST_FILE = "shards.json"
+# Vectors handed from build_shards() to the worker building a shard
+BUILD_FILE = "faiss_build.npy"
+
+QUERY_SAMPLE = 200
+TOP_K = 10
+
+
+def shard_name(shard):
+    return f"shard-{shard:03d}"
+
+
+def shard_for(key, num_shards):
+    """Shard of a row key. Uses CRC32 rather than hash(), which changes between processes."""
+    return zlib.crc32(str(key).encode("utf-8")) % num_shards
+
+
+def read_manifest(root):
+    path = os.path.join(root, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(root, num_shards, dimension, index_type):
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, MANIFEST_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"shards": num_shards, "dimension": dimension, "index_type": index_type}, f)
+    os.replace(f"{path}.tmp", path)
+
+
+class ShardedIndex:
+    """
+    One logical FAISS index split across `num_shards` shards, each a
+    complete index (vectors, metadata and keys) stored under
+    `root`/shard-NNN/, so no single index file has to hold the corpus.
+
+    A keyed row (e.g. a TestRail case id) lives in the shard its key hashes
+    to, so an upsert or delete always finds the previous version; unkeyed
+    rows are spread round-robin. Searches run on every shard at once from a
+    thread pool (FAISS releases the GIL while searching), and each query's
+    per-shard top_k lists are merged into the global top_k. Every global
+    hit is within its own shard's top_k, so the merge loses nothing.
+
+    The shards are held by a VectorStore, so each has its own reader/writer
+    lock. With `read_only` they are memory-mapped, and together they can be
+    larger than RAM: the OS keeps in memory what searches touch. The shard
+    count is fixed when `root` is created; build_shards() re-shards a corpus.
+    """
+
+    def __init__(self, root=SHARD_ROOT, num_shards=FAISS_SHARDS, dimension=EMBEDDING_DIMENSION,
+                 index_type=FAISS_INDEX_TYPE, workers=FAISS_SHARD_WORKERS, memory_budget_mb=FAISS_STORE_MEMORY_MB,
+                 read_only=False):
+        manifest = read_manifest(root)
+        if manifest is not None:
+            num_shards, dimension, index_type = manifest["shards"], manifest["dimension"], manifest["index_type"]
+        elif read_only:
+            raise FileNotFoundError(f"No sharded index in {root}.")
+        else:
+            write_manifest(root, num_shards, dimension, index_type)
+        self.root = root
+        self.num_shards = num_shards
+        self.read_only = read_only
+        self.store = VectorStore(root, dimension, index_type, max_resident=num_shards,
+                                 memory_budget_mb=memory_budget_mb, read_only=read_only)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, min(workers, num_shards)),
+                                        thread_name_prefix="faiss-shard")
+        self._lock = threading.Lock()
+        self._next_shard = 0  # Round-robin position for unkeyed rows
+
+    def shard_names(self):
+        return [shard_name(shard) for shard in range(self.num_shards)]
+
+    def _assign(self, count, keys):
+        """Shard of each of `count` new rows."""
+        if keys is not None:
+            return [shard_for(key, self.num_shards) for key in keys]
+        with self._lock:
+            start = self._next_shard
+            self._next_shard = (start + count) % self.num_shards
+        return [(start + offset) % self.num_shards for offset in range(count)]
+
+    def add(self, embeddings, metadata_items, keys=None, fields=None):
+        """
+        Add embeddings and their metadata (and optionally filter fields, a
+        dict or None per row), spread over the shards. With `keys`, existing
+        rows with the same keys are replaced.
+
+        Returns:
+            int: Number of existing rows that were replaced.
+        """
+        if self.read_only:
+            raise ValueError("ShardedIndex is open read-only.")
+        if len(embeddings) != len(metadata_items) or (keys is not None and len(keys) != len(embeddings)):
+            raise ValueError(f"Got {len(embeddings)} embeddings and {len(metadata_items)} metadata items"
+                             + (f" but {len(keys)} keys." if keys is not None else "."))
+        if fields is not None and len(fields) != len(embeddings):
+            raise ValueError(f"Got {len(embeddings)} embeddings but {len(fields)} filter field entries.")
+        if len(embeddings) == 0:
+            return 0
+        vectors = np.ascontiguousarray(embeddings, dtype='float32').reshape(len(embeddings), -1)
+        groups = defaultdict(list)
+        for row, shard in enumerate(self._assign(len(vectors), keys)):
+            groups[shard].append(row)
+
+        def add_to_shard(shard, rows):
+            items = [metadata_items[row] for row in rows]
+            shard_fields = [fields[row] for row in rows] if fields is not None else None
+            if keys is None:
+                self.store.add(shard_name(shard), vectors[rows], items, shard_fields)
+                return 0
+            return self.store.upsert(shard_name(shard), [keys[row] for row in rows], vectors[rows], items,
+                                     shard_fields)
+
+        futures = [self._pool.submit(add_to_shard, shard, rows) for shard, rows in groups.items()]
+        return sum(future.result() for future in futures)
+
+    def delete(self, keys):
+        """
+        Delete the rows of `keys`; unknown keys are ignored.
+
+        Returns:
+            int: Number of rows deleted.
+        """
+        if self.read_only:
+            raise ValueError("ShardedIndex is open read-only.")
+        groups = defaultdict(list)
+        for key in keys:
+            groups[shard_for(key, self.num_shards)].append(key)
+        return sum(self.store.delete(shard_name(shard), shard_keys) for shard, shard_keys in groups.items())
+
+    def _search_shard(self, name, queries, top_k, filters):
+        try:
+            return self.store.search_batch(name, queries, top_k, filters)
+        except KeyError:
+            # A shard that never received rows has no files to map
+            return [[] for _ in range(len(queries))]
+
+    def search_batch(self, embeddings, top_k=5, filters=None):
+        """
+        Search every shard in parallel and merge the results.
+
+        Args:
+            embeddings (list or np.array): Query vectors with shape (n, dimension).
+            top_k (int): Number of nearest neighbors to retrieve per query.
+            filters (dict): Optional filter fields to match (see vector_db_faiss.search_rows).
+
+        Returns:
+            list: One list of hits per query, nearest first, shaped like those
+                  of vector_db_faiss.search_similar_batch plus the "shard"
+                  each hit came from.
+        """
+        if len(embeddings) == 0:
+            return []
+        queries = np.ascontiguousarray(embeddings, dtype='float32').reshape(len(embeddings), -1)
+        names = self.shard_names()
+        futures = [self._pool.submit(self._search_shard, name, queries, top_k, filters) for name in names]
+        per_shard = [future.result() for future in futures]
+        results = []
+        for query in range(len(queries)):
+            candidates = (dict(hit, shard=name) for name, hits in zip(names, per_shard) for hit in hits[query])
+            results.append(heapq.nsmallest(top_k, candidates, key=lambda hit: hit["distance"]))
+        return results
+
+    def search(self, embedding, top_k=5, filters=None):
+        """
+        Search all shards for the top_k items most similar to `embedding`.
+
+        Returns:
+            list: Metadata of the matches, nearest first.
+        """
+        return [hit["document"] for hit in self.search_batch([embedding], top_k, filters)[0]]
+
+    def tombstones(self):
+        """Number of deleted or replaced rows still taking space in the shards."""
+        return sum(self.store.tombstones(name) for name in self.shard_names()
+                   if os.path.isdir(os.path.join(self.root, name)))
+
+    def compact(self, min_ratio=0.0):
+        """
+        Compact each shard whose tombstones make up at least `min_ratio` of it.
+
+        Returns:
+            int: Number of rows removed.
+        """
+        return sum(self.store.compact(name, min_ratio) for name in self.shard_names()
+                   if os.path.isdir(os.path.join(self.root, name)))
+
+    def save(self):
+        """Persist every shard that changed."""
+        self.store.save()
+
+    def close(self):
+        """Train pending vectors, save changed shards and stop the search pool."""
+        self.store.close()
+        self._pool.shutdown()
+
+
+def _build_shard(directory, dimension, index_type, threads):
+    """Worker process: train and fill the index of one shard from its build file."""
+    faiss.omp_set_num_threads(threads)
+    build_path = os.path.join(directory, BUILD_FILE)
+    index = build_faiss_index(dimension, index_type)
+    vectors = prepare_vectors(np.load(build_path), index)
+    if len(vectors):
+        index = train_faiss_index(index, vectors)
+        index.add(coarsen(vectors, index.d))
+    if is_lossy(index) or index.d < dimension:
+        full_vectors = VectorFile(os.path.join(directory, VECTORS_FILE), dimension)
+        full_vectors.append(vectors)
+        full_vectors.flush()
+        full_vectors.close()
+    faiss.write_index(index, os.path.join(directory, INDEX_FILE))
+    os.remove(build_path)
+    return index.ntotal
+
+
+def build_shards(vectors, metadata_items, keys=None, root=SHARD_ROOT, num_shards=FAISS_SHARDS,
+                 index_type=FAISS_INDEX_TYPE, workers=FAISS_SHARD_WORKERS, fields=None):
+    """
+    Build a sharded index from a whole corpus, training and filling the
+    shards in parallel worker processes. The shards are built next to
+    `root` and swapped in when all are done, replacing any previous ones.
+
+    Args:
+        vectors (np.array): Corpus vectors with shape (n, dimension).
+        metadata_items (list): One metadata item per vector.
+        keys (list): Optional key per vector (None for unkeyed rows); the last row of a repeated key wins.
+        fields (list): Optional filter fields per vector (a dict or None each).
+
+    Returns:
+        list: Number of vectors in each shard.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    fields = fields if fields is not None else [None] * len(vectors)
+    if keys is not None:
+        last = {key: row for row, key in enumerate(keys) if key is not None}
+        rows = [row for row, key in enumerate(keys) if key is None or last[key] == row]
+        vectors, metadata_items = vectors[rows], [metadata_items[row] for row in rows]
+        keys, fields = [keys[row] for row in rows], [fields[row] for row in rows]
+    else:
+        keys = [None] * len(vectors)
+    assignment = np.array([shard_for(key, num_shards) if key is not None else row % num_shards
+                           for row, key in enumerate(keys)], dtype=np.int64)
+
+    build_root = f"{root}.building"
+    if os.path.exists(build_root):
+        shutil.rmtree(build_root)
+    for shard in range(num_shards):
+        directory = os.path.join(build_root, shard_name(shard))
+        os.makedirs(directory)
+        rows = np.flatnonzero(assignment == shard)
+        np.save(os.path.join(directory, BUILD_FILE), vectors[rows])
+        BlobStore.write_all(os.path.join(directory, METADATA_FILE), [metadata_items[row] for row in rows],
+                            compress=FAISS_METADATA_COMPRESS)
+        BlobStore.write_all(os.path.join(directory, KEYS_FILE), [keys[row] for row in rows], compress=False)
+        row_fields = RowFields(fields_path(os.path.join(directory, KEYS_FILE)))
+        row_fields.append([fields[row] for row in rows])
+        row_fields.flush()
+        np.save(os.path.join(directory, DELETED_FILE), np.zeros(len(rows), dtype=bool))
+
+    workers = max(1, min(workers, num_shards))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    # Spawned rather than forked: a forked child can hang in OpenMP the parent already started
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(_build_shard, os.path.join(build_root, shard_name(shard)), vectors.shape[1],
+                                   index_type, threads) for shard in range(num_shards)]
+        counts = [future.result() for future in futures]
+    write_manifest(build_root, num_shards, vectors.shape[1], index_type)
+
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    os.replace(build_root, root)
+    return counts
+
+
+def load_corpus():
+    """
+    Read the live rows of the current FAISS snapshot: vectors, metadata,
+    keys and filter fields. Changes logged since the snapshot was written
+    are not included.
+    """
+    index = faiss.read_index(data_path(INDEX_FILE))
+    full_vectors = open_full_vectors(data_path(VECTORS_FILE), index, read_only=True, dimension=EMBEDDING_DIMENSION)
+    metadata = open_metadata_store(data_path(METADATA_FILE), read_only=True)
+    row_keys = RowKeys(data_path(KEYS_FILE), data_path(DELETED_FILE), read_only=True)
+    deleted = np.zeros(index.ntotal, dtype=bool)
+    tracked = min(len(row_keys), index.ntotal)
+    deleted[:tracked] = row_keys.deleted[:tracked]
+    rows = np.flatnonzero(~deleted)
+    vectors = collect_vectors(index, rows, full_vectors)
+    items = [metadata[row] for row in rows]
+    keys = [row_keys.keys[row] if row < tracked else None for row in rows]
+    values = row_keys.fields.values
+    fields = [{field: int(values[field][row]) for field in row_keys.fields.fields if values[field][row] != MISSING}
+              if row < len(values) else None for row in rows]
+    metadata.close()
+    row_keys.close()
+    return vectors, items, keys, fields
+
+
+def check_shards(vectors, root=SHARD_ROOT, queries=QUERY_SAMPLE, top_k=TOP_K):
+    """
+    Compare sharded search with exact search over `vectors` on a sample of
+    them, and time it. Shards renumber rows, so a sharded hit counts as
+    correct when it is no farther than the exact k-th neighbour.
+
+    Returns:
+        tuple: (recall@top_k, milliseconds per query)
+    """
+    sample = vectors[np.random.RandomState(0).choice(len(vectors), min(queries, len(vectors)), replace=False)]
+    exact = build_faiss_index(vectors.shape[1], "flat", coarse_dimension=0)
+    exact.add(prepare_vectors(vectors, exact))
+    scores, _ = exact.search(prepare_vectors(sample, exact), top_k)
+    inner_product = exact.metric_type == faiss.METRIC_INNER_PRODUCT
+    kth = (1.0 - scores[:, -1]) if inner_product else scores[:, -1]
+
+    sharded = ShardedIndex(root, read_only=True)
+    started = time.perf_counter()
+    results = sharded.search_batch(sample, top_k)
+    elapsed = time.perf_counter() - started
+    sharded.close()
+    correct = sum(1 for limit, hits in zip(kth, results) for hit in hits if hit["distance"] <= limit + 1e-5)
+    return correct / (len(sample) * top_k), 1000 * elapsed / len(sample)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Split the current FAISS index into shards built in parallel worker processes.")
+    parser.add_argument("--root", default=SHARD_ROOT, help="Directory of the sharded index.")
+    parser.add_argument("--shards", type=int, default=FAISS_SHARDS, help="Number of shards.")
+    parser.add_argument("--workers", type=int, default=FAISS_SHARD_WORKERS,
+                        help="Shards built (and later searched) at the same time.")
+    parser.add_argument("--type", choices=INDEX_TYPES, default=FAISS_INDEX_TYPE, help="Index type of each shard.")
+    parser.add_argument("--check", action="store_true",
+                        help="Afterwards, compare sharded search with exact search and time it.")
+    args = parser.parse_args()
+
+    vectors, items, keys, fields = load_corpus()
+    logger.info(f"Sharding {len(vectors)} vectors into {args.shards} {args.type} shards "
+                f"with {args.workers} workers.")
+    started = time.monotonic()
+    counts = build_shards(vectors, items, keys, root=args.root, num_shards=args.shards,
+                          index_type=args.type, workers=args.workers, fields=fields)
+    print(f"Built {len(counts)} shards in {args.root} in {time.monotonic() - started:.1f}s; "
+          f"vectors per shard: {', '.join(str(count) for count in counts)}")
+    if args.check:
+        recall, latency = check_shards(vectors, args.root)
+        print(f"recall@{TOP_K} against exact search: {recall:.3f}, {latency:.2f} ms/query (batched)")
@@ -0,0 +1,86 @@
+# utils/snapshots.py
+import os
+import re
+import shutil
+
+from logger import logger
+
+CURRENT_FILE = "CURRENT"
+
+_SNAPSHOT_PATTERN = re.compile(r"^snapshot-(\d+)$")
+
+
+def _fsync_directory(path):
+    """Persist the entries of a directory (a no-op where directories cannot be opened)."""
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SnapshotDirectory:
+    """
+    Generations of a set of files under `root`, e.g. a FAISS index with its
+    metadata. Each generation is written to its own snapshot-<n>
+    directory; `root`/CURRENT names the live one. Publishing a generation
+    is a single atomic rename of CURRENT, so readers and crash recovery
+    always see a complete, matching set of files.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def current(self):
+        """Path of the published snapshot, or None if there is none."""
+        path = os.path.join(self.root, CURRENT_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        snapshot = os.path.join(self.root, name)
+        if not os.path.isdir(snapshot):
+            logger.error(f"{path} names {name}, which does not exist.")
+            return None
+        return snapshot
+
+    def _generations(self):
+        if not os.path.isdir(self.root):
+            return {}
+        return {int(match.group(1)): name for name in os.listdir(self.root)
+                if (match := _SNAPSHOT_PATTERN.match(name))}
+
+    def create(self):
+        """Create an empty directory for the next generation and return its path."""
+        os.makedirs(self.root, exist_ok=True)
+        generation = max(self._generations(), default=0) + 1
+        path = os.path.join(self.root, f"snapshot-{generation:06d}")
+        os.makedirs(path)
+        return path
+
+    def publish(self, path):
+        """
+        Make the snapshot at `path` the current one, after forcing its files
+        to disk, and remove older generations. Processes that still have
+        files of an older generation open keep reading them.
+        """
+        for name in os.listdir(path):
+            with open(os.path.join(path, name), "rb+") as f:
+                os.fsync(f.fileno())
+        _fsync_directory(path)
+
+        current_path = os.path.join(self.root, CURRENT_FILE)
+        tmp_path = f"{current_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(os.path.basename(path))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, current_path)
+        _fsync_directory(self.root)
+
+        for name in self._generations().values():
+            if name != os.path.basename(path):
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        logger.info(f"Published snapshot {path}.")
@@ -0,0 +1,187 @@
+# utils/testrail_api.py
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from logger import logger
+from config import TESTRAIL_URL, TESTRAIL_USERNAME, TESTRAIL_API_KEY, TESTRAIL_STATE_PATH
+
+# TestRail's maximum page size for bulk endpoints
+PAGE_SIZE = 250
+
+# Concurrent requests across all projects and suites
+WORKERS = 8
+
+# Pages of one suite requested ahead of the last full page received
+PAGES_AHEAD = 4
+
+REQUEST_TIMEOUT = 60
+
+# Pulls overlap the previous one by this much, so edits made while it ran are not missed
+INCREMENTAL_OVERLAP_SECONDS = 300
+
+
+class TestRailClient:
+    """
+    Minimal client for the TestRail API v2, used as an ingestion source
+    instead of a manual cases.json export.
+
+    All requests go through one pooled `requests.Session`, which retries
+    429s (honouring Retry-After) and transient 5xx responses.
+    """
+
+    __test__ = False  # Not a pytest test class despite the name
+
+    def __init__(self, base_url, username, api_key, workers=WORKERS, page_size=PAGE_SIZE,
+                 pages_ahead=PAGES_AHEAD, timeout=REQUEST_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.workers = workers
+        self.page_size = page_size
+        self.pages_ahead = pages_ahead
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.auth = (username, api_key)
+        self.session.headers.update({"Content-Type": "application/json"})
+        retry = Retry(
+            total=6,
+            backoff_factor=1.0,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Build a client from TESTRAIL_URL, TESTRAIL_USERNAME and TESTRAIL_API_KEY."""
+        if not all([TESTRAIL_URL, TESTRAIL_USERNAME, TESTRAIL_API_KEY]):
+            raise ValueError("Missing TestRail configuration. Set TESTRAIL_URL, TESTRAIL_USERNAME and TESTRAIL_API_KEY.")
+        return cls(TESTRAIL_URL, TESTRAIL_USERNAME, TESTRAIL_API_KEY, **kwargs)
+
+    def get(self, endpoint, **params):
+        """
+        Call a GET endpoint, e.g. get("get_cases/1", suite_id=2).
+
+        Returns:
+            The decoded JSON response.
+
+        Raises:
+            requests.HTTPError: If TestRail still answers with an error after retries.
+        """
+        url = f"{self.base_url}/index.php?/api/v2/{endpoint}"
+        params = {key: value for key, value in params.items() if value is not None}
+        if params:
+            url += "&" + urlencode(params)
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def get_projects(self):
+        """Return every project, following pagination on TestRail versions that use it."""
+        projects, offset = [], 0
+        while True:
+            page = self.get("get_projects", limit=self.page_size, offset=offset)
+            # Before TestRail 6.7 bulk endpoints returned bare lists
+            if isinstance(page, list):
+                return projects + page
+            projects.extend(page.get("projects", []))
+            if not (page.get("_links") or {}).get("next"):
+                return projects
+            offset += self.page_size
+
+    def get_suites(self, project_id):
+        """Return the suites of a project."""
+        page = self.get(f"get_suites/{project_id}")
+        return page if isinstance(page, list) else page.get("suites", [])
+
+    def get_cases_page(self, project_id, suite_id, offset, updated_after=None):
+        """
+        Fetch one page of test cases of a suite.
+
+        Returns:
+            tuple: The cases on the page and whether a further page exists.
+        """
+        page = self.get(f"get_cases/{project_id}", suite_id=suite_id, limit=self.page_size,
+                        offset=offset, updated_after=updated_after)
+        if isinstance(page, list):
+            return page, False
+        cases = page.get("cases", [])
+        return cases, bool((page.get("_links") or {}).get("next")) and len(cases) == self.page_size
+
+    def iter_cases(self, project_ids=None, updated_after=None):
+        """
+        Stream every test case of the given projects (all projects by
+        default), optionally only those updated after a Unix timestamp.
+
+        Suites are paged concurrently. Within a suite, up to `pages_ahead`
+        offsets are requested at once whenever a full page arrives, so a
+        large suite does not wait on one round trip per page. Cases are
+        yielded as pages complete, not in any particular order.
+
+        Args:
+            project_ids (list): Project ids to pull; all projects if None.
+            updated_after (int): Only return cases updated after this Unix time.
+
+        Yields:
+            dict: TestRail test cases, shaped like the entries of a cases.json export.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            if project_ids is None:
+                project_ids = [project["id"] for project in self.get_projects()]
+            suite_lists = executor.map(self.get_suites, project_ids)
+            suites = [(project_id, suite["id"])
+                      for project_id, project_suites in zip(project_ids, suite_lists)
+                      for suite in project_suites]
+            logger.info(f"Pulling test cases from {len(suites)} suites in {len(project_ids)} TestRail projects.")
+
+            pending = {}
+            next_offset = {}
+            exhausted = set()
+
+            def schedule(suite, count):
+                for _ in range(count):
+                    offset = next_offset.get(suite, 0)
+                    next_offset[suite] = offset + self.page_size
+                    future = executor.submit(self.get_cases_page, *suite, offset, updated_after)
+                    pending[future] = suite
+
+            for suite in suites:
+                schedule(suite, 1)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    suite = pending.pop(future)
+                    cases, has_more = future.result()
+                    yield from cases
+
+                    if not has_more:
+                        # Pages already requested past the end come back empty
+                        exhausted.add(suite)
+                    elif suite not in exhausted:
+                        in_flight = sum(1 for other in pending.values() if other == suite)
+                        schedule(suite, self.pages_ahead - in_flight)
+
+
+def load_last_pull(path=TESTRAIL_STATE_PATH):
+    """Return the start time of the last successful pull, or None if there was none."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("last_pull")
+
+
+def save_last_pull(started, path=TESTRAIL_STATE_PATH):
+    """Record the start time of a successful pull for the next incremental run."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"last_pull": int(started), "saved_at": int(time.time())}, f)
+    os.replace(tmp_path, path)
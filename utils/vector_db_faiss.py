@@ -1,44 +1,656 @@
 # utils/vector_db_faiss.py
 import os
 import json
+import functools
+import threading
 import faiss
 import numpy as np
 from dotenv import load_dotenv
 from logger import logger
+from config import (FAISS_INDEX_TYPE, FAISS_NLIST, FAISS_PQ_M, FAISS_HNSW_M, FAISS_NPROBE,
+                    FAISS_EF_SEARCH, FAISS_METADATA_COMPRESS, FAISS_METRIC, FAISS_STORAGE, FAISS_RERANK,
+                    FAISS_COMPACT_RATIO, FAISS_COMPACT_INTERVAL, FAISS_DATA_DIR, FAISS_WAL_MAX_MB,
+                    FAISS_FILTER_EXACT_ROWS, FAISS_COARSE_DIMENSION, FAISS_COARSE_CANDIDATES)
+from utils.blob_store import BlobStore, offsets_path
+from utils.vector_file import VectorFile
+from utils.row_keys import RowKeys
+from utils.row_fields import fields_path
+from utils.snapshots import SnapshotDirectory
+from utils.write_ahead_log import WriteAheadLog, OP_ADD, OP_DELETE
+from utils.rwlock import ReadWriteLock
 
 load_dotenv()
 
-# Files to save/load
+# Files of a snapshot (see SNAPSHOTS below); older versions kept them in the working directory
 INDEX_FILE = "faiss_index_file.index"
-METADATA_FILE = "faiss_metadata.json"
+METADATA_FILE = "faiss_metadata.blob"
+# Metadata format used before the blob store; converted on first load
+LEGACY_METADATA_FILE = "faiss_metadata.json"
+# Vectors added before an IVF index had enough data to train on
+PENDING_FILE = "faiss_pending.npy"
+# Full float32 copies of the vectors of a lossy index, used for re-ranking
+VECTORS_FILE = "faiss_vectors.f32"
+# External key (TestRail case id) of each row, and which rows are deleted or replaced
+KEYS_FILE = "faiss_keys.blob"
+DELETED_FILE = "faiss_deleted.npy"
+# Changes made since the snapshot was written
+WAL_FILE = "faiss_wal.log"
+
+# Snapshot generations of the files above, published atomically
+SNAPSHOTS = SnapshotDirectory(FAISS_DATA_DIR)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+METRICS = {"l2": faiss.METRIC_L2, "ip": faiss.METRIC_INNER_PRODUCT}
+# index_factory suffix for each storage; IVF-PQ has its own compression
+STORAGES = {"float32": "Flat", "fp16": "SQfp16", "int8": "SQ8"}
+
+# IVF training uses up to this many vectors per inverted list; FAISS
+# warns below MIN_POINTS_PER_LIST, so smaller corpora get fewer lists.
+TRAIN_POINTS_PER_LIST = 64
+MIN_POINTS_PER_LIST = 39
+# Training points needed by the 256-centroid PQ sub-quantizers
+MIN_PQ_TRAIN_POINTS = 256 * MIN_POINTS_PER_LIST
+# int8 scalar quantization only learns per-dimension ranges
+SQ_TRAIN_POINTS = 10000
 
 # Global references
 INDEX = None
 METADATA = []  # Will store metadata (e.g., original text) corresponding to each embedding vector
+PENDING = []  # float32 batches waiting for the index to be trained, in insertion order
+READ_ONLY = False  # True when INDEX is memory-mapped straight from a snapshot
+FULL_VECTORS = None  # VectorFile of full-precision vectors when INDEX is lossy or coarse
+DIMENSION = None  # Dimension of the embeddings; INDEX.d is smaller in two-stage mode
+ROW_KEYS = None  # RowKeys: key and tombstone flag of every row
+WAL = None  # WriteAheadLog of the changes since the current snapshot
+
+# Searches share the globals above; adds, loads and saves take them exclusively.
+# For several indexes or heavier concurrency, see utils/vector_store.py.
+_LOCK = ReadWriteLock()
+# Held while a compaction runs, so only one does at a time
+_COMPACTING = threading.Lock()
+
+
+def _locked(mode):
+    """Run the decorated function holding _LOCK for "read" or "write"."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with getattr(_LOCK, mode)():
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def factory_string(index_type, dimension, nlist=FAISS_NLIST, pq_m=FAISS_PQ_M, hnsw_m=FAISS_HNSW_M,
+                   storage=FAISS_STORAGE):
+    """
+    Translate an index type and vector storage into a faiss.index_factory
+    description.
+
+    Returns:
+        str: e.g. "Flat", "SQ8", "IVF1024,SQfp16", "IVF1024,PQ64" or "HNSW32,Flat".
+    """
+    if storage not in STORAGES:
+        raise ValueError(f"Unknown FAISS storage '{storage}'; expected one of {', '.join(STORAGES)}.")
+    codes = STORAGES[storage]
+    if index_type == "flat":
+        return codes
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},{codes}"
+    if index_type == "ivf_pq":
+        if dimension % pq_m:
+            raise ValueError(f"FAISS_PQ_M={pq_m} must divide the embedding dimension {dimension}.")
+        return f"IVF{nlist},PQ{pq_m}"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m},{codes}"
+    raise ValueError(f"Unknown FAISS index type '{index_type}'; expected one of {', '.join(INDEX_TYPES)}.")
+
+
+def build_faiss_index(dimension, index_type=FAISS_INDEX_TYPE, nlist=FAISS_NLIST, pq_m=FAISS_PQ_M, hnsw_m=FAISS_HNSW_M,
+                      metric=FAISS_METRIC, storage=FAISS_STORAGE, coarse_dimension=FAISS_COARSE_DIMENSION):
+    """
+    Create an empty index of the given type. IVF types and int8 storage
+    are untrained until they have seen enough vectors.
+
+    Args:
+        metric (str): "l2", or "ip" for inner product (cosine once vectors are normalized).
+        storage (str): "float32", "fp16" (half the memory) or "int8" (a quarter).
+        coarse_dimension (int): If smaller than `dimension`, index only this many
+                                leading dimensions of each vector (two-stage mode).
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown FAISS metric '{metric}'; expected one of {', '.join(METRICS)}.")
+    if 0 < coarse_dimension < dimension:
+        dimension = coarse_dimension
+    description = factory_string(index_type, dimension, nlist, pq_m, hnsw_m, storage)
+    index = faiss.index_factory(dimension, description, METRICS[metric])
+    set_search_params(index)
+    return index
+
+
+def metric_of(index):
+    """Return "ip" or "l2" for an index."""
+    return "ip" if index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2"
+
+
+def storage_of(index):
+    """Return how an index stores vectors: "float32", "fp16", "int8" or "pq"."""
+    ivf = faiss.try_extract_index_ivf(index)
+    codes = faiss.downcast_index(ivf if ivf is not None else index)
+    if isinstance(codes, faiss.IndexHNSW):
+        codes = faiss.downcast_index(codes.storage)
+    if isinstance(codes, faiss.IndexIVFPQ):
+        return "pq"
+    if isinstance(codes, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if codes.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "int8"
+    return "float32"
+
+
+def is_lossy(index):
+    """True when an index keeps compressed codes instead of the vectors themselves."""
+    return storage_of(index) != "float32"
+
+
+def prepare_vectors(vectors, index):
+    """
+    Return `vectors` as a float32 matrix ready for `index`: an inner-product
+    index gets unit-length copies, so its scores are cosine similarities.
+    """
+    vectors = np.array(vectors, dtype='float32', copy=True, ndmin=2)
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def coarsen(vectors, dimension):
+    """
+    The first `dimension` components of each vector, rescaled to unit
+    length, which is what text-embedding-3 models return when asked for
+    shorter `dimensions`. Vectors of that size already are returned as is.
+    """
+    if vectors.shape[1] <= dimension:
+        return vectors
+    coarse = np.ascontiguousarray(vectors[:, :dimension], dtype='float32')
+    faiss.normalize_L2(coarse)
+    return coarse
+
+
+def exact_distances(query_vector, ids, full_vectors, metric_type):
+    """
+    Distances from `query_vector` to the full-precision vectors `ids`:
+    squared L2, or 1 - cosine similarity for inner product, so smaller is
+    nearer for both metrics.
+    """
+    vectors = full_vectors.take(ids)
+    if metric_type == faiss.METRIC_INNER_PRODUCT:
+        return 1.0 - vectors @ query_vector
+    return ((vectors - query_vector) ** 2).sum(axis=1)
+
+
+def rerank(query_vector, candidate_ids, full_vectors, metric_type, top_k, return_distances=False):
+    """
+    Re-order candidate ids by exact similarity to `query_vector` using the
+    full-precision vectors, keeping the best `top_k`. With
+    `return_distances`, returns (ids, distances) instead.
+    """
+    ids = [int(idx) for idx in candidate_ids if 0 <= idx < len(full_vectors)]
+    distances = exact_distances(query_vector, ids, full_vectors, metric_type) if ids else np.empty(0)
+    order = np.argsort(distances, kind="stable")[:top_k]
+    ids = [ids[i] for i in order]
+    if return_distances:
+        return ids, distances[order].tolist()
+    return ids
+
+
+def filtered_search(index, selected, fetch, exact_rows=FAISS_FILTER_EXACT_ROWS):
+    """
+    Plan a search restricted to the rows flagged in `selected`, so FAISS
+    skips every other row while it searches.
+
+    A graph or a few inverted lists may hold too few selected rows to fill
+    the results, so when at most `exact_rows` rows are selected they are
+    scanned exhaustively instead: an IVF index probes every list and an
+    HNSW index searches its flat storage. Above that, an IVF index probes
+    enough extra lists to expect `fetch` selected rows in them.
+
+    Returns:
+        tuple: (index to search, its search parameters)
+    """
+    bitmap = np.packbits(selected, bitorder="little")
+    selector = faiss.IDSelectorBitmap(len(selected), faiss.swig_ptr(bitmap))
+    count = int(selected.sum())
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        nprobe = ivf.nlist if count <= exact_rows else max(ivf.nprobe, -(-4 * fetch * ivf.nlist // count))
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=min(ivf.nlist, nprobe))
+    elif isinstance(index, faiss.IndexHNSW) and count <= exact_rows:
+        index, params = faiss.downcast_index(index.storage), faiss.SearchParameters(sel=selector)
+    elif isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(index.hnsw.efSearch, fetch))
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    # The selector only points at the bitmap; keep it alive with the parameters
+    params.bitmap = bitmap
+    return index, params
+
+
+def search_rows(index, queries, top_k, row_keys=None, full_vectors=None, rerank_factor=FAISS_RERANK,
+                filters=None, candidates=FAISS_COARSE_CANDIDATES):
+    """
+    Search `index` for the rows nearest each query, skipping rows that
+    `row_keys` marks as deleted or replaced. Results for a lossy index are
+    re-ranked against `full_vectors` when `rerank_factor` > 0.
+
+    In two-stage mode (queries longer than the index's vectors), the
+    coarse index picks at least `candidates` rows per query and they are
+    always re-ranked against the full-dimension `full_vectors`.
+
+    With `filters` (e.g. {"priority_id": 1, "section_id": [12, 14]}), only
+    rows whose filter fields match are searched: a row must match every
+    field, and any of that field's values. The matching live rows become a
+    FAISS ID selector, so filtering happens inside the search and does not
+    cost result slots.
+
+    Returns:
+        tuple: (rows, distances), each one list per query of up to top_k
+               entries, nearest first. Distances are squared L2, or
+               1 - cosine similarity for inner-product indexes.
+    """
+    total = index.ntotal
+    if total == 0:
+        return [[] for _ in range(len(queries))], [[] for _ in range(len(queries))]
+    rerank_factor = rerank_factor if full_vectors is not None else 0
+    wanted = top_k * max(rerank_factor, 1)
+    if queries.shape[1] > index.d and full_vectors is not None:
+        rerank_factor, wanted = max(rerank_factor, 1), max(wanted, candidates)
+    coarse_queries = coarsen(queries, index.d)
+    deleted = row_keys.deleted if row_keys is not None else np.zeros(0, dtype=bool)
+    tombstones = row_keys.tombstones if row_keys is not None else 0
+    searched, params = index, None
+    if filters:
+        if row_keys is None:
+            raise ValueError("A filtered search needs the rows' filter fields.")
+        selected = row_keys.fields.mask(filters, total)
+        live = min(len(deleted), total)
+        selected[:live] &= ~deleted[:live]
+        count = int(selected.sum())
+        if not count:
+            return [[] for _ in range(len(queries))], [[] for _ in range(len(queries))]
+        # Tombstones are not selected, so nothing needs over-fetching
+        fetch, tombstones = min(wanted, count), 0
+        searched, params = filtered_search(index, selected, fetch)
+    else:
+        # Ask for enough extra rows that tombstones usually leave `wanted` live ones
+        fetch = min(total, -(-wanted * total // max(total - tombstones, 1)))
+    while True:
+        scores, found = searched.search(coarse_queries, fetch, params=params)
+        hits = [[(int(row), float(score)) for row, score in zip(rows, row_scores)
+                 if row >= 0 and not (row < len(deleted) and deleted[row])]
+                for rows, row_scores in zip(found, scores)]
+        if not tombstones or fetch >= total or all(len(rows) >= wanted for rows in hits):
+            break
+        fetch = min(total, fetch * 2)
+    if rerank_factor:
+        ranked = [rerank(query, [row for row, _ in rows], full_vectors, index.metric_type, top_k, True)
+                  for query, rows in zip(queries, hits)]
+        return [rows for rows, _ in ranked], [distances for _, distances in ranked]
+    inner_product = index.metric_type == faiss.METRIC_INNER_PRODUCT
+    return ([[row for row, _ in rows[:top_k]] for rows in hits],
+            [[1.0 - score if inner_product else score for _, score in rows[:top_k]] for rows in hits])
+
+
+def open_full_vectors(path, index, read_only=False, pending=0, dimension=None):
+    """
+    Open the full-precision vector file kept next to a lossy index, or
+    next to a coarse index over fewer than the embeddings' `dimension`
+    dimensions, trimmed to the vectors the index (plus `pending`) holds.
+
+    Returns:
+        VectorFile or None: None for indexes that store full vectors themselves.
+    """
+    dimension = dimension or index.d
+    coarse = index.d < dimension
+    if not is_lossy(index) and not coarse:
+        return None
+    if not os.path.exists(path):
+        if read_only:
+            return None
+        if coarse and index.ntotal + pending:
+            logger.warning(f"{path} is missing; the {index.d}-dimension index is searched without re-ranking "
+                           f"at {dimension} dimensions.")
+            return None
+    full_vectors = VectorFile(path, dimension, read_only=read_only)
+    expected = index.ntotal + pending
+    if len(full_vectors) > expected and not read_only:
+        full_vectors.truncate(expected)
+    return full_vectors
+
+
+def index_type_of(index):
+    """Return which of INDEX_TYPES an index is."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return "ivf_pq" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "ivf_flat"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
 
-def initialize_faiss_index(dimension: int):
+
+def set_search_params(index=None, nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH):
+    """
+    Set the search-time accuracy knobs of an index: `nprobe` (inverted lists
+    visited) for IVF indexes, `efSearch` (candidate list size) for HNSW.
+    Higher values raise recall and latency. Flat indexes ignore both.
+
+    Args:
+        index: Index to tune; defaults to the loaded INDEX.
+        nprobe (int): Lists to probe; None leaves the current value.
+        ef_search (int): HNSW search breadth; None leaves the current value.
+    """
+    index = INDEX if index is None else index
+    if index is None:
+        return
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW) and ef_search is not None:
+        index.hnsw.efSearch = ef_search
+
+
+def training_size(index):
+    """Number of vectors to collect before training `index` (0 if it needs none)."""
+    if index.is_trained:
+        return 0
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return SQ_TRAIN_POINTS
+    size = ivf.nlist * TRAIN_POINTS_PER_LIST
+    if index_type_of(index) == "ivf_pq":
+        size = max(size, MIN_PQ_TRAIN_POINTS)
+    return size
+
+
+def sample_training_vectors(vectors, size, seed=0):
+    """Pick up to `size` rows of `vectors` uniformly at random (without replacement)."""
+    if len(vectors) <= size:
+        return vectors
+    rows = np.random.RandomState(seed).choice(len(vectors), size, replace=False)
+    return vectors[np.sort(rows)]
+
+
+def _fit_to_corpus(index, count):
+    """
+    Rebuild an untrained IVF index with fewer lists (or without PQ) when the
+    corpus is too small to train the configured layout.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return index
+    index_type = index_type_of(index)
+    if index_type == "ivf_pq" and count < MIN_PQ_TRAIN_POINTS:
+        logger.warning(f"Only {count} vectors to train on; PQ needs {MIN_PQ_TRAIN_POINTS}. Using IVF-Flat instead.")
+        index_type = "ivf_flat"
+    nlist = min(ivf.nlist, max(1, count // MIN_POINTS_PER_LIST))
+    if nlist != ivf.nlist:
+        logger.warning(f"Only {count} vectors to train on; reducing the IVF lists from {ivf.nlist} to {nlist}.")
+    if nlist == ivf.nlist and index_type == index_type_of(index):
+        return index
+    pq_m = faiss.downcast_index(ivf).pq.M if index_type == "ivf_pq" else FAISS_PQ_M
+    storage = storage_of(index) if storage_of(index) != "pq" else "float32"
+    rebuilt = build_faiss_index(index.d, index_type, nlist=nlist, pq_m=pq_m, metric=metric_of(index), storage=storage,
+                                coarse_dimension=0)
+    set_search_params(rebuilt, nprobe=ivf.nprobe)
+    return rebuilt
+
+
+def train_faiss_index(index, vectors, seed=0):
+    """
+    Train an IVF or int8 index on a random sample of `vectors`. If the corpus is
+    too small for the index's layout, a smaller compatible index is trained
+    instead.
+
+    Returns:
+        The trained index (possibly a replacement for `index`).
+    """
+    if index.is_trained:
+        return index
+    index = _fit_to_corpus(index, len(vectors))
+    sample = sample_training_vectors(vectors, training_size(index), seed)
+    logger.info(f"Training the {index_type_of(index)} FAISS index on {len(sample)} of {len(vectors)} vectors.")
+    index.train(coarsen(np.ascontiguousarray(sample, dtype='float32'), index.d))
+    return index
+
+
+def flush_pending():
+    """Train INDEX on the vectors collected so far and move them into it."""
+    global INDEX, PENDING
+    if not PENDING:
+        return
+    vectors = np.concatenate(PENDING)
+    INDEX = train_faiss_index(INDEX, vectors)
+    INDEX.add(coarsen(vectors, INDEX.d))
+    PENDING = []
+    logger.info(f"FAISS index trained; {INDEX.ntotal} vectors indexed.")
+
+
+def read_index_mmap(path=INDEX_FILE):
+    """
+    Open a saved index memory-mapped instead of reading it into RAM. Opening
+    takes milliseconds and processes on one host share the pages through
+    the OS cache. The result must not be modified.
+    """
+    # Older FAISS builds lack zero-copy mapping; fall back to mmapped IVF lists
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    return faiss.read_index(path, flags)
+
+
+def open_metadata_store(path=METADATA_FILE, read_only=False, legacy_path=LEGACY_METADATA_FILE):
+    """
+    Open the metadata blob store, converting a legacy JSON metadata file
+    the first time one is found without a blob store next to it. A
+    read-only open never writes: it reads the legacy file into memory and
+    leaves the conversion to the first writable open.
+
+    Returns:
+        BlobStore or list: List-like metadata; a BlobStore decodes per item on access.
+    """
+    if legacy_path and not os.path.exists(offsets_path(path)) and os.path.exists(legacy_path):
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        if read_only:
+            logger.info(f"Read {len(items)} metadata entries from {legacy_path}; open the index writable to convert it.")
+            return items
+        BlobStore.write_all(path, items, compress=FAISS_METADATA_COMPRESS)
+        logger.info(f"Converted {len(items)} metadata entries from {legacy_path} to {path}.")
+    return BlobStore(path, compress=FAISS_METADATA_COMPRESS, read_only=read_only)
+
+
+def data_path(name):
+    """
+    Path of the file `name` (e.g. INDEX_FILE) in the current snapshot, or
+    in the working directory for an index saved before snapshots existed.
+    """
+    return os.path.join(SNAPSHOTS.current() or ".", name)
+
+
+def _close_stores():
+    for store in (METADATA, ROW_KEYS, FULL_VECTORS, WAL):
+        if hasattr(store, "close"):
+            store.close()
+
+
+def _open_stores(directory, read_only=False, legacy=False):
+    """Open the metadata, row keys and full vectors in `directory` that go with INDEX."""
+    global METADATA, FULL_VECTORS, ROW_KEYS, WAL
+    path = functools.partial(os.path.join, directory)
+    pending = sum(len(batch) for batch in PENDING)
+    METADATA = open_metadata_store(path(METADATA_FILE), read_only=read_only,
+                                   legacy_path=LEGACY_METADATA_FILE if legacy else None)
+    FULL_VECTORS = open_full_vectors(path(VECTORS_FILE), INDEX, read_only, pending, DIMENSION)
+    ROW_KEYS = RowKeys(path(KEYS_FILE), path(DELETED_FILE), read_only=read_only)
+    if not read_only:
+        # Rows indexed before keys were tracked have none
+        ROW_KEYS.pad_to(INDEX.ntotal + pending)
+    WAL = None
+
+
+def _publish(directory):
+    """Publish a fully written snapshot with an empty log and switch the stores over to it."""
+    global WAL
+    open(os.path.join(directory, WAL_FILE), "wb").close()
+    SNAPSHOTS.publish(directory)
+    _close_stores()
+    _open_stores(directory)
+    WAL = WriteAheadLog(os.path.join(directory, WAL_FILE))
+
+
+def _write_snapshot():
+    """
+    Write INDEX with its pending vectors, metadata, row keys and full
+    vectors to a new snapshot and publish it. Caller holds the write lock.
+    """
+    directory = SNAPSHOTS.create()
+    path = functools.partial(os.path.join, directory)
+    pending = sum(len(batch) for batch in PENDING)
+    faiss.write_index(INDEX, path(INDEX_FILE))
+    if PENDING:
+        # Keep untrained vectors so a resumed import lines up with the metadata
+        np.save(path(PENDING_FILE), np.concatenate(PENDING))
+    if isinstance(METADATA, BlobStore):
+        METADATA.save_as(path(METADATA_FILE))
+    else:
+        BlobStore.write_all(path(METADATA_FILE), METADATA, compress=FAISS_METADATA_COMPRESS)
+    if ROW_KEYS is not None:
+        ROW_KEYS.save_as(path(KEYS_FILE), path(DELETED_FILE))
+    else:
+        BlobStore.write_all(path(KEYS_FILE), [None] * (INDEX.ntotal + pending), compress=False)
+    if FULL_VECTORS is not None:
+        FULL_VECTORS.save_as(path(VECTORS_FILE))
+    _publish(directory)
+    logger.info(f"FAISS snapshot written: {INDEX.ntotal} vectors ({pending} untrained), {len(METADATA)} metadata entries.")
+
+
+def write_faiss_snapshot(index, batches, dimension=None):
+    """
+    Publish a new snapshot, replacing the current one, by adding `batches`
+    of (vectors, metadata items, keys, filter fields) to the empty, trained
+    `index`. Vectors must already be prepared for it (prepare_vectors) and
+    be `dimension` wide; a lossy or coarse index gets their full-precision
+    copies written next to it. Metadata, keys, fields and full vectors are
+    written to the snapshot batch by batch, so only the index itself is
+    held in memory; keys and fields may be None. For offline tools that
+    build an index from scratch; a running writer keeps its own copy until
+    it is initialized again.
+
+    Returns:
+        str: The snapshot directory.
+    """
+    directory = SNAPSHOTS.create()
+    path = functools.partial(os.path.join, directory)
+    metadata = BlobStore(path(METADATA_FILE), compress=FAISS_METADATA_COMPRESS)
+    row_keys = RowKeys(path(KEYS_FILE), path(DELETED_FILE))
+    full_vectors = open_full_vectors(path(VECTORS_FILE), index, dimension=dimension)
+    try:
+        for vectors, metadata_items, keys, fields in batches:
+            index.add(coarsen(vectors, index.d))
+            if full_vectors is not None:
+                full_vectors.append(vectors)
+                full_vectors.flush()
+            metadata.extend(metadata_items)
+            metadata.flush()
+            row_keys.append(keys if keys is not None else [None] * len(vectors), fields)
+            row_keys.flush()
+    finally:
+        metadata.close()
+        row_keys.close()
+        if full_vectors is not None:
+            full_vectors.close()
+    faiss.write_index(index, path(INDEX_FILE))
+    open(path(WAL_FILE), "wb").close()
+    SNAPSHOTS.publish(directory)
+    return directory
+
+
+def _replay(directory):
+    """Re-apply the changes logged since the snapshot in `directory`, then keep logging to it."""
+    global WAL
+    log = WriteAheadLog(os.path.join(directory, WAL_FILE))
+    records = log.records()
+    for op, vectors, body in records:
+        if op == OP_ADD:
+            _apply_add(vectors, body["items"], body["keys"], body.get("fields"))
+        elif op == OP_DELETE:
+            ROW_KEYS.delete(body["keys"])
+    WAL = log
+    if records:
+        logger.info(f"Replayed {len(records)} logged changes; index size: {INDEX.ntotal}.")
+
+
+@_locked("write")
+def initialize_faiss_index(dimension: int, index_type: str = FAISS_INDEX_TYPE, read_only: bool = False):
     """
     Initialize a FAISS index with the given vector dimension.
-    Loads existing index and metadata if found; otherwise, creates a new index.
+    Loads the current snapshot and replays the changes logged since, if
+    found; otherwise, creates a new index of `index_type` (flat, ivf_flat,
+    ivf_pq or hnsw). An index saved in the working directory by an older
+    version is moved into a snapshot.
+
+    With `read_only`, an existing index and its metadata are memory-mapped
+    rather than loaded, which suits search-only processes; adds and saves
+    are refused. The log is not replayed, so they see the latest snapshot.
+
+    With FAISS_COARSE_DIMENSION set, a new index holds only that many
+    leading dimensions of each vector in memory, and the full `dimension`
+    vectors stay on disk for re-ranking (two-stage retrieval).
     """
-    global INDEX, METADATA
-    if os.path.exists(INDEX_FILE):
+    global INDEX, METADATA, PENDING, READ_ONLY, FULL_VECTORS, ROW_KEYS, WAL, DIMENSION
+    _close_stores()
+    METADATA, PENDING, READ_ONLY, FULL_VECTORS, ROW_KEYS, WAL = [], [], False, None, None, None
+    DIMENSION = dimension
+    directory = SNAPSHOTS.current()
+    legacy = directory is None and os.path.exists(INDEX_FILE)
+    if legacy:
+        directory = "."
+    if directory is not None:
         # Load the existing FAISS index
-        INDEX = faiss.read_index(INDEX_FILE)
-        logger.info(f"FAISS index loaded from {INDEX_FILE}. Size: {INDEX.ntotal}")
-
-        # Load metadata if it exists
-        if os.path.exists(METADATA_FILE):
-            with open(METADATA_FILE, "r", encoding="utf-8") as f:
-                METADATA = json.load(f)
-            logger.info(f"Loaded metadata with {len(METADATA)} entries.")
+        index_path = os.path.join(directory, INDEX_FILE)
+        if read_only:
+            INDEX = read_index_mmap(index_path)
+            READ_ONLY = True
         else:
-            logger.warning("No metadata file found. METADATA is empty.")
+            INDEX = faiss.read_index(index_path)
+        set_search_params(INDEX)
+        logger.info(f"FAISS index {'mapped' if read_only else 'loaded'} from {index_path}. "
+                    f"Type: {index_type_of(INDEX)}, size: {INDEX.ntotal}")
+
+        # Vectors saved before the index had enough data to train on
+        pending_path = os.path.join(directory, PENDING_FILE)
+        if not INDEX.is_trained and os.path.exists(pending_path):
+            if read_only:
+                logger.warning(f"{index_path} is not trained yet; open it writable to train and search it.")
+            else:
+                PENDING = [np.load(pending_path)]
+                logger.info(f"Loaded {len(PENDING[0])} vectors waiting for index training.")
+
+        _open_stores(directory, read_only, legacy)
+        logger.info(f"Opened metadata with {len(METADATA)} entries.")
+        if not read_only:
+            if legacy:
+                logger.info(f"Moving the FAISS index into a snapshot under {SNAPSHOTS.root}.")
+                _write_snapshot()
+            else:
+                _replay(directory)
+        if ROW_KEYS.tombstones:
+            logger.info(f"{ROW_KEYS.tombstones} deleted or replaced rows are waiting for compaction.")
     else:
         # Create a new FAISS index if none exists
-        INDEX = faiss.IndexFlatL2(dimension)
-        logger.info(f"New FAISS index initialized with dimension {dimension}.")
-        METADATA = []
+        INDEX = build_faiss_index(dimension, index_type)
+        logger.info(f"New {index_type} FAISS index initialized with dimension {INDEX.d}"
+                    + (f" (re-ranked at {dimension})." if INDEX.d < dimension else "."))
+        if read_only:
+            READ_ONLY = True
+        else:
+            _write_snapshot()
 
     return INDEX
 
@@ -48,13 +660,50 @@ def get_faiss_index():
     return INDEX
 
 
-def add_embedding(embedding, metadata_item):
+def _add_vectors(vectors):
+    """
+    Add prepared vectors to INDEX. An untrained index collects them until
+    there are enough to train on, then trains and indexes them all in order.
+    """
+    if FULL_VECTORS is not None:
+        FULL_VECTORS.append(vectors)
+    if INDEX.is_trained:
+        INDEX.add(coarsen(vectors, INDEX.d))
+        return
+    PENDING.append(vectors)
+    if sum(len(batch) for batch in PENDING) >= training_size(INDEX):
+        flush_pending()
+
+
+def _apply_add(vectors, metadata_items, keys, fields=None):
+    _add_vectors(vectors)
+    METADATA.extend(metadata_items)
+    return ROW_KEYS.append(keys, fields) if ROW_KEYS is not None else 0
+
+
+def _add_batch(embeddings, metadata_items, keys=None, fields=None):
+    """
+    Log and append embeddings with their metadata, keys and filter fields as new rows.
+
+    Returns:
+        int: Rows of the same keys that the new ones replaced.
+    """
+    vectors = prepare_vectors(embeddings, INDEX)
+    keys = [None if key is None else str(key) for key in keys] if keys is not None else [None] * len(vectors)
+    if WAL is not None:
+        WAL.append_add(vectors, keys, metadata_items, fields)
+    return _apply_add(vectors, metadata_items, keys, fields)
+
+
+@_locked("write")
+def add_embedding(embedding, metadata_item, fields=None):
     """
     Add an embedding to the FAISS index, appending corresponding metadata.
 
     Args:
         embedding (list or np.array): The vector representation (dimension must match FAISS index).
         metadata_item (any): The metadata associated with this embedding (e.g., original text).
+        fields (dict): Optional filter fields (FAISS_FILTER_FIELDS), e.g. {"priority_id": 2, "section_id": 17}.
     """
     global INDEX, METADATA
 
@@ -62,15 +711,180 @@ def add_embedding(embedding, metadata_item):
         logger.error("FAISS index is not initialized. Cannot add embedding.")
         return
 
-    # Convert embedding to a float32 Numpy array with shape (1, dimension)
-    vector = np.array([embedding], dtype='float32')
+    if READ_ONLY:
+        logger.error("FAISS index is open read-only. Cannot add embedding.")
+        return
 
-    INDEX.add(vector)
-    METADATA.append(metadata_item)
+    _add_batch([embedding], [metadata_item], fields=[fields] if fields is not None else None)
     logger.debug(f"Added embedding. Index size: {INDEX.ntotal}, METADATA length: {len(METADATA)}")
 
 
-def search_similar(embedding, top_k=5):
+@_locked("write")
+def add_embeddings(embeddings, metadata_items, fields=None):
+    """
+    Add many embeddings to the FAISS index in a single call, appending the
+    corresponding metadata in the same order.
+
+    Args:
+        embeddings (list or np.array): Vectors with shape (n, dimension).
+        metadata_items (list): One metadata item per embedding.
+        fields (list): Optional filter fields per embedding (a dict or None each).
+    """
+    global INDEX, METADATA
+
+    if INDEX is None:
+        logger.error("FAISS index is not initialized. Cannot add embeddings.")
+        return
+
+    if READ_ONLY:
+        logger.error("FAISS index is open read-only. Cannot add embeddings.")
+        return
+
+    if len(embeddings) != len(metadata_items):
+        logger.error(f"Got {len(embeddings)} embeddings but {len(metadata_items)} metadata items.")
+        return
+
+    if len(embeddings) == 0:
+        return
+
+    if fields is not None and len(fields) != len(embeddings):
+        logger.error(f"Got {len(embeddings)} embeddings but {len(fields)} filter field entries.")
+        return
+
+    _add_batch(embeddings, metadata_items, fields=fields)
+    logger.debug(f"Added {len(embeddings)} embeddings. Index size: {INDEX.ntotal}, METADATA length: {len(METADATA)}")
+
+
+@_locked("write")
+def upsert_embeddings(keys, embeddings, metadata_items, fields=None):
+    """
+    Add or replace embeddings by key (e.g. TestRail case id). A key that is
+    already indexed gets a new row and its old row is tombstoned: searches
+    skip it and the next compaction drops it. The cost is proportional to
+    the number of changed cases, not the size of the index.
+
+    Args:
+        keys (list): One key per embedding; compared as strings.
+        embeddings (list or np.array): Vectors with shape (n, dimension).
+        metadata_items (list): One metadata item per embedding.
+        fields (list): Optional filter fields per embedding (a dict or None each).
+
+    Returns:
+        int: Number of existing rows that were replaced.
+    """
+    if INDEX is None or READ_ONLY:
+        logger.error("FAISS index is not initialized or is open read-only. Cannot upsert embeddings.")
+        return 0
+
+    if not len(keys) == len(embeddings) == len(metadata_items):
+        logger.error(f"Got {len(keys)} keys, {len(embeddings)} embeddings and {len(metadata_items)} metadata items.")
+        return 0
+
+    if fields is not None and len(fields) != len(keys):
+        logger.error(f"Got {len(keys)} keys but {len(fields)} filter field entries.")
+        return 0
+
+    if len(keys) == 0:
+        return 0
+
+    if len(set(str(key) for key in keys)) != len(keys):
+        logger.warning("Duplicate keys in one upsert; the last occurrence of each wins.")
+
+    replaced = _add_batch(embeddings, metadata_items, keys, fields)
+    logger.debug(f"Upserted {len(keys)} embeddings ({replaced} replaced). Tombstones: {ROW_KEYS.tombstones}")
+    return replaced
+
+
+@_locked("write")
+def delete_embeddings(keys):
+    """
+    Delete the rows of `keys` from search results. The vectors stay in the
+    index as tombstones until the next compaction.
+
+    Args:
+        keys (list): Keys to delete; unknown keys are ignored.
+
+    Returns:
+        int: Number of rows deleted.
+    """
+    if INDEX is None or READ_ONLY:
+        logger.error("FAISS index is not initialized or is open read-only. Cannot delete embeddings.")
+        return 0
+    keys = [str(key) for key in keys]
+    if WAL is not None:
+        WAL.append_delete(keys)
+    deleted = ROW_KEYS.delete(keys)
+    logger.debug(f"Deleted {deleted} of {len(keys)} keys. Tombstones: {ROW_KEYS.tombstones}")
+    return deleted
+
+
+def tombstone_count():
+    """Number of deleted or replaced rows still taking space in the index."""
+    return ROW_KEYS.tombstones if ROW_KEYS is not None else 0
+
+
+def _row_id(row):
+    """The key of a row (e.g. its TestRail case id), or "faiss-<row>" for unkeyed rows."""
+    key = ROW_KEYS.keys[row] if ROW_KEYS is not None and row < len(ROW_KEYS) else None
+    return key if key is not None else f"faiss-{row}"
+
+
+def search_similar_batch(embeddings, top_k=5, filters=None):
+    """
+    Search the FAISS index with many query embeddings at once, e.g. every
+    story of a sprint or every chunk of a long story. FAISS scores the
+    whole query matrix in one BLAS-backed call instead of one per query.
+
+    Args:
+        embeddings (list or np.array): Query vectors with shape (n, dimension).
+        top_k (int): Number of nearest neighbors to retrieve per query.
+        filters (dict): Optional filter fields to match, e.g. {"priority_id": [3, 4]};
+                        only matching rows are searched (see search_rows).
+
+    Returns:
+        list: One list of hits per query, nearest first. Each hit is a dict
+              with "id" (the row's key, or "faiss-<row>" for unkeyed rows),
+              "document" (its metadata) and "distance" (squared L2, or
+              1 - cosine similarity for an inner-product index).
+    """
+    if len(embeddings) == 0:
+        return []
+
+    if INDEX is not None and PENDING and not READ_ONLY:
+        with _LOCK.write():
+            # Searching means the corpus is complete enough; train on what we have
+            flush_pending()
+
+    with _LOCK.read():
+        if INDEX is None or INDEX.ntotal == 0:
+            logger.warning("FAISS index is not initialized or empty.")
+            return [[] for _ in range(len(embeddings))]
+
+        queries = prepare_vectors(embeddings, INDEX)
+        rows, distances = search_rows(INDEX, queries, top_k, ROW_KEYS, FULL_VECTORS, filters=filters)
+
+        results = []
+        for query_rows, query_distances in zip(rows, distances):
+            hits = []
+            for idx, distance in zip(query_rows, query_distances):
+                # Validate the returned index before using it
+                if 0 <= idx < len(METADATA):
+                    hits.append({"id": _row_id(idx), "document": METADATA[idx], "distance": distance})
+                else:
+                    logger.warning(f"Invalid index {idx} encountered during search.")
+            results.append(hits)
+        return results
+
+
+def document_text(item):
+    """
+    Text of a metadata item: the item itself, or its "text" for a dict item
+    (e.g. a CSV row that records the ids of its near-duplicates).
+    """
+    return item.get("text", "") if isinstance(item, dict) else item
+
+
+def search_similar(embedding, top_k=5, filters=None):
     """
     Search for the top_k similar items in the FAISS index given an embedding.
     Returns a list of metadata items that match.
@@ -78,46 +892,207 @@ def search_similar(embedding, top_k=5):
     Args:
         embedding (list or np.array): The query vector.
         top_k (int): Number of nearest neighbors to retrieve.
+        filters (dict): Optional filter fields to match, e.g. {"section_id": 12}.
 
     Returns:
         list: Metadata of the top_k most similar items.
     """
-    global INDEX, METADATA
+    return [hit["document"] for hit in search_similar_batch([embedding], top_k, filters)[0]]
 
-    if INDEX is None or INDEX.ntotal == 0:
-        logger.warning("FAISS index is not initialized or empty.")
-        return []
 
-    query_vector = np.array([embedding], dtype='float32')
-    distances, indices = INDEX.search(query_vector, top_k)
+def _checkpoint(final=False):
+    if READ_ONLY:
+        logger.error("FAISS index is open read-only. Not saving.")
+        return
+    if INDEX is None:
+        logger.error("No FAISS index to save.")
+        return
+    if final:
+        flush_pending()
+    if WAL is None or final or WAL.size >= FAISS_WAL_MAX_MB * 1024 * 1024:
+        _write_snapshot()
+    else:
+        WAL.sync()
+        logger.debug(f"FAISS log synced ({WAL.size} bytes since the last snapshot).")
+
 
-    similar_items = []
-    for idx in indices[0]:
-        # Validate the returned index before using it
-        if 0 <= idx < len(METADATA):
-            similar_items.append(METADATA[idx])
-        else:
-            logger.warning(f"Invalid index {idx} encountered during search.")
-    return similar_items
+@_locked("write")
+def save_faiss_index(final=False):
+    """
+    Make every change to the FAISS index durable. Changes are appended to
+    a write-ahead log as they are made, so this is normally one fsync of
+    the log. Once the log passes FAISS_WAL_MAX_MB it is merged into a new
+    snapshot of the index, metadata and row keys, published together with
+    one atomic rename. Processes that have the old snapshot memory-mapped
+    keep a valid copy.
+
+    Args:
+        final (bool): Train on pending vectors and write a snapshot, so
+                      search-only (read-only) processes can use the index.
+    """
+    _checkpoint(final)
+
+
+@_locked("write")
+def save_metadata():
+    """
+    Make metadata changes durable. Metadata is logged and snapshotted
+    together with the index, so this is the same checkpoint as
+    save_faiss_index() and costs nothing right after it.
+    """
+    _checkpoint()
+
+
+def collect_vectors(index, rows, full_vectors=None):
+    """
+    Return the vectors of `rows` as stored for searching: read from the
+    full-precision file when there is one, otherwise reconstructed from
+    the index.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    if not len(rows):
+        return np.empty((0, index.d), dtype='float32')
+    if full_vectors is not None and len(full_vectors) >= index.ntotal:
+        return full_vectors.take(rows)
+    if faiss.try_extract_index_ivf(index) is not None:
+        # IVF rows are only addressable through a direct map; build it on a copy
+        index = faiss.clone_index(index)
+        faiss.extract_index_ivf(index).make_direct_map()
+    return index.reconstruct_batch(rows)
 
 
-def save_faiss_index():
+def empty_like(index):
+    """An empty index with the layout, training and search settings of `index`."""
+    empty = faiss.clone_index(index)
+    empty.reset()
+    return empty
+
+
+def live_snapshot(index, row_keys, metadata, full_vectors):
+    """
+    Copy out the rows of `index` that are not tombstoned: their row
+    numbers, vectors, metadata and keys. Call with the index's read lock.
+    """
+    rows = np.flatnonzero(~row_keys.deleted[:index.ntotal])
+    return (rows, collect_vectors(index, rows, full_vectors),
+            [metadata[row] for row in rows], [row_keys.keys[row] for row in rows])
+
+
+def finish_compaction(directory, index, row_keys, metadata, full_vectors, compacted, total, snapshot):
+    """
+    Complete a compaction started from `snapshot` (taken when `index` had
+    `total` rows): carry over rows added since, keep rows deleted since as
+    tombstones, and write the compacted index, full vectors, metadata,
+    keys, filter fields and tombstones to `directory`. Call with the index's write lock.
+
+    Each file is replaced atomically, but not the set; write to a new
+    snapshot directory to replace them together.
     """
-    Persist the FAISS index to disk.
+    rows, vectors, items, keys = snapshot
+    added = np.arange(total, index.ntotal)
+    added_vectors = collect_vectors(index, added, full_vectors)
+    compacted.add(coarsen(added_vectors, compacted.d))
+    items = items + metadata[total:]
+    keys = keys + row_keys.keys[total:]
+    deleted = row_keys.deleted[np.concatenate([rows, added])]
+
+    path = functools.partial(os.path.join, directory)
+    faiss.write_index(compacted, path(f"{INDEX_FILE}.tmp"))
+    os.replace(path(f"{INDEX_FILE}.tmp"), path(INDEX_FILE))
+    if full_vectors is not None:
+        np.concatenate([vectors, added_vectors]).astype("<f4").tofile(path(f"{VECTORS_FILE}.tmp"))
+        os.replace(path(f"{VECTORS_FILE}.tmp"), path(VECTORS_FILE))
+    BlobStore.write_all(path(METADATA_FILE), items, compress=FAISS_METADATA_COMPRESS)
+    BlobStore.write_all(path(KEYS_FILE), keys, compress=False)
+    row_keys.fields.save_as(fields_path(path(KEYS_FILE)), np.concatenate([rows, added]))
+    np.save(path(f"{DELETED_FILE}.tmp.npy"), deleted)
+    os.replace(path(f"{DELETED_FILE}.tmp.npy"), path(DELETED_FILE))
+    return compacted
+
+
+def compact_faiss_index(min_ratio=0.0):
+    """
+    Rebuild the index without its deleted and replaced rows, once they make
+    up at least `min_ratio` of it. The rebuild runs outside the lock, so
+    searches and adds carry on meanwhile; the swap at the end is brief.
+    The compacted index and its files are published as a new snapshot.
+
+    Args:
+        min_ratio (float): Minimum fraction of tombstoned rows worth compacting.
+
+    Returns:
+        int: Number of rows removed (0 if nothing was compacted).
     """
     global INDEX
-    if INDEX is not None:
-        faiss.write_index(INDEX, INDEX_FILE)
-        logger.info(f"FAISS index saved to {INDEX_FILE}.")
-    else:
-        logger.error("No FAISS index to save.")
+    if not _COMPACTING.acquire(blocking=False):
+        return 0
+    try:
+        with _LOCK.read():
+            if INDEX is None or READ_ONLY or ROW_KEYS is None or PENDING or not INDEX.is_trained:
+                return 0
+            source, total = INDEX, INDEX.ntotal
+            removed = int(ROW_KEYS.deleted[:total].sum())
+            if not removed or removed < min_ratio * total:
+                return 0
+            snapshot = live_snapshot(INDEX, ROW_KEYS, METADATA, FULL_VECTORS)
+        logger.info(f"Compacting the FAISS index: dropping {removed} of {total} rows.")
+        compacted = empty_like(source)
+        compacted.add(coarsen(snapshot[1], compacted.d))
 
+        with _LOCK.write():
+            if INDEX is not source:
+                logger.warning("FAISS index was reloaded during compaction; discarding the compacted copy.")
+                return 0
+            directory = SNAPSHOTS.create()
+            INDEX = finish_compaction(directory, INDEX, ROW_KEYS, METADATA, FULL_VECTORS, compacted, total, snapshot)
+            _publish(directory)
+            logger.info(f"FAISS index compacted to {INDEX.ntotal} rows and saved.")
+        return removed
+    finally:
+        _COMPACTING.release()
 
-def save_metadata():
+
+def start_background_compaction(interval=FAISS_COMPACT_INTERVAL, min_ratio=FAISS_COMPACT_RATIO):
+    """
+    Compact the index every `interval` seconds once `min_ratio` of its rows
+    are tombstones, on a daemon thread. Otherwise the write-ahead log is
+    synced, and merged into a snapshot once it passes FAISS_WAL_MAX_MB.
+
+    Returns:
+        threading.Event: Set it to stop the compactor.
+    """
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                if not compact_faiss_index(min_ratio) and WAL is not None:
+                    save_faiss_index()
+            except Exception as e:
+                logger.error(f"Background FAISS compaction failed: {e}")
+
+    threading.Thread(target=run, name="faiss-compaction", daemon=True).start()
+    return stop
+
+
+def recall_at_k(index, vectors, queries, k=10):
     """
-    Save the in-memory metadata array to a JSON file.
+    Measure how many of the exact k nearest neighbours an index returns.
+
+    Args:
+        index: The index to check, holding `vectors` in order.
+        vectors (np.array): The original (uncompressed) corpus vectors,
+                            normalized if the index uses inner product.
+        queries (np.array): Query vectors.
+        k (int): Neighbours per query.
+
+    Returns:
+        float: Mean fraction of the exact top-k found in the index's top-k.
     """
-    global METADATA
-    with open(METADATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(METADATA, f)
-    logger.info(f"Metadata saved to {METADATA_FILE}.")
\ No newline at end of file
+    exact = faiss.IndexFlat(vectors.shape[1], index.metric_type)
+    exact.add(np.ascontiguousarray(vectors, dtype='float32'))
+    queries = np.ascontiguousarray(queries, dtype='float32')
+    _, truth = exact.search(queries, k)
+    _, found = index.search(queries, k)
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth.tolist(), found.tolist()))
+    return hits / (len(queries) * k)
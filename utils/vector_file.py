@@ -0,0 +1,102 @@
+# utils/vector_file.py
+import os
+import shutil
+
+import numpy as np
+
+
+class VectorFile:
+    """
+    Append-only float32 matrix on disk, row i holding vector i of an index.
+    Reads go through a memory map, so full-precision vectors for re-ranking
+    stay on disk (and in the shared OS cache) instead of in process memory.
+    Appends are buffered until flush().
+    """
+
+    def __init__(self, path, dimension, read_only=False):
+        self.path = path
+        self.dimension = dimension
+        self.read_only = read_only
+        self._row_bytes = dimension * 4
+        self._pending = []
+        if not read_only:
+            if not os.path.exists(path):
+                open(path, "wb").close()
+            # Drop a partial row left by an interrupted flush
+            rows = os.path.getsize(path) // self._row_bytes
+            if os.path.getsize(path) != rows * self._row_bytes:
+                os.truncate(path, rows * self._row_bytes)
+        self._map()
+
+    def _map(self):
+        rows = os.path.getsize(self.path) // self._row_bytes if os.path.exists(self.path) else 0
+        if rows:
+            self._rows = np.memmap(self.path, dtype="<f4", mode="r", shape=(rows, self.dimension))
+        else:
+            self._rows = np.empty((0, self.dimension), dtype=np.float32)
+
+    def __len__(self):
+        return len(self._rows) + sum(len(batch) for batch in self._pending)
+
+    def append(self, vectors):
+        if self.read_only:
+            raise ValueError(f"{self.path} is open read-only.")
+        self._pending.append(np.ascontiguousarray(vectors, dtype="<f4"))
+
+    def take(self, ids):
+        """
+        Return the rows `ids` as a float32 matrix. Stored rows are read
+        through the memory map and buffered ones from memory, so the file
+        is never copied into memory as a whole.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        stored = len(self._rows)
+        if not self._pending or (len(ids) and ids.max() < stored):
+            return np.asarray(self._rows[ids], dtype=np.float32)
+        rows = np.empty((len(ids), self.dimension), dtype=np.float32)
+        on_disk = ids < stored
+        rows[on_disk] = self._rows[ids[on_disk]]
+        rows[~on_disk] = np.concatenate(self._pending)[ids[~on_disk] - stored]
+        return rows
+
+    def truncate(self, rows):
+        """Keep only the first `rows` vectors (pending ones included)."""
+        if self.read_only:
+            raise ValueError(f"{self.path} is open read-only.")
+        stored = len(self._rows)
+        if rows >= stored:
+            keep = rows - stored
+            merged = np.concatenate(self._pending) if self._pending else np.empty((0, self.dimension), "<f4")
+            self._pending = [merged[:keep]] if keep else []
+            return
+        self._pending = []
+        self._rows = np.empty((0, self.dimension), dtype=np.float32)
+        os.truncate(self.path, rows * self._row_bytes)
+        self._map()
+
+    def flush(self):
+        """Append buffered vectors to the file and fsync it."""
+        if not self._pending:
+            return
+        with open(self.path, "ab") as f:
+            for batch in self._pending:
+                f.write(batch.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending = []
+        self._map()
+
+    def save_as(self, path):
+        """Write every vector, buffered ones included, to a new file at `path`; this one is unchanged."""
+        if len(self._rows):
+            shutil.copyfile(self.path, path)
+        with open(path, "ab") as f:
+            f.truncate(len(self._rows) * self._row_bytes)
+            for batch in self._pending:
+                f.write(batch.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self):
+        self._pending = []
+        self._rows = np.empty((0, self.dimension), dtype=np.float32)
@@ -0,0 +1,408 @@
+# utils/vector_store.py
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import faiss
+import numpy as np
+from logger import logger
+
+from config import (EMBEDDING_DIMENSION, FAISS_INDEX_TYPE, FAISS_STORE_MAX_RESIDENT, FAISS_STORE_MEMORY_MB,
+                    FAISS_METADATA_COMPRESS, FAISS_COMPACT_RATIO, FAISS_COMPACT_INTERVAL)
+from utils.blob_store import BlobStore
+from utils.row_keys import RowKeys
+from utils.rwlock import ReadWriteLock
+from utils.vector_db_faiss import (INDEX_FILE, METADATA_FILE, PENDING_FILE, VECTORS_FILE, KEYS_FILE, DELETED_FILE,
+                                   build_faiss_index, coarsen, empty_like, finish_compaction, index_type_of,
+                                   live_snapshot, open_full_vectors, prepare_vectors, read_index_mmap, search_rows,
+                                   set_search_params, train_faiss_index, training_size)
+
+# One sub-directory per named index, laid out like the single-index files
+STORE_ROOT = "faiss_store"
+
+_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def approx_index_bytes(index):
+    """Rough in-memory size of an index: stored codes plus ids, ignoring graph links and centroids."""
+    try:
+        code_size = index.sa_code_size()
+    except RuntimeError:
+        code_size = index.d * 4
+    return index.ntotal * (code_size + 8)
+
+
+class _NamedIndex:
+    """One index with its metadata, row keys and pending (untrained) vectors, guarded by `lock`."""
+
+    def __init__(self, name, directory, dimension, index_type, read_only):
+        self.name = name
+        self.directory = directory
+        self.dimension = dimension
+        self.read_only = read_only
+        self.lock = ReadWriteLock()
+        self.pins = 0  # Callers currently using the entry; guarded by the store lock
+        self.dirty = False
+        self.pending = []
+        self.compacting = threading.Lock()
+
+        index_path = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(index_path):
+            self.index = read_index_mmap(index_path) if read_only else faiss.read_index(index_path)
+            set_search_params(self.index)
+            pending_path = os.path.join(directory, PENDING_FILE)
+            if not read_only and not self.index.is_trained and os.path.exists(pending_path):
+                self.pending = [np.load(pending_path)]
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.index = build_faiss_index(dimension, index_type)
+        self._open_files()
+
+    def _open_files(self):
+        read_only = self.read_only
+        pending = sum(len(batch) for batch in self.pending)
+        self.metadata = BlobStore(os.path.join(self.directory, METADATA_FILE),
+                                  compress=FAISS_METADATA_COMPRESS, read_only=read_only)
+        self.full_vectors = open_full_vectors(os.path.join(self.directory, VECTORS_FILE), self.index, read_only,
+                                              pending, self.dimension)
+        self.row_keys = RowKeys(os.path.join(self.directory, KEYS_FILE),
+                                os.path.join(self.directory, DELETED_FILE), read_only=read_only)
+        if not read_only:
+            self.row_keys.pad_to(self.index.ntotal + pending)
+
+    @property
+    def nbytes(self):
+        return approx_index_bytes(self.index) + sum(batch.nbytes for batch in self.pending)
+
+    def add(self, vectors, items, keys=None, fields=None):
+        vectors = prepare_vectors(vectors, self.index)
+        if self.full_vectors is not None:
+            self.full_vectors.append(vectors)
+        if self.index.is_trained:
+            self.index.add(coarsen(vectors, self.index.d))
+        else:
+            self.pending.append(vectors)
+            if sum(len(batch) for batch in self.pending) >= training_size(self.index):
+                self.flush_pending()
+        self.metadata.extend(items)
+        self.dirty = True
+        return self.row_keys.append(keys if keys is not None else [None] * len(items), fields)
+
+    def delete(self, keys):
+        deleted = self.row_keys.delete(keys)
+        self.dirty = self.dirty or deleted > 0
+        return deleted
+
+    def flush_pending(self):
+        if not self.pending:
+            return
+        vectors = np.concatenate(self.pending)
+        self.index = train_faiss_index(self.index, vectors)
+        self.index.add(coarsen(vectors, self.index.d))
+        self.pending = []
+        self.dirty = True
+
+    def _row_id(self, row):
+        key = self.row_keys.keys[row] if row < len(self.row_keys) else None
+        return key if key is not None else f"faiss-{row}"
+
+    def search(self, queries, top_k, filters=None):
+        queries = prepare_vectors(queries, self.index)
+        rows, distances = search_rows(self.index, queries, top_k, self.row_keys, self.full_vectors, filters=filters)
+        return [[{"id": self._row_id(row), "document": self.metadata[row], "distance": distance}
+                 for row, distance in zip(query_rows, query_distances) if 0 <= row < len(self.metadata)]
+                for query_rows, query_distances in zip(rows, distances)]
+
+    def save(self):
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        faiss.write_index(self.index, f"{index_path}.tmp")
+        os.replace(f"{index_path}.tmp", index_path)
+        pending_path = os.path.join(self.directory, PENDING_FILE)
+        if self.pending:
+            np.save(f"{pending_path}.tmp.npy", np.concatenate(self.pending))
+            os.replace(f"{pending_path}.tmp.npy", pending_path)
+        elif os.path.exists(pending_path):
+            os.remove(pending_path)
+        if self.full_vectors is not None:
+            self.full_vectors.flush()
+        self.metadata.flush()
+        self.row_keys.flush()
+        self.dirty = False
+
+    def compact(self, min_ratio):
+        """Rebuild without tombstoned rows; see vector_db_faiss.compact_faiss_index."""
+        if self.read_only or not self.compacting.acquire(blocking=False):
+            return 0
+        try:
+            with self.lock.read():
+                if self.pending or not self.index.is_trained:
+                    return 0
+                source, total = self.index, self.index.ntotal
+                removed = int(self.row_keys.deleted[:total].sum())
+                if not removed or removed < min_ratio * total:
+                    return 0
+                snapshot = live_snapshot(self.index, self.row_keys, self.metadata, self.full_vectors)
+            compacted = empty_like(source)
+            compacted.add(coarsen(snapshot[1], compacted.d))
+            with self.lock.write():
+                if self.index is not source:
+                    return 0
+                self.index = finish_compaction(self.directory, self.index, self.row_keys, self.metadata,
+                                               self.full_vectors, compacted, total, snapshot)
+                self._close_files()
+                self._open_files()
+                pending_path = os.path.join(self.directory, PENDING_FILE)
+                if os.path.exists(pending_path):
+                    os.remove(pending_path)
+                self.dirty = False
+            return removed
+        finally:
+            self.compacting.release()
+
+    def _close_files(self):
+        self.metadata.close()
+        self.row_keys.close()
+        if self.full_vectors is not None:
+            self.full_vectors.close()
+
+    def close(self):
+        self._close_files()
+        self.index = None
+
+
+class VectorStore:
+    """
+    Thread-safe collection of named FAISS indexes, e.g. one per TestRail
+    project, each stored under `root`/<name>/.
+
+    Each index has a reader/writer lock: any number of searches run in
+    parallel, while adds, training and saves are exclusive. Indexes are
+    loaded on first use and kept in LRU order; when more than
+    `max_resident` are loaded or their approximate size exceeds
+    `memory_budget_mb`, the least recently used idle ones are saved (if
+    changed) and unloaded. An index in use is never evicted, so the budget
+    can be exceeded briefly.
+
+    Rows can be keyed (e.g. by TestRail case id) for upsert and delete;
+    replaced and deleted rows are skipped by searches until compact()
+    rebuilds the index without them.
+
+    With `read_only`, indexes are memory-mapped and cannot be changed.
+    """
+
+    def __init__(self, root=STORE_ROOT, dimension=EMBEDDING_DIMENSION, index_type=FAISS_INDEX_TYPE,
+                 max_resident=FAISS_STORE_MAX_RESIDENT, memory_budget_mb=FAISS_STORE_MEMORY_MB, read_only=False):
+        self.root = root
+        self.dimension = dimension
+        self.index_type = index_type
+        self.max_resident = max_resident
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._resident = OrderedDict()
+
+    def names(self):
+        """Names of all indexes, on disk or only in memory."""
+        on_disk = set(os.listdir(self.root)) if os.path.isdir(self.root) else set()
+        with self._lock:
+            return sorted(on_disk | set(self._resident))
+
+    def resident(self):
+        """Names of the loaded indexes, least recently used first."""
+        with self._lock:
+            return list(self._resident)
+
+    def _directory(self, name):
+        if not _NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid index name '{name}'; use letters, digits, '.', '_' or '-'.")
+        return os.path.join(self.root, name)
+
+    @contextmanager
+    def _use(self, name):
+        """Pin (loading if needed) the index `name` for the duration of the block."""
+        directory = self._directory(name)
+        with self._lock:
+            entry = self._resident.get(name)
+            if entry is None:
+                if self.read_only and not os.path.isdir(directory):
+                    raise KeyError(f"No index named '{name}' in {self.root}.")
+                entry = _NamedIndex(name, directory, self.dimension, self.index_type, self.read_only)
+                self._resident[name] = entry
+                logger.debug(f"Loaded index '{name}' ({entry.index.ntotal} vectors, {index_type_of(entry.index)}).")
+            self._resident.move_to_end(name)
+            entry.pins += 1
+            self._evict_locked()
+        try:
+            yield entry
+        finally:
+            with self._lock:
+                entry.pins -= 1
+                self._evict_locked()
+
+    def _evict_locked(self):
+        """Unload idle indexes, oldest first, until within budget. Caller holds self._lock."""
+        total = sum(entry.nbytes for entry in self._resident.values())
+        for name, entry in list(self._resident.items()):
+            if len(self._resident) <= self.max_resident and total <= self.memory_budget:
+                return
+            if entry.pins:
+                continue
+            # Nobody holds a pin, so nobody holds or can take the entry's lock
+            if entry.dirty and not self.read_only:
+                entry.save()
+            total -= entry.nbytes
+            entry.close()
+            del self._resident[name]
+            logger.debug(f"Evicted index '{name}' from memory.")
+
+    def add(self, name, embeddings, metadata_items, fields=None):
+        """
+        Add embeddings and their metadata to index `name`, creating it if needed.
+
+        Args:
+            name (str): Index name.
+            embeddings (list or np.array): Vectors with shape (n, dimension).
+            metadata_items (list): One metadata item per embedding.
+            fields (list): Optional filter fields per embedding (a dict or None each).
+        """
+        if self.read_only:
+            raise ValueError("VectorStore is open read-only.")
+        if len(embeddings) != len(metadata_items):
+            raise ValueError(f"Got {len(embeddings)} embeddings but {len(metadata_items)} metadata items.")
+        if fields is not None and len(fields) != len(embeddings):
+            raise ValueError(f"Got {len(embeddings)} embeddings but {len(fields)} filter field entries.")
+        if len(embeddings) == 0:
+            return
+        with self._use(name) as entry, entry.lock.write():
+            entry.add(embeddings, list(metadata_items), fields=fields)
+
+    def upsert(self, name, keys, embeddings, metadata_items, fields=None):
+        """
+        Add or replace embeddings of index `name` by key (e.g. TestRail case
+        id); replaced rows become tombstones until compaction.
+
+        Returns:
+            int: Number of existing rows that were replaced.
+        """
+        if self.read_only:
+            raise ValueError("VectorStore is open read-only.")
+        if not len(keys) == len(embeddings) == len(metadata_items):
+            raise ValueError(f"Got {len(keys)} keys, {len(embeddings)} embeddings "
+                             f"and {len(metadata_items)} metadata items.")
+        if fields is not None and len(fields) != len(keys):
+            raise ValueError(f"Got {len(keys)} keys but {len(fields)} filter field entries.")
+        if len(keys) == 0:
+            return 0
+        with self._use(name) as entry, entry.lock.write():
+            return entry.add(embeddings, list(metadata_items), list(keys), fields)
+
+    def delete(self, name, keys):
+        """
+        Delete the rows of `keys` from index `name`; unknown keys are ignored.
+
+        Returns:
+            int: Number of rows deleted.
+        """
+        if self.read_only:
+            raise ValueError("VectorStore is open read-only.")
+        with self._use(name) as entry, entry.lock.write():
+            return entry.delete(keys)
+
+    def tombstones(self, name):
+        """Number of deleted or replaced rows still taking space in index `name`."""
+        with self._use(name) as entry, entry.lock.read():
+            return entry.row_keys.tombstones
+
+    def compact(self, name, min_ratio=0.0):
+        """
+        Rebuild index `name` without tombstoned rows if they make up at least
+        `min_ratio` of it. Searches and adds continue during the rebuild.
+
+        Returns:
+            int: Number of rows removed.
+        """
+        with self._use(name) as entry:
+            removed = entry.compact(min_ratio)
+        if removed:
+            logger.info(f"Compacted index '{name}': removed {removed} rows.")
+        return removed
+
+    def start_background_compaction(self, interval=FAISS_COMPACT_INTERVAL, min_ratio=FAISS_COMPACT_RATIO):
+        """
+        Compact loaded indexes every `interval` seconds once `min_ratio` of
+        their rows are tombstones, on a daemon thread.
+
+        Returns:
+            threading.Event: Set it to stop the compactor.
+        """
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                for name in self.resident():
+                    try:
+                        self.compact(name, min_ratio)
+                    except Exception as e:
+                        logger.error(f"Background compaction of index '{name}' failed: {e}")
+
+        threading.Thread(target=run, name="vector-store-compaction", daemon=True).start()
+        return stop
+
+    def search(self, name, embedding, top_k=5, filters=None):
+        """
+        Search index `name` for the top_k items most similar to `embedding`,
+        optionally only among rows matching `filters` (see search_rows).
+
+        Returns:
+            list: Metadata of the matches, nearest first.
+        """
+        return self.search_many(name, [embedding], top_k, filters)[0]
+
+    def search_many(self, name, embeddings, top_k=5, filters=None):
+        """Search index `name` with several query vectors at once; one result list per query."""
+        return [[hit["document"] for hit in hits] for hits in self.search_batch(name, embeddings, top_k, filters)]
+
+    def search_batch(self, name, embeddings, top_k=5, filters=None):
+        """
+        Search index `name` with several query vectors at once.
+
+        Returns:
+            list: One list of hits per query, nearest first, shaped like those
+                  of vector_db_faiss.search_similar_batch ("id", "document",
+                  "distance").
+        """
+        if len(embeddings) == 0:
+            return []
+        queries = np.ascontiguousarray(embeddings, dtype='float32').reshape(len(embeddings), -1)
+        with self._use(name) as entry:
+            if entry.pending and not self.read_only:
+                with entry.lock.write():
+                    # Searching means the corpus is complete enough; train on what we have
+                    entry.flush_pending()
+            with entry.lock.read():
+                return entry.search(queries, top_k, filters)
+
+    def save(self, name=None):
+        """Persist one loaded index, or every loaded index that changed."""
+        if self.read_only:
+            return
+        names = [name] if name else self.resident()
+        for index_name in names:
+            with self._use(index_name) as entry, entry.lock.write():
+                if entry.dirty or name:
+                    entry.save()
+                    logger.info(f"Saved index '{index_name}' ({entry.index.ntotal} vectors).")
+
+    def close(self):
+        """Train any pending vectors, save changed indexes and unload everything."""
+        if not self.read_only:
+            for name in self.resident():
+                with self._use(name) as entry, entry.lock.write():
+                    entry.flush_pending()
+        self.save()
+        with self._lock:
+            for entry in self._resident.values():
+                entry.close()
+            self._resident.clear()
@@ -0,0 +1,106 @@
+# utils/write_ahead_log.py
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+from logger import logger
+
+OP_ADD = 1
+OP_DELETE = 2
+
+# op, payload length, CRC32 of op and payload
+_HEADER = struct.Struct("<BII")
+# rows and dimension of the vectors at the start of a payload
+_SHAPE = struct.Struct("<II")
+
+
+class WriteAheadLog:
+    """
+    Append-only log of the changes made to a vector index since its last
+    snapshot: added vectors with their keys and metadata, and deleted keys.
+
+    Records are framed with a length and a CRC, so a record cut off by a
+    crash (or damaged) ends the log instead of being replayed. Appends are
+    buffered; sync() makes everything appended so far durable with one
+    flush and fsync, which is what makes frequent checkpoints cheap.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        end = self._valid_end()
+        if os.path.getsize(path) > end:
+            logger.warning(f"Dropping {os.path.getsize(path) - end} bytes of a torn record from {path}.")
+            os.truncate(path, end)
+        self._file = open(path, "ab")
+
+    def _valid_end(self):
+        end = 0
+        for _, _, end in self._scan():
+            pass
+        return end
+
+    def _scan(self):
+        """Yield (op, payload, end offset) for each complete record."""
+        with open(self.path, "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset + _HEADER.size <= len(data):
+            op, length, crc = _HEADER.unpack_from(data, offset)
+            start = offset + _HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(bytes([op]) + payload) != crc:
+                return
+            offset = start + length
+            yield op, payload, offset
+
+    def records(self):
+        """
+        Read the log back in order.
+
+        Returns:
+            list: (op, vectors, body) tuples; `body` holds "keys" and, for adds,
+                  "items" and possibly "fields".
+        """
+        self._file.flush()
+        records = []
+        for op, payload, _ in self._scan():
+            rows, dimension = _SHAPE.unpack_from(payload)
+            size = _SHAPE.size + rows * dimension * 4
+            vectors = np.frombuffer(payload[_SHAPE.size:size], dtype="<f4").reshape(rows, dimension)
+            records.append((op, vectors, json.loads(payload[size:].decode("utf-8"))))
+        return records
+
+    @property
+    def size(self):
+        """Bytes in the log, buffered appends included."""
+        return self._file.tell()
+
+    def _append(self, op, vectors, body):
+        vectors = np.array(vectors, dtype="<f4", ndmin=2)
+        payload = (_SHAPE.pack(*vectors.shape) + vectors.tobytes()
+                   + json.dumps(body, ensure_ascii=False).encode("utf-8"))
+        self._file.write(_HEADER.pack(op, len(payload), zlib.crc32(bytes([op]) + payload)) + payload)
+
+    def append_add(self, vectors, keys, items, fields=None):
+        """Log rows added with `vectors`, their keys (None for unkeyed rows), metadata and filter fields."""
+        body = {"keys": list(keys), "items": list(items)}
+        if fields is not None:
+            body["fields"] = list(fields)
+        self._append(OP_ADD, vectors, body)
+
+    def append_delete(self, keys):
+        """Log the deletion of `keys`."""
+        self._append(OP_DELETE, np.empty((0, 0), dtype="<f4"), {"keys": list(keys)})
+
+    def sync(self):
+        """Make every appended record durable."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
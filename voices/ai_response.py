@@ -2,9 +2,11 @@
 
 from openai import OpenAI
 from config import OPENAI_API_KEY, DEBUG
+from utils.embeddings import estimate_tokens
+from utils.rate_limiter import get_rate_limiter, call_with_rate_limit, CHAT_RESPONSE_TOKEN_ESTIMATE
 
-# Initialize OpenAI client with API key
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Initialize OpenAI client with API key; retries are handled by the shared rate limiter
+client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
 
 # Define constants
 GPT_MODEL = 'gpt-4o-mini'
@@ -30,13 +32,17 @@ def get_ai_response(user_input: str, prompt: str = BASE_PROMPT) -> str:
             print(f"Developer: {prompt}")
             print(f"User: {user_input}")
 
-        # Create the API request using the structured messages
-        response = client.chat.completions.create(
-            model=GPT_MODEL,
-            messages=[
-                {"role": "developer", "content": prompt},
-                {"role": "user", "content": user_input}
-            ]
+        # Create the API request using the structured messages, paced by the shared rate limiter
+        response = call_with_rate_limit(
+            get_rate_limiter("chat", GPT_MODEL),
+            lambda: client.chat.completions.create(
+                model=GPT_MODEL,
+                messages=[
+                    {"role": "developer", "content": prompt},
+                    {"role": "user", "content": user_input}
+                ]
+            ),
+            estimate_tokens(prompt + user_input) + CHAT_RESPONSE_TOKEN_ESTIMATE
         )
 
         # Extract the content from the response message
@@ -20,7 +20,7 @@ from modules.ado_integration import get_user_story_from_ado
 from modules.user_story_processor import process_user_story
 
 # === NEW: Import Chroma-based RAG engine instead of FAISS
-from modules.rag_engine_chroma import generate_test_cases_chroma  # RAG code
+from modules.rag_engine_chroma import generate_test_cases_chroma, warm_up  # RAG code
 
 # Test case formatting & exporting
 from modules.test_case_formatter import format_test_cases
@@ -40,6 +40,8 @@ def main():
       - Otherwise, pass request to a general AI conversation via get_ai_response.
       - Then respond with TTS.
     """
+    # Open the Chroma store in the background; a request that arrives first waits for it
+    warm_up()
     print("Voice Chat Mode: Press Enter to speak, or type 'exit' to quit.")
 
     while True:
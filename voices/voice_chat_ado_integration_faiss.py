@@ -20,7 +20,8 @@ from modules.test_case_formatter import format_test_cases
 from modules.test_case_exporter import parse_test_cases, save_test_cases_to_csv
 
 # Vector DB
-from utils.vector_db import initialize_faiss_index
+from utils.vector_db_faiss import initialize_faiss_index
+from config import EMBEDDING_DIMENSION
 
 load_dotenv()
 
@@ -34,8 +35,8 @@ def main():
     """
     print("Voice Chat Mode: Press Enter to speak, or type 'exit' to quit.")
 
-    # Initialize the FAISS index so we can perform retrieval
-    initialize_faiss_index(dimension=1536)
+    # Map the FAISS index read-only so we can perform retrieval
+    initialize_faiss_index(dimension=EMBEDDING_DIMENSION, read_only=True)
 
     while True:
         command = input("\nPress Enter to speak (or type 'exit' to quit): ")